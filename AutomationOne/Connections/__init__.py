@@ -1,3 +1,6 @@
+from .aggregate_connection import AggregateConnection
 from .conditional_connection import ConditionalConnection
 from .custom_connection import CustomConnection
+from .expression_connection import ExpressionConnection
+from .group_connection import GroupConnection
 from .simple_connection import SimpleConnection
\ No newline at end of file
@@ -0,0 +1,285 @@
+import logging
+import math
+import time
+
+from datetime import timedelta
+
+from ..Nodes.history import History
+from .connection import Connection
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logger = logging.getLogger("AutomationOne")
+
+
+def _percentile(ordered, q):
+    """Linear interpolation between the closest ranks of a sorted sequence"""
+    position = (len(ordered) - 1) * q / 100
+    low = math.floor(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+class Welford:
+    """Running count, sum, mean, variance (Welford's M2), min, max, first and last of a stream of samples"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.sum = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.first = self.last = None
+
+    def add(self, x):
+        self.count += 1
+        self.sum += x
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+        if self.first is None:
+            self.first = x
+        self.last = x
+
+    @property
+    def variance(self):
+        return self.m2 / self.count
+
+    def results(self, reducers):
+        """Returns the results of the reducers in order. Percentiles are not supported."""
+        stats = {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.mean,
+            "min": self.min,
+            "max": self.max,
+            "first": self.first,
+            "last": self.last,
+        }
+        results = []
+        for reducer in reducers:
+            if reducer == "variance":
+                results.append(self.variance)
+            elif reducer == "stddev":
+                results.append(math.sqrt(self.variance))
+            else:
+                results.append(stats[reducer])
+        return results
+
+
+runningReducers = (
+    "count",
+    "sum",
+    "mean",
+    "min",
+    "max",
+    "variance",
+    "stddev",
+    "first",
+    "last",
+)
+
+
+def aggregate(values, reducers):
+    """Computes the reducers over the values (a memoryview of doubles) and returns the results in order"""
+    n = len(values)
+    if numpy is not None:
+        array = numpy.frombuffer(values, dtype=numpy.float64)
+        stats = {
+            "count": lambda: n,
+            "sum": lambda: float(array.sum()),
+            "mean": lambda: float(array.mean()),
+            "min": lambda: float(array.min()),
+            "max": lambda: float(array.max()),
+            "variance": lambda: float(array.var()),
+            "stddev": lambda: float(array.std()),
+        }
+        percentile = lambda q: float(numpy.percentile(array, q))
+    else:
+        cache = {}
+
+        def running():
+            # one pass of Welford's algorithm for the mean and M2, inlined for speed
+            if "running" not in cache:
+                count = 0
+                mean = m2 = 0.0
+                for x in values:
+                    count += 1
+                    delta = x - mean
+                    mean += delta / count
+                    m2 += delta * (x - mean)
+                cache["running"] = mean, m2 / count
+            return cache["running"]
+
+        stats = {
+            "count": lambda: n,
+            "sum": lambda: math.fsum(values),
+            "mean": lambda: running()[0],
+            "min": lambda: min(values),
+            "max": lambda: max(values),
+            "variance": lambda: running()[1],
+            "stddev": lambda: math.sqrt(running()[1]),
+        }
+
+        def percentile(q):
+            if "sorted" not in cache:
+                cache["sorted"] = sorted(values)
+            return _percentile(cache["sorted"], q)
+
+    stats["first"] = lambda: values[0]
+    stats["last"] = lambda: values[-1]
+    stats["median"] = lambda: percentile(50)
+    results = []
+    for reducer in reducers:
+        if reducer in stats:
+            results.append(stats[reducer]())
+        else:
+            results.append(percentile(float(reducer[1:])))
+    return results
+
+
+def validReducer(reducer):
+    if reducer in (
+        "count",
+        "sum",
+        "mean",
+        "min",
+        "max",
+        "variance",
+        "stddev",
+        "first",
+        "last",
+        "median",
+    ):
+        return True
+    try:
+        return reducer[0] == "p" and 0 <= float(reducer[1:]) <= 100
+    except ValueError:
+        return False
+
+
+class AggregateConnection(Connection):
+    """Computes statistics over a window of the values of the inNode(s).
+
+    Every execution adds the current value of each inNode as a sample.
+    window_type count aggregates the last window samples every slide
+    samples, window_type time the samples of the last window seconds every
+    slide seconds. With slide equal to window (the default) the windows are
+    tumbling, with a smaller slide they are sliding. The results of the
+    reducers are set as a dictionary on the outNode or, with split, in the
+    order of the reducers on the outNodes. Tumbling windows without
+    percentile reducers are reduced incrementally with Welford's algorithm
+    as the samples arrive.
+    """
+
+    def __init__(self, handler, config):
+        super().__init__(handler, config)
+        self.window_type = config.get("window_type", "count")
+        if self.window_type not in ("count", "time"):
+            raise ValueError(f"[{self.name}] Unknown window_type '{self.window_type}'")
+        self.window = config.get("window", 60)
+        self.slide = config.get("slide", self.window)
+        self.reducers = config.get("reducers", ["min", "max", "mean"])
+        if not isinstance(self.reducers, list):
+            self.reducers = [self.reducers]
+        for reducer in self.reducers:
+            if not validReducer(reducer):
+                raise ValueError(f"[{self.name}] Unknown reducer '{reducer}'")
+        self.split = config.get("split", False)
+        self.skip_empty = config.get("skip_empty", True)
+
+        if self.window_type == "count":
+            capacity = self.window
+        else:
+            capacity = config.get("max_samples", 10000)
+        self.samples = History(capacity, name=self.name)
+        self._pending = 0
+        self._lastEmit = time.monotonic()
+        self._running = None
+        if self.slide >= self.window and all(
+            reducer in runningReducers for reducer in self.reducers
+        ):
+            self._running = Welford()
+
+    def get_timeloop_callbacks(self):
+        callbacks = super().get_timeloop_callbacks()
+        if self.window_type == "time":
+            callbacks.append((self.emit, timedelta(seconds=float(self.slide))))
+        return callbacks
+
+    def _execute(self):
+        super()._execute()
+        if isinstance(self.inNode, list):
+            for node in self.inNode:
+                self._add(node.getValue())
+        else:
+            self._add(self.inNode.getValue())
+        if self.window_type == "count":
+            if self._pending >= self.slide and len(self.samples) >= self.window:
+                self._pending = 0
+                self.emit()
+
+    def _add(self, value):
+        if self.samples.append(value):
+            self._pending += 1
+            if self._running is not None:
+                self._running.add(float(value))
+
+    def emit(self):
+        """Aggregates the current window and sets the results on the outNode(s)"""
+        if self._running is not None:
+            self._emitRunning()
+            return
+        if self.window_type == "count":
+            values = self.samples.last(self.window)
+        else:
+            now = time.monotonic()
+            seconds = self.window
+            if self.slide >= self.window:
+                # tumbling: exactly the samples since the last window
+                seconds = now - self._lastEmit
+            self._lastEmit = now
+            values = self.samples.window(seconds)[1]
+        if not len(values) and self.skip_empty:
+            return
+        if len(values):
+            results = aggregate(values, self.reducers)
+        else:
+            results = [0 if r == "count" else None for r in self.reducers]
+        self._set(results)
+
+    def _emitRunning(self):
+        """Sets the incrementally reduced results of the tumbling window and starts the next one"""
+        self._lastEmit = time.monotonic()
+        if not self._running.count:
+            if self.skip_empty:
+                return
+            results = [0 if r == "count" else None for r in self.reducers]
+        else:
+            results = self._running.results(self.reducers)
+        self._running.reset()
+        self._set(results)
+
+    def _set(self, results):
+        try:
+            with self.handler.changeWave():
+                if self.split:
+                    for node, x in zip(self.outNode, results):
+                        node.setValue(x)
+                else:
+                    self.outNode.setValue(dict(zip(self.reducers, results)))
+        except Exception:
+            logger.exception(
+                "Error during execution of Connection {}.".format(self.name)
+            )
@@ -14,9 +14,9 @@ class ConditionalConnection(SimpleConnection):
     def evalCondition(self):
         return self.conditionNode.getValue()
 
-    def execute(self):
+    def _execute(self):
         if self.evalCondition():
-            super().execute()
+            super()._execute()
         else:
             logger.debug(
                 "The conditional connection {} is not executed.".format(self.name)
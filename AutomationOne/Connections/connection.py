@@ -1,5 +1,6 @@
+import functools
 import logging
-import time
+import threading
 
 from datetime import timedelta
 
@@ -14,6 +15,15 @@ class Connection:
         self.frequency = config.get("frequency", False)
         self.on_change = config.get("execute_on_change", not self.frequency)
         self.delay = config.get("delay", 0)
+        self.delay_mode = config.get("delay_mode", "fixed")
+        if self.delay_mode not in ("fixed", "debounce", "throttle"):
+            logger.warning(
+                f"[{self.name}] Unknown delay_mode '{self.delay_mode}'. Using fixed."
+            )
+            self.delay_mode = "fixed"
+        self._timer = None
+        self._timer_generation = 0
+        self._timer_lock = threading.Lock()
         self.demand = config.get("demandUpdate", False)
 
         self.doOnStartup = config.get("doOnStartup", False)
@@ -46,12 +56,50 @@ class Connection:
             callbacks.append((self.execute, timedelta(seconds=float(self.frequency))))
         return callbacks
 
-    def execute(self):
-        if self.delay:
+    def execute(self, immediate=False):
+        """Executes the connection, after the configured delay unless immediate is set.
+
+        The delay never blocks the caller. delay_mode fixed executes every
+        trigger after delay seconds, debounce executes once after the triggers
+        paused for delay seconds and throttle at most once per delay seconds.
+        """
+        if self.delay and not immediate:
+            self._delayExecution()
+            return
+        self._execute()
+
+    def _delayExecution(self):
+        if self.delay_mode == "fixed":
             logger.debug(
                 f"Delaying execution of connection {self.name} by {self.delay} seconds"
             )
-            time.sleep(self.delay)
+            self.handler.callLater(self.delay, self._execute, owner=self.name)
+            return
+        with self._timer_lock:
+            if self._timer is not None:
+                if self.delay_mode == "throttle":
+                    return
+                self._timer.cancel()
+            logger.debug(
+                f"Delaying execution of connection {self.name} by {self.delay} seconds ({self.delay_mode})"
+            )
+            # the generation identifies the job, whose handle is stored in _timer
+            self._timer_generation += 1
+            self._timer = self.handler.callLater(
+                self.delay,
+                functools.partial(self._executeDelayed, self._timer_generation),
+                owner=self.name,
+            )
+
+    def _executeDelayed(self, generation):
+        with self._timer_lock:
+            if generation != self._timer_generation:
+                # superseded by a newer job, the cancel came too late
+                return
+            self._timer = None
+        self._execute()
+
+    def _execute(self):
         if self.demand:
             self.demandUpdate([])
         logger.debug("Executing connection {}".format(self.name))
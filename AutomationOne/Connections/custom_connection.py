@@ -24,8 +24,8 @@ class CustomConnection(Connection):
             self.args = [self.args]
         self.kwargs = config.get("kwargs", {})
 
-    def execute(self):
-        super().execute()
+    def _execute(self):
+        super()._execute()
         try:
             if isinstance(self.inNode, list):
                 value = [node.getValue() for node in self.inNode]
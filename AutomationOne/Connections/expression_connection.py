@@ -0,0 +1,168 @@
+import ast
+import logging
+import math
+
+from .connection import Connection
+
+logger = logging.getLogger("AutomationOne")
+
+# functions and constants, which may be used in expressions
+functions = {
+    "abs": abs,
+    "min": min,
+    "max": max,
+    "round": round,
+    "int": int,
+    "float": float,
+    "bool": bool,
+    "sqrt": math.sqrt,
+    "exp": math.exp,
+    "log": math.log,
+    "log10": math.log10,
+    "sin": math.sin,
+    "cos": math.cos,
+    "tan": math.tan,
+    "asin": math.asin,
+    "acos": math.acos,
+    "atan": math.atan,
+    "atan2": math.atan2,
+    "floor": math.floor,
+    "ceil": math.ceil,
+    "radians": math.radians,
+    "degrees": math.degrees,
+    "pi": math.pi,
+    "e": math.e,
+}
+
+allowedNodes = (
+    ast.Expression,
+    ast.BinOp,
+    ast.UnaryOp,
+    ast.BoolOp,
+    ast.Compare,
+    ast.IfExp,
+    ast.Call,
+    ast.Name,
+    ast.Load,
+    ast.Constant,
+    ast.Tuple,
+    ast.operator,
+    ast.unaryop,
+    ast.boolop,
+    ast.cmpop,
+)
+forbiddenNodes = (ast.MatMult, ast.Is, ast.IsNot, ast.In, ast.NotIn)
+
+
+def validateExpression(expression, variables):
+    """Parses the expression and checks, that it only contains arithmetic, bitwise,
+    boolean and conditional operations on numbers, the variables and the functions.
+    Returns the parsed expression and the names of the used functions. Raises ValueError.
+    """
+    try:
+        tree = ast.parse(expression, mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"Invalid expression '{expression}': {e}") from None
+    used = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, allowedNodes) or isinstance(node, forbiddenNodes):
+            raise ValueError(
+                f"'{type(node).__name__}' is not allowed in expression '{expression}'"
+            )
+        if isinstance(node, ast.Constant) and not isinstance(
+            node.value, (int, float, bool, type(None))
+        ):
+            raise ValueError(
+                f"Constant {node.value!r} is not allowed in expression '{expression}'"
+            )
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in functions:
+                raise ValueError(f"Unknown function in expression '{expression}'")
+            if node.keywords:
+                raise ValueError(
+                    f"Keyword arguments are not allowed in expression '{expression}'"
+                )
+        if isinstance(node, ast.Name) and node.id not in variables:
+            if node.id not in functions:
+                raise ValueError(
+                    f"Unknown name '{node.id}' in expression '{expression}'"
+                )
+            used.add(node.id)
+    return tree.body, sorted(used)
+
+
+def compileExpression(expression, variables, getters=None):
+    """Compiles the expression into a function of the variables (positional
+    arguments in the given order). With getters, a function without arguments
+    is returned, which reads the variables by calling the getters. The used
+    functions are bound as default arguments, so all names are fast locals."""
+    for name in variables:
+        if not name.isidentifier() or name.startswith("_") or name in functions:
+            raise ValueError(
+                f"'{name}' can not be used as a variable name. Name the inputs with variables."
+            )
+    body, used = validateExpression(expression, variables)
+    namespace = {f"_{name}": functions[name] for name in used}
+    defaults = [f"{name}=_{name}" for name in used]
+    if getters is None:
+        parameters = list(variables) + defaults
+        reads = ""
+    else:
+        for i, getter in enumerate(getters):
+            namespace[f"_get{i}"] = getter
+        parameters = [f"_get{i}=_get{i}" for i in range(len(getters))] + defaults
+        reads = "".join(f"    {name} = _get{i}()\n" for i, name in enumerate(variables))
+    source = "def _expression({}):\n{}    return _result\n".format(
+        ", ".join(parameters), reads
+    )
+    # the validated expression tree replaces the placeholder, it is never pasted as text
+    module = ast.parse(source)
+    module.body[0].body[-1].value = body
+    ast.fix_missing_locations(module)
+    namespace["__builtins__"] = {}
+    exec(compile(module, f"<expression {expression}>", "exec"), namespace)
+    return namespace["_expression"]
+
+
+class ExpressionConnection(Connection):
+    """Sets the result of an arithmetic expression over the values of the inNodes.
+
+    The inNodes are named by variables (default: the node names), e.g.
+    inNode: [a, b] with expression: a * 0.1 + b. The expression is validated
+    and compiled once, when the connection is created. With split, the
+    expression returns a tuple, which is split over the outNodes.
+    """
+
+    def __init__(self, handler, config):
+        super().__init__(handler, config)
+        self.expression = str(config.get("expression"))
+        inNodes = self.inNode if isinstance(self.inNode, list) else [self.inNode]
+        self.variables = config.get("variables", [node.name for node in inNodes])
+        if not isinstance(self.variables, list):
+            self.variables = [self.variables]
+        if len(self.variables) != len(inNodes):
+            raise ValueError(
+                f"[{self.name}] Expected {len(inNodes)} variables, got {len(self.variables)}"
+            )
+        self.split = config.get("split", False)
+        self.skip_on_none = config.get("skip_on_none", True)
+        # the getters of the inNodes are bound once, so an execution allocates nothing
+        self._evaluate = compileExpression(
+            self.expression, self.variables, [node.getValue for node in inNodes]
+        )
+
+    def _execute(self):
+        super()._execute()
+        try:
+            result = self._evaluate()
+            if self.skip_on_none and result is None:
+                return
+            if self.split:
+                for node, x in zip(self.outNode, result):
+                    node.setValue(x)
+            else:
+                self.outNode.setValue(result)
+        except Exception:
+            logger.exception(
+                "Error during execution of Connection {}.".format({self.name})
+            )
@@ -0,0 +1,101 @@
+import logging
+import math
+
+from .. import vector
+from ..Nodes.group_node import ChannelGroupNode
+from .connection import Connection
+
+logger = logging.getLogger("AutomationOne")
+
+# unit: conversions as (factor, offset)
+unitConversions = {
+    "degC_to_degF": (1.8, 32.0),
+    "degF_to_degC": (5 / 9, -160 / 9),
+    "degC_to_K": (1.0, 273.15),
+    "K_to_degC": (1.0, -273.15),
+    "bar_to_kPa": (100.0, 0.0),
+    "kPa_to_bar": (0.01, 0.0),
+    "bar_to_psi": (14.503773773, 0.0),
+    "psi_to_bar": (0.0689475729, 0.0),
+    "W_to_kW": (0.001, 0.0),
+    "kW_to_W": (1000.0, 0.0),
+    "Wh_to_kWh": (0.001, 0.0),
+    "kWh_to_Wh": (1000.0, 0.0),
+    "kWh_to_MWh": (0.001, 0.0),
+    "mA_to_A": (0.001, 0.0),
+    "mV_to_V": (0.001, 0.0),
+    "m3h_to_ls": (1 / 3.6, 0.0),
+    "ls_to_m3h": (3.6, 0.0),
+}
+
+
+class GroupConnection(Connection):
+    """Transforms all channels of a channel group (or a list of nodes) at once.
+
+    Every channel is scaled by its factor and offset, converted by unit and
+    clipped to clip: [low, high]. Each of these settings is a scalar for all
+    channels, a list with a value per channel or a dict {channel: value}.
+    The result is set on a channel group outNode or on a list of outNodes
+    with one node per channel, of which only those with a changed result are
+    updated.
+    """
+
+    def __init__(self, handler, config):
+        super().__init__(handler, config)
+        if isinstance(self.inNode, ChannelGroupNode):
+            self.channels = self.inNode.channels
+        elif isinstance(self.inNode, list):
+            self.channels = [node.name for node in self.inNode]
+        else:
+            raise ValueError(
+                f"[{self.name}] The inNode of a group connection must be a channel group or a list."
+            )
+        n = len(self.channels)
+        if isinstance(self.outNode, list) and len(self.outNode) != n:
+            raise ValueError(f"[{self.name}] Expected {n} outNodes.")
+
+        factor = vector.broadcast(config.get("factor", 1), n, self.channels, 1.0)
+        offset = vector.broadcast(config.get("offset", 0), n, self.channels, 0.0)
+        unit = config.get("unit")
+        if unit:
+            if not isinstance(unit, dict):
+                unit = {channel: unit for channel in self.channels}
+            for channel, conversion in unit.items():
+                i = self.channels.index(channel)
+                unitFactor, unitOffset = unitConversions[conversion]
+                factor[i] = factor[i] * unitFactor
+                offset[i] = offset[i] * unitFactor + unitOffset
+        self.factor = factor
+        self.offset = offset
+
+        self.clip = config.get("clip")
+        if self.clip:
+            low, high = self.clip
+            self.low = vector.broadcast(low, n, self.channels, -math.inf)
+            self.high = vector.broadcast(high, n, self.channels, math.inf)
+
+        self._lastResult = vector.full(n, math.nan)
+        self._zeros = vector.full(n, 0.0)
+
+    def _execute(self):
+        super()._execute()
+        try:
+            if isinstance(self.inNode, ChannelGroupNode):
+                values = self.inNode.getValue()
+            else:
+                values = vector.asVector([node.getValue() for node in self.inNode])
+            result = vector.affine(values, self.factor, self.offset)
+            if self.clip:
+                result = vector.clip(result, self.low, self.high)
+            with self.handler.changeWave():
+                if isinstance(self.outNode, list):
+                    mask = vector.changedMask(result, self._lastResult, self._zeros)
+                    vector.update(self._lastResult, result, mask)
+                    for i in vector.indices(mask):
+                        self.outNode[i].setValue(float(result[i]))
+                else:
+                    self.outNode.setValue(result)
+        except Exception:
+            logger.exception(
+                "Error during execution of Connection {}.".format({self.name})
+            )
@@ -18,8 +18,8 @@ class SimpleConnection(Connection):
         except:
             return value
 
-    def execute(self):
-        super().execute()
+    def _execute(self):
+        super()._execute()
         try:
             if isinstance(self.inNode, list):
                 if self.dictionary:
@@ -0,0 +1,260 @@
+"""Bus arbiter, which owns a physical bus and executes all requests to it in a single worker thread"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+from concurrent.futures import Future
+
+logger = logging.getLogger("AutomationOne")
+
+
+defaultLanePriorities = {"write": 0, "demand": 1, "poll": 2}
+defaultLaneMaxWait = {"poll": 10}
+
+
+class BusRequest:
+    def __init__(self, func, args, unit, lane):
+        self.func = func
+        self.args = args
+        self.unit = unit
+        self.lane = lane
+        self.future = Future()
+        self.enqueued = time.monotonic()
+
+
+class LaneMetrics:
+    """Queue wait times of the requests of one lane"""
+
+    def __init__(self):
+        self.count = 0
+        self.totalWait = 0
+        self.maxWait = 0
+        self.promoted = 0
+
+    def add(self, wait):
+        self.count += 1
+        self.totalWait += wait
+        if wait > self.maxWait:
+            self.maxWait = wait
+
+    def asDict(self, queued=0):
+        return {
+            "count": self.count,
+            "meanWait": self.totalWait / self.count if self.count else 0,
+            "maxWait": self.maxWait,
+            "promoted": self.promoted,
+            "queued": queued,
+        }
+
+
+class BusArbiter:
+    """Serialises the requests to one bus and enforces the configured delays.
+
+    Requests are queued in lanes (write, demand and poll per default). Lanes
+    with a lower priority value go first, requests within a lane are FIFO. A
+    request, which has waited longer than the max wait of its lane, is
+    promoted ahead of all lanes, so that no lane starves. The requests are
+    executed by the worker thread, which owns the bus, and the results are
+    returned through concurrent.futures.Future objects.
+
+    force_delay is the minimum time between the starts of two requests on the
+    bus and force_delay_per_unit the minimum time between the starts of two
+    requests to a unit. With delay_after_completion, the delays are counted
+    from the end of a request instead, i.e. they are idle times. Requests to
+    a unit, which is still locked, are skipped in favour of requests to other
+    units. All waits are timed waits on the monotonic
+    clock, so there is no polling.
+    """
+
+    _buses = {}
+    _buses_lock = threading.Lock()
+
+    @classmethod
+    def forBus(
+        cls,
+        key,
+        name=None,
+        force_delay=None,
+        force_delay_per_unit=None,
+        priorities=None,
+        maxWait=None,
+        delay_after_completion=False,
+    ):
+        """Returns the arbiter of the bus identified by key, creating it if necessary"""
+        with cls._buses_lock:
+            arbiter = cls._buses.get(key)
+            if arbiter is None:
+                arbiter = cls._buses[key] = cls(
+                    key,
+                    name,
+                    force_delay,
+                    force_delay_per_unit,
+                    priorities,
+                    maxWait,
+                    delay_after_completion,
+                )
+            else:
+                logger.info(f"Sharing the bus {key} with another interface.")
+                arbiter.force_delay = max(arbiter.force_delay, force_delay or 0)
+                arbiter.force_delay_per_unit = max(
+                    arbiter.force_delay_per_unit, force_delay_per_unit or 0
+                )
+                arbiter.delay_after_completion |= bool(delay_after_completion)
+            arbiter._users += 1
+            return arbiter
+
+    def __init__(
+        self,
+        key,
+        name=None,
+        force_delay=None,
+        force_delay_per_unit=None,
+        priorities=None,
+        maxWait=None,
+        delay_after_completion=False,
+    ):
+        self.key = key
+        self.name = name if name else str(key)
+        self.force_delay = force_delay or 0
+        self.force_delay_per_unit = force_delay_per_unit or 0
+        self.delay_after_completion = bool(delay_after_completion)
+
+        self.priorities = dict(defaultLanePriorities)
+        self.priorities.update(priorities or {})
+        self.maxWait = dict(defaultLaneMaxWait)
+        self.maxWait.update(maxWait or {})
+        self.laneMetrics = {lane: LaneMetrics() for lane in self.priorities}
+
+        self._queue = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._bus_free_at = 0
+        self._unit_free_at = {}
+        self._stopped = False
+        self._users = 0
+
+        self._thread = threading.Thread(
+            target=self._run, name=f"bus-{self.name}", daemon=True
+        )
+        self._thread.start()
+
+    def release(self):
+        """Releases the arbiter for one user. The worker stops after the last user released it."""
+        with self._buses_lock:
+            self._users -= 1
+            if self._users > 0:
+                return
+            if self._buses.get(self.key) is self:
+                del self._buses[self.key]
+        self.stop()
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            pending, self._queue = self._queue, []
+            self._condition.notify_all()
+        for _, _, request in pending:
+            request.future.cancel()
+
+    def submit(self, func, args=(), unit=None, lane="poll"):
+        """Queues func(*args) in the given lane for execution on the bus and returns a Future"""
+        request = BusRequest(func, args, unit, lane)
+        priority = self.priorities.get(lane)
+        if priority is None:
+            logger.warning(f"[{self.name}] Unknown lane '{lane}'. Using lane poll.")
+            request.lane = "poll"
+            priority = self.priorities["poll"]
+        with self._condition:
+            if self._stopped:
+                raise RuntimeError(f"Bus {self.name} is stopped")
+            heapq.heappush(self._queue, (priority, next(self._counter), request))
+            self._condition.notify()
+        return request.future
+
+    def call(self, func, args=(), unit=None, lane="poll"):
+        """Executes func(*args) on the bus and returns its result"""
+        if threading.current_thread() is self._thread:
+            return func(*args)
+        return self.submit(func, args, unit, lane).result()
+
+    def metrics(self):
+        """Returns the queue wait time statistics per lane"""
+        with self._condition:
+            queued = {}
+            for _, _, request in self._queue:
+                queued[request.lane] = queued.get(request.lane, 0) + 1
+            return {
+                lane: metrics.asDict(queued.get(lane, 0))
+                for lane, metrics in self.laneMetrics.items()
+            }
+
+    def _starved(self, now):
+        """Returns the queue entries, which exceeded the max wait of their lane, oldest first"""
+        if not self.maxWait:
+            return []
+        starved = [
+            entry
+            for entry in self._queue
+            if entry[2].lane in self.maxWait
+            and now - entry[2].enqueued >= self.maxWait[entry[2].lane]
+        ]
+        starved.sort(key=lambda entry: entry[1])
+        return starved
+
+    def _next(self, now):
+        """Returns the next executable request or the time to wait for one"""
+        if now < self._bus_free_at:
+            return None, self._bus_free_at - now
+        if not self._queue:
+            return None, None
+        starved = self._starved(now)
+        request = self._queue[0][2]
+        if not starved and now >= self._unit_free_at.get(request.unit, 0):
+            heapq.heappop(self._queue)
+            return request, None
+        wait = None
+        for entry in starved + sorted(self._queue):
+            request = entry[2]
+            free_at = self._unit_free_at.get(request.unit, 0)
+            if now >= free_at:
+                if entry is not self._queue[0] and entry in starved:
+                    self.laneMetrics[request.lane].promoted += 1
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                return request, None
+            if wait is None or free_at - now < wait:
+                wait = free_at - now
+        return None, wait
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    if self._stopped:
+                        return
+                    request, wait = self._next(time.monotonic())
+                    if request is not None:
+                        break
+                    self._condition.wait(wait)
+
+            if not request.future.set_running_or_notify_cancel():
+                continue
+            start = time.monotonic()
+            self.laneMetrics[request.lane].add(start - request.enqueued)
+            try:
+                request.future.set_result(request.func(*request.args))
+            except BaseException as e:
+                request.future.set_exception(e)
+            finally:
+                if self.delay_after_completion:
+                    start = time.monotonic()
+                with self._condition:
+                    if self.force_delay:
+                        self._bus_free_at = start + self.force_delay
+                    if self.force_delay_per_unit:
+                        self._unit_free_at[request.unit] = (
+                            start + self.force_delay_per_unit
+                        )
@@ -0,0 +1,403 @@
+"""Native decoder for M-Bus variable data responses (EN 13757-3).
+
+decodeFrame() turns the user data of a response frame directly into the
+structure, which xmltodict produces from the XML of libmbus, so the field
+paths of the MBusNodes (e.g. DataRecord/1/Value) work unchanged. Frames,
+which are not supported here, raise MBusDecodeError and are decoded by
+libmbus instead. Without libmbus (strict=False), unsupported records are
+kept with their raw data, so the other records are still available.
+Frames with manufacturer specific data are left to libmbus as well.
+"""
+
+import logging
+import struct
+import time
+
+logger = logging.getLogger("AutomationOne")
+
+
+class MBusDecodeError(ValueError):
+    pass
+
+
+media = {
+    0x00: "Other",
+    0x01: "Oil",
+    0x02: "Electricity",
+    0x03: "Gas",
+    0x04: "Heat: Outlet",
+    0x05: "Steam",
+    0x06: "Warm water (30-90°C)",
+    0x07: "Water",
+    0x08: "Heat Cost Allocator",
+    0x09: "Compressed Air",
+    0x0A: "Cooling load meter: Outlet",
+    0x0B: "Cooling load meter: Inlet",
+    0x0C: "Heat: Inlet",
+    0x0D: "Heat / Cooling load meter",
+    0x0E: "Bus/System",
+    0x0F: "Unknown Medium",
+    0x16: "Cold water",
+    0x17: "Dual water",
+    0x18: "Pressure",
+    0x19: "A/D Converter",
+}
+
+functions = {
+    0: "Instantaneous value",
+    1: "Maximum value",
+    2: "Minimum value",
+    3: "Value during error state",
+}
+
+durations = ("seconds", "minutes", "hours", "days")
+
+
+def _prefix(exponent):
+    return {
+        0: "",
+        -3: "m",
+        -6: "my",
+        1: "10 ",
+        2: "100 ",
+        3: "k",
+        4: "10 k",
+        5: "100 k",
+        6: "M",
+        9: "G",
+    }.get(exponent, f"1e{exponent} ")
+
+
+def _unit(vif):
+    """Description of a primary VIF (without extension bit)"""
+    n = vif & 0x07
+    if vif < 0x08:
+        return f"Energy ({_prefix(n - 3)}Wh)"
+    if vif < 0x10:
+        return f"Energy ({_prefix(n)}J)"
+    if vif < 0x18:
+        return f"Volume ({_prefix(n - 6)} m^3)"
+    if vif < 0x20:
+        return f"Mass ({_prefix(n - 3)}kg)"
+    if vif < 0x24:
+        return f"On time ({durations[vif & 0x03]})"
+    if vif < 0x28:
+        return f"Operating time ({durations[vif & 0x03]})"
+    if vif < 0x30:
+        return f"Power ({_prefix(n - 3)}W)"
+    if vif < 0x38:
+        return f"Power ({_prefix(n)}J/h)"
+    if vif < 0x40:
+        return f"Volume flow ({_prefix(n - 6)} m^3/h)"
+    if vif < 0x48:
+        return f"Volume flow ({_prefix(n - 7)} m^3/min)"
+    if vif < 0x50:
+        return f"Volume flow ({_prefix(n - 9)} m^3/s)"
+    if vif < 0x58:
+        return f"Mass flow ({_prefix(n - 3)} kg/h)"
+    n = vif & 0x03
+    if vif < 0x5C:
+        return f"Flow temperature ({_prefix(n - 3)}deg C)"
+    if vif < 0x60:
+        return f"Return temperature ({_prefix(n - 3)}deg C)"
+    if vif < 0x64:
+        return f"Temperature Difference ({_prefix(n - 3)} deg C)"
+    if vif < 0x68:
+        return f"External temperature ({_prefix(n - 3)} deg C)"
+    if vif < 0x6C:
+        return f"Pressure ({_prefix(n - 3)} bar)"
+    if vif == 0x6C:
+        return "Time Point (date)"
+    if vif == 0x6D:
+        return "Time Point (time & date)"
+    if vif == 0x6E:
+        return "Units for H.C.A."
+    if vif < 0x74:
+        if vif < 0x70:
+            return "Reserved"
+        return f"Averaging Duration ({durations[vif & 0x03]})"
+    if vif < 0x78:
+        return f"Actuality Duration ({durations[vif & 0x03]})"
+    if vif == 0x78:
+        return "Fabrication No"
+    if vif == 0x79:
+        return "(Enhanced) Identification"
+    if vif == 0x7A:
+        return "Bus Address"
+    return f"Unknown (VIF=0x{vif:02X})"
+
+
+# Extension table of the VIF 0xFD. Codes, which are missing here, are left to libmbus.
+extensions = {
+    0x08: "Access Number (transmission count)",
+    0x09: "Medium (as in fixed header)",
+    0x0A: "Manufacturer (as in fixed header)",
+    0x0B: "Parameter set identification",
+    0x0C: "Model / Version",
+    0x0D: "Hardware version",
+    0x0E: "Firmware version",
+    0x0F: "Software version",
+    0x10: "Customer location",
+    0x11: "Customer",
+    0x12: "Access Code User",
+    0x13: "Access Code Operator",
+    0x14: "Access Code System Operator",
+    0x15: "Access Code Developer",
+    0x16: "Password",
+    0x17: "Error flags",
+    0x18: "Error mask",
+    0x1A: "Digital output (binary)",
+    0x1B: "Digital input (binary)",
+    0x1C: "Baudrate",
+    0x1D: "Response delay time",
+    0x1E: "Retry",
+}
+
+
+def _extensionUnit(vife):
+    code = vife & 0x7F
+    if 0x40 <= code < 0x50:
+        return f"Voltage ({_prefix((code & 0x0F) - 9)}V)"
+    if 0x50 <= code < 0x60:
+        return f"Current ({_prefix((code & 0x0F) - 12)}A)"
+    return extensions.get(code)
+
+
+# descriptions of all primary VIFs, computed once
+units = [" ".join(_unit(vif).split()) for vif in range(0x80)]
+
+
+def _bcd(data):
+    sign = 1
+    if data and data[-1] >> 4 == 0x0F:
+        # negative value, the sign is coded in the highest nibble
+        sign = -1
+        data = data[:-1] + bytes((data[-1] & 0x0F,))
+    value = 0
+    for byte in reversed(data):
+        high, low = byte >> 4, byte & 0x0F
+        if high > 9 or low > 9:
+            raise MBusDecodeError(f"Invalid BCD data {data.hex()}")
+        value = value * 100 + high * 10 + low
+    return sign * value
+
+
+def _date(data):
+    day = data[0] & 0x1F
+    month = data[1] & 0x0F
+    year = ((data[1] & 0xF0) >> 1) | ((data[0] & 0xE0) >> 5)
+    return day, month, 2000 + year if year < 81 else 1900 + year
+
+
+def _value(coding, data, vif):
+    if vif == 0x6C and coding == 2:  # type G date
+        day, month, year = _date(data)
+        return f"{year:04d}-{month:02d}-{day:02d}"
+    if vif == 0x6D and coding == 4:  # type F date and time
+        day, month, year = _date(data[2:4])
+        return f"{year:04d}-{month:02d}-{day:02d}T{data[1] & 0x1F:02d}:{data[0] & 0x3F:02d}:00"
+    if coding in (1, 2, 3, 4, 6, 7):
+        return str(int.from_bytes(data, "little", signed=True))
+    if coding == 5:
+        return "%f" % struct.unpack("<f", data)[0]
+    if coding in (9, 0x0A, 0x0B, 0x0C, 0x0E):
+        return str(_bcd(data))
+    if coding == 0x0D:
+        return data[::-1].decode("latin-1")
+    return ""
+
+
+_dataLength = {
+    0: 0,
+    1: 1,
+    2: 2,
+    3: 3,
+    4: 4,
+    5: 4,
+    6: 6,
+    7: 8,
+    8: 0,
+    9: 1,
+    0x0A: 2,
+    0x0B: 3,
+    0x0C: 4,
+    0x0E: 6,
+}
+
+
+def _manufacturer(code):
+    return "".join(chr(((code >> shift) & 0x1F) + 64) for shift in (10, 5, 0))
+
+
+def _header(ci, data):
+    if ci == 0x72:
+        if len(data) < 12:
+            raise MBusDecodeError("Truncated long header")
+        manufacturer, version, medium, access, status = struct.unpack_from(
+            "<HBBBB", data, 4
+        )
+        info = {
+            "Id": str(_bcd(data[0:4])),
+            "Manufacturer": _manufacturer(manufacturer),
+            "Version": str(version),
+            "ProductName": None,
+            "Medium": media.get(medium, f"Unknown medium (0x{medium:02x})"),
+            "AccessNumber": str(access),
+            "Status": f"{status:02X}",
+            "Signature": f"{data[11]:02X}{data[10]:02X}",
+        }
+        return info, 12
+    if ci == 0x7A:
+        if len(data) < 4:
+            raise MBusDecodeError("Truncated short header")
+        info = {
+            "AccessNumber": str(data[0]),
+            "Status": f"{data[1]:02X}",
+            "Signature": f"{data[3]:02X}{data[2]:02X}",
+        }
+        return info, 4
+    raise MBusDecodeError(f"Unsupported control information 0x{ci:02x}")
+
+
+def decodeFrame(ci, data, timestamp=None, strict=True):
+    """Decodes the user data (after the CI field) of a variable data response.
+
+    With strict, any unsupported record raises MBusDecodeError. Otherwise
+    records with an unsupported VIF keep their raw data as hex Value and
+    "Unsupported VIF ..." as Unit, and the records up to a malformed one are
+    returned.
+    """
+    data = bytes(data)
+    info, i = _header(ci, data)
+    stamp = time.strftime(
+        "%Y-%m-%dT%H:%M:%SZ",
+        time.gmtime(time.time() if timestamp is None else timestamp),
+    )
+    records = []
+    try:
+        _decodeRecords(data, i, stamp, strict, records)
+    except (MBusDecodeError, IndexError) as e:
+        if strict:
+            raise
+        logger.warning(
+            f"M-Bus data record {len(records)} of unit {info.get('Id', '')} is malformed ({e}). "
+            f"Keeping the {len(records)} records before it."
+        )
+    result = {"SlaveInformation": info}
+    if len(records) == 1:
+        result["DataRecord"] = records[0]
+    elif records:
+        result["DataRecord"] = records
+    return result
+
+
+def _decodeRecords(data, i, stamp, strict, records):
+    """Appends the data records starting at index i to records"""
+    while i < len(data):
+        dif = data[i]
+        i += 1
+        if dif == 0x2F:  # idle filler
+            continue
+        if dif in (0x0F, 0x1F):
+            # the rest of the frame is manufacturer specific data, which libmbus
+            # reports as one more record with the data as hex dump
+            if strict:
+                raise MBusDecodeError("Manufacturer specific data")
+            records.append(
+                {
+                    "@id": str(len(records)),
+                    "Function": (
+                        "Manufacturer specific"
+                        if dif == 0x0F
+                        else "More records follow"
+                    ),
+                    "Value": " ".join(f"{byte:02X}" for byte in data[i:]),
+                    "Timestamp": stamp,
+                }
+            )
+            break
+        storage = (dif >> 6) & 0x01
+        tariff = device = 0
+        extension = dif & 0x80
+        n = 0
+        while extension:
+            dife = data[i]
+            i += 1
+            storage |= (dife & 0x0F) << (1 + 4 * n)
+            tariff |= ((dife >> 4) & 0x03) << (2 * n)
+            device |= ((dife >> 6) & 0x01) << n
+            extension = dife & 0x80
+            n += 1
+        vif = data[i]
+        i += 1
+        unsupported = None
+        if vif == 0xFD:
+            unit = _extensionUnit(data[i])
+            if unit is None:
+                unsupported = f"Unsupported VIF 0xfd 0x{data[i]:02x}"
+        elif vif & 0x7F == 0x7C:
+            unit = None  # plain text after the VIFEs
+        elif vif & 0x7F in (0x6F, 0x7B, 0x7D, 0x7E, 0x7F):
+            unsupported = f"Unsupported VIF 0x{vif:02x}"
+        else:
+            unit = units[vif & 0x7F]
+        extension = vif & 0x80
+        while extension:
+            extension = data[i] & 0x80
+            i += 1
+        if vif & 0x7F == 0x7C:
+            length = data[i]
+            if i + 1 + length > len(data):
+                raise MBusDecodeError("Truncated plain text unit")
+            unit = data[i + 1 : i + 1 + length][::-1].decode("latin-1")
+            i += 1 + length
+        if unsupported and strict:
+            raise MBusDecodeError(unsupported)
+        coding = dif & 0x0F
+        if coding == 0x0D:
+            length = data[i]
+            i += 1
+            if length > 0xBF:
+                raise MBusDecodeError(f"Unsupported LVAR 0x{length:02x}")
+        elif coding in _dataLength:
+            length = _dataLength[coding]
+        else:
+            raise MBusDecodeError(f"Unsupported data field coding 0x{coding:x}")
+        if i + length > len(data):
+            raise MBusDecodeError("Truncated data record")
+        record = {
+            "@id": str(len(records)),
+            "Function": functions[(dif >> 4) & 0x03],
+            "StorageNumber": str(storage),
+        }
+        if n:
+            # like libmbus, tariff and device are reported, if there is a DIFE
+            record["Tariff"] = str(tariff)
+            record["Device"] = str(device)
+        if unsupported:
+            record["Unit"] = unsupported
+            record["Value"] = data[i : i + length].hex()
+        else:
+            record["Unit"] = unit
+            record["Value"] = _value(coding, data[i : i + length], vif & 0x7F)
+        record["Timestamp"] = stamp
+        records.append(record)
+        i += length
+
+
+def compilePath(path):
+    """Compiles a field path like DataRecord/1/Value into a tuple of (key, index) accessors"""
+    return tuple(
+        (key, int(key) if key.lstrip("-").isdigit() else None)
+        for key in str(path).split("/")
+    )
+
+
+def getPath(data, accessors):
+    """Walks the compiled path through the decoded data. Raises KeyError, IndexError or TypeError."""
+    for key, index in accessors:
+        if isinstance(data, list):
+            data = data[index]
+        else:
+            data = data[key]
+    return data
@@ -1,16 +1,43 @@
 """Module, which provides a Modbus Interface as part of the AutomationOne Suite"""
 
 import logging
-import time
 import subprocess
+import time
+import xmltodict
+
+from datetime import timedelta
 
-from mbus.MBus import MBus
+try:
+    from mbus.MBus import MBus
+except ImportError:
+    MBus = None
 
+from .bus_arbiter import BusArbiter
 from .interface import Interface
+from .mbus_decoder import MBusDecodeError, decodeFrame
+from .mbus_native import NativeMBusSerialClient, NativeMBusTcpClient
 
 logger = logging.getLogger("AutomationOne")
 
 
+class UnitPoll:
+    """All polled MBusNodes of one unit sharing a pollRate, which are updated from a single read"""
+
+    def __init__(self, interface, unit, pollRate):
+        self.interface = interface
+        self.unit = unit
+        self.pollRate = pollRate
+        self.nodes = []
+
+    def read(self, no_onchange_forward=False):
+        return self.interface.pollUnit(self, no_onchange_forward=no_onchange_forward)
+
+    def __str__(self):
+        return "UnitPoll unit {} every {}s ({})".format(
+            self.unit, self.pollRate, ", ".join(node.name for node in self.nodes)
+        )
+
+
 class MBusInterface(Interface):
     def __init__(self, handler, config={}):
         super().__init__(handler, config)
@@ -21,23 +48,67 @@ class MBusInterface(Interface):
         self.use_api = config.get("use_api", True)
         self.timeout = config.get("timeout", 10)
         self.force_delay = config.get("force_delay", 1)
-        self._lock = False
+        self.force_delay_per_unit = config.get("force_delay_per_unit", None)
+        self.delay_after_completion = config.get("delay_after_completion", True)
+        self.baudrate = config.get("baudrate", 2400)
+        self.cache_ttl = config.get("cache_ttl", 2)
+        self.decoder = config.get("decoder", "native")
+        self.polls = {}
+        self._cache = {}
+        if self.device:
+            busKey = ("serial", self.device)
+        else:
+            busKey = ("tcp", self.host, self.port)
+        self.arbiter = BusArbiter.forBus(
+            busKey,
+            name=self.name,
+            force_delay=self.force_delay,
+            force_delay_per_unit=self.force_delay_per_unit,
+            priorities=config.get("lane_priorities"),
+            maxWait=config.get("lane_max_wait"),
+            delay_after_completion=self.delay_after_completion,
+        )
 
-        if self.use_api is False:
+        self.engine = config.get(
+            "engine", "console" if self.use_api is False else "api"
+        ).lower()
+        if self.engine == "api" and MBus is None:
+            raise ImportError(
+                f"[{self.name}] python-mbus is not installed. Install it or set engine: native."
+            )
+
+        if self.engine == "native":
+            if self.device:
+                self.client = NativeMBusSerialClient(
+                    self.device, baudrate=self.baudrate, timeout=self.timeout
+                )
+            else:
+                self.client = NativeMBusTcpClient(
+                    self.host, self.port, timeout=self.timeout
+                )
+            if self.client.connect():
+                logger.info(f"Successfully connected to Mbus {self.name}")
+        elif self.engine == "console":
             logger.info(
                 f"Use of API deactivated for {self.name}. Using console calls instead."
             )
-        else:
+        elif self.engine == "api":
             if self.device:
                 self.mbus = MBus(device=self.device)
             else:
                 self.mbus = MBus(host=self.host, port=self.port)
 
             self.mbus.connect()
+            if self.device and "baudrate" in config:
+                self.mbus.serial_set_baudrate(self.baudrate)
             logger.info(f"Successfully connected to Mbus {self.name}")
+        else:
+            raise NotImplementedError(
+                f"[{self.name}] M-Bus engine '{self.engine}' is not implemented!"
+            )
 
     def __del__(self):
-        if not self.use_api:
+        if self.engine != "api":
             return
         try:
             self.mbus.disconnect()
@@ -65,8 +136,45 @@ class MBusInterface(Interface):
             self.mbus.frame_data_free(reply_data)
         return result
 
+    def read_api_decoded(self, unit):
+        """Reads the unit and decodes the response frame without the XML round-trip.
+        Frames, which the native decoder does not support, are decoded by libmbus."""
+        reply_data = None
+        result = None
+        try:
+            self.mbus.send_request_frame(unit)
+            reply = self.mbus.recv_frame()
+            try:
+                result = decodeFrame(
+                    reply.control_information, bytes(reply.data[: reply.data_size])
+                )
+            except (MBusDecodeError, IndexError, AttributeError) as e:
+                logger.debug(
+                    f"[{self.name}] Native decoding of unit {unit} failed ({e}). Using libmbus."
+                )
+                reply_data = self.mbus.frame_data_parse(reply)
+                result = xmltodict.parse(self.mbus.frame_data_xml(reply_data))[
+                    "MBusData"
+                ]
+        except:
+            logger.error(
+                f"Error during read from M-Bus {self.name} with address {unit}"
+            )
+        if reply_data:
+            self.mbus.frame_data_free(reply_data)
+        return result
+
+    def read_native(self, unit):
+        try:
+            return self.client.read(unit)
+        except:
+            logger.error(
+                f"Error during read from M-Bus {self.name} with address {unit}"
+            )
+        return None
+
     def read_console(self, unit):
-        command = f"mbus-serial-request-data -b 2400 {self.device} {unit}"
+        command = f"mbus-serial-request-data -b {self.baudrate} {self.device} {unit}"
         logger.debug(f"Calling Console command '{command}'.")
         try:
             result = subprocess.check_output(command.split(" "), timeout=self.timeout)
@@ -77,18 +185,77 @@ class MBusInterface(Interface):
             result = ""
         return result
 
-    def read(self, unit):
-        while self._lock:
-            time.sleep(0.05)
-        self._lock = True
-        if self.use_api is True:
-            result = self.read_api(unit)
-        elif isinstance(self.use_api, dict) and self.use_api.get(unit, True):
+    def stop(self):
+        super().stop()
+        self.arbiter.release()
+        if self.engine == "native":
+            self.client.close()
+
+    def registerPollNode(self, node):
+        """Registers a polled node. All nodes of a unit with the same pollRate share one read per cycle."""
+        key = (node.unit, node.pollRate)
+        if key not in self.polls:
+            self.polls[key] = UnitPoll(self, node.unit, node.pollRate)
+        self.polls[key].nodes.append(node)
+        return True
+
+    def get_timeloop_callbacks(self):
+        callbacks = super().get_timeloop_callbacks()
+        for poll in self.polls.values():
+            logger.debug(f"[{self.name}] Polling {poll}")
+            callbacks.append((poll.read, timedelta(seconds=poll.pollRate)))
+        return callbacks
+
+    def pollUnit(self, poll, no_onchange_forward=False):
+        data = self.readData(poll.unit, maxAge=0)
+        if data is None:
+            return False
+        with self.handler.changeWave():
+            for node in poll.nodes:
+                node.updateFromData(data, no_onchange_forward=no_onchange_forward)
+        return True
+
+    def readData(self, unit, lane="poll", maxAge=None):
+        """Returns the parsed MBusData of the unit. A response, which is at most
+        maxAge (default cache_ttl) seconds old, is served from the cache."""
+        if maxAge is None:
+            maxAge = self.cache_ttl
+        cached = self._cache.get(unit)
+        if cached is not None and time.monotonic() - cached[0] <= maxAge:
+            return cached[1]
+        if self.engine == "native":
+            data = self.read(unit, lane=lane)
+        elif self.decoder == "native" and self._usesApi(unit):
+            data = self.arbiter.call(
+                self.read_api_decoded, (unit,), unit=unit, lane=lane
+            )
+        else:
+            result = self.read(unit, lane=lane)
+            try:
+                data = xmltodict.parse(result)["MBusData"]
+            except:
+                logger.error(f"[{self.name}] Could not parse data from unit {unit}")
+                return None
+        if data is None:
+            return None
+        self._cache[unit] = (time.monotonic(), data)
+        return data
+
+    def read(self, unit, lane="poll"):
+        return self.arbiter.call(self._read, (unit,), unit=unit, lane=lane)
+
+    def _usesApi(self, unit):
+        if self.engine != "api":
+            return False
+        if isinstance(self.use_api, dict):
+            return self.use_api.get(unit, True)
+        return self.use_api is True
+
+    def _read(self, unit):
+        if self.engine == "native":
+            result = self.read_native(unit)
+        elif self._usesApi(unit):
             result = self.read_api(unit)
         else:
             result = self.read_console(unit)
-
-        if self.force_delay:
-            time.sleep(self.force_delay)
-        self._lock = False
         return result
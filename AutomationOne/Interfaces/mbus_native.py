@@ -0,0 +1,178 @@
+"""Lean built-in M-Bus serial/TCP client, which is used by the MBusInterface with engine: native.
+
+The connection is opened once and kept by the bus worker, so a read costs one
+REQ_UD2 telegram instead of a process fork. The responses are decoded by
+mbus_decoder.
+"""
+
+import logging
+import socket
+
+from .mbus_decoder import MBusDecodeError, decodeFrame
+
+logger = logging.getLogger("AutomationOne")
+
+FRAME_SHORT_START = 0x10
+FRAME_LONG_START = 0x68
+FRAME_STOP = 0x16
+CONTROL_REQ_UD2 = 0x5B
+
+
+def request_frame(unit):
+    """Short frame REQ_UD2 to the primary address unit"""
+    return bytes(
+        (
+            FRAME_SHORT_START,
+            CONTROL_REQ_UD2,
+            unit,
+            (CONTROL_REQ_UD2 + unit) & 0xFF,
+            FRAME_STOP,
+        )
+    )
+
+
+def check_long_frame(header, body):
+    """Validates a long frame, given as its four header bytes and the rest.
+    Returns (control information, user data)."""
+    if (
+        header[0] != FRAME_LONG_START
+        or header[3] != FRAME_LONG_START
+        or header[1] != header[2]
+    ):
+        raise MBusDecodeError(f"Invalid long frame header {bytes(header).hex()}")
+    length = header[1]
+    if len(body) != length + 2 or body[-1] != FRAME_STOP:
+        raise MBusDecodeError("Invalid long frame end")
+    if sum(body[:length]) & 0xFF != body[length]:
+        raise MBusDecodeError("Checksum mismatch in long frame")
+    return body[2], bytes(body[3:length])
+
+
+class NativeMBusClient:
+    """Sends REQ_UD2 requests and returns the decoded responses.
+
+    The transport (serial or tcp) is implemented by the subclasses via
+    _send(data) and _receive(n), which returns exactly n bytes.
+    """
+
+    def __init__(self, timeout=1):
+        self.timeout = timeout
+
+    def connect(self):
+        raise NotImplementedError()
+
+    def close(self):
+        raise NotImplementedError()
+
+    def _send(self, data):
+        raise NotImplementedError()
+
+    def _receive(self, n):
+        raise NotImplementedError()
+
+    def request(self, unit):
+        """Reads the unit with the primary address unit and returns (ci, user data)"""
+        if not self.connect():
+            raise ConnectionError("M-Bus not connected")
+        unit = int(unit)
+        try:
+            self._send(request_frame(unit))
+            header = self._receive(4)
+            body = self._receive(header[1] + 2)
+            ci, data = check_long_frame(header, body)
+            if body[1] != unit:
+                raise MBusDecodeError(
+                    f"Response from address {body[1]} instead of {unit}"
+                )
+        except Exception:
+            # a broken or foreign frame leaves unknown bytes on the line
+            self.close()
+            raise
+        return ci, data
+
+    def read(self, unit):
+        """Reads the unit and returns the decoded MBusData. Records, which can
+        not be decoded, are marked as unsupported instead of failing the reading."""
+        ci, data = self.request(unit)
+        return decodeFrame(ci, data, strict=False)
+
+
+class NativeMBusSerialClient(NativeMBusClient):
+    def __init__(self, device, baudrate=2400, timeout=1):
+        super().__init__(timeout)
+        self.device = device
+        self.baudrate = baudrate
+        self.serial = None
+
+    def connect(self):
+        import serial
+
+        if self.serial is not None and self.serial.is_open:
+            return True
+        try:
+            self.serial = serial.Serial(
+                port=self.device,
+                baudrate=self.baudrate,
+                parity=serial.PARITY_EVEN,
+                stopbits=1,
+                bytesize=8,
+                timeout=self.timeout,
+            )
+        except Exception:
+            logger.exception(f"Could not open serial port {self.device}")
+            self.serial = None
+            return False
+        return True
+
+    def close(self):
+        if self.serial is not None:
+            self.serial.close()
+            self.serial = None
+
+    def _send(self, data):
+        self.serial.reset_input_buffer()
+        self.serial.write(data)
+
+    def _receive(self, n):
+        data = self.serial.read(n)
+        if len(data) != n:
+            raise TimeoutError(f"Received {len(data)} of {n} bytes")
+        return data
+
+
+class NativeMBusTcpClient(NativeMBusClient):
+    def __init__(self, host, port, timeout=1):
+        super().__init__(timeout)
+        self.host = host
+        self.port = port
+        self.socket = None
+
+    def connect(self):
+        if self.socket is not None:
+            return True
+        try:
+            self.socket = socket.create_connection(
+                (self.host, self.port), timeout=self.timeout
+            )
+        except OSError:
+            logger.exception(f"Could not connect to {self.host}:{self.port}")
+            self.socket = None
+            return False
+        return True
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+    def _send(self, data):
+        self.socket.sendall(data)
+
+    def _receive(self, n):
+        data = bytearray()
+        while len(data) < n:
+            chunk = self.socket.recv(n - len(data))
+            if not chunk:
+                raise ConnectionError("Connection closed by peer")
+            data += chunk
+        return data
@@ -0,0 +1,208 @@
+"""Pipelined Modbus TCP client, which is used by the ModbusInterface with engine: async"""
+
+import asyncio
+import logging
+import struct
+import threading
+
+from .modbus_native import (
+    NativeError,
+    NativeResponse,
+    check_response,
+    decode_read_response,
+    pack_coils,
+)
+
+logger = logging.getLogger("AutomationOne")
+
+
+class AsyncTcpClient:
+    """Modbus TCP client, which keeps up to max_in_flight requests outstanding per connection.
+
+    The client runs its own asyncio event loop in a background thread and
+    matches the responses to the requests via the MBAP transaction id. The
+    blocking methods (read_holding_registers, write_registers, ...) mirror the
+    other clients and can be called from any number of threads concurrently.
+    Coroutine users can await request() directly on the client's loop.
+    """
+
+    def __init__(self, host, port=502, timeout=1, max_in_flight=8):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+
+        self._writer = None
+        self._pending = {}
+        self._transaction_id = 0
+
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self.loop.run_forever, name=f"modbus-async-{host}", daemon=True
+        )
+        self._thread.start()
+        self._window = self._run(self._create_window())
+
+    def _run(self, coroutine, timeout=None):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    async def _create_window(self):
+        return asyncio.Semaphore(self.max_in_flight)
+
+    def connect(self):
+        return self._run(self._connect())
+
+    def close(self):
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(
+                self._disconnect, ConnectionError("Client closed")
+            )
+
+    async def _connect(self):
+        if self._writer is not None:
+            return True
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), self.timeout
+            )
+        except (OSError, asyncio.TimeoutError):
+            logger.error(f"Could not connect to {self.host}:{self.port}")
+            return False
+        self._writer = writer
+        self.loop.create_task(self._receive(reader, writer))
+        return True
+
+    def _disconnect(self, exc, writer=None):
+        if writer is not None and writer is not self._writer:
+            return
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(exc)
+
+    async def _receive(self, reader, writer):
+        try:
+            while True:
+                header = await reader.readexactly(7)
+                transaction_id, protocol_id, length, _ = struct.unpack(">HHHB", header)
+                # the length counts the unit id and a PDU of 1 to 253 bytes
+                if protocol_id != 0 or not 2 <= length <= 254:
+                    raise ConnectionError(
+                        f"Invalid MBAP header {header.hex()} from {self.host}:{self.port}"
+                    )
+                pdu = await reader.readexactly(length - 1)
+                future = self._pending.pop(transaction_id, None)
+                if future is None or future.done():
+                    logger.debug(
+                        f"Dropping response with unknown transaction id {transaction_id}"
+                    )
+                    continue
+                future.set_result(pdu)
+        except (asyncio.IncompleteReadError, OSError) as e:
+            # ConnectionError is an OSError, so protocol errors reset the connection as well
+            logger.debug(f"Connection to {self.host}:{self.port} lost: {e!r}")
+            self._disconnect(ConnectionError(repr(e)), writer)
+        except Exception as e:
+            logger.exception(f"Error while receiving from {self.host}:{self.port}")
+            self._disconnect(ConnectionError(repr(e)), writer)
+
+    async def request(self, unit, pdu):
+        """Sends the request PDU to the unit and returns the response PDU"""
+        async with self._window:
+            if self._writer is None and not await self._connect():
+                raise ConnectionError(f"Not connected to {self.host}:{self.port}")
+            self._transaction_id = (self._transaction_id + 1) & 0xFFFF
+            transaction_id = self._transaction_id
+            future = self.loop.create_future()
+            self._pending[transaction_id] = future
+            self._writer.write(
+                struct.pack(">HHHB", transaction_id, 0, len(pdu) + 1, unit) + pdu
+            )
+            try:
+                return await asyncio.wait_for(future, self.timeout)
+            finally:
+                self._pending.pop(transaction_id, None)
+
+    def _execute(self, unit, pdu):
+        if unit is None:
+            unit = 0
+        try:
+            response = self._run(self.request(unit, pdu))
+        except Exception as e:
+            return NativeError(repr(e), pdu[0])
+        return check_response(pdu[0], response)
+
+    def _read(self, function_code, address, count, unit):
+        pdu = self._execute(unit, struct.pack(">BHH", function_code, address, count))
+        if isinstance(pdu, NativeError):
+            return pdu
+        return decode_read_response(function_code, count, pdu)
+
+    def read_coils(self, address, count=1, unit=0):
+        return self._read(1, address, count, unit)
+
+    def read_discrete_inputs(self, address, count=1, unit=0):
+        return self._read(2, address, count, unit)
+
+    def read_holding_registers(self, address, count=1, unit=0):
+        return self._read(3, address, count, unit)
+
+    def read_input_registers(self, address, count=1, unit=0):
+        return self._read(4, address, count, unit)
+
+    def read_many(self, requests):
+        """Sends several read requests (functionCode, address, count, unit) at once and returns their responses"""
+        return self._run(self._read_many(requests))
+
+    async def _read_many(self, requests):
+        responses = await asyncio.gather(
+            *[
+                self.request(
+                    0 if unit is None else unit,
+                    struct.pack(">BHH", function_code, address, count),
+                )
+                for (function_code, address, count, unit) in requests
+            ],
+            return_exceptions=True,
+        )
+        results = []
+        for (function_code, _, count, _), response in zip(requests, responses):
+            if isinstance(response, Exception):
+                results.append(NativeError(repr(response), function_code))
+                continue
+            pdu = check_response(function_code, response)
+            if isinstance(pdu, NativeError):
+                results.append(pdu)
+            else:
+                results.append(decode_read_response(function_code, count, pdu))
+        return results
+
+    def _write(self, unit, pdu):
+        response = self._execute(unit, pdu)
+        if isinstance(response, NativeError):
+            return response
+        return NativeResponse(pdu[0])
+
+    def write_coil(self, address, value, unit=0):
+        return self._write(
+            unit, struct.pack(">BHH", 5, address, 0xFF00 if value else 0)
+        )
+
+    def write_register(self, address, value, unit=0):
+        return self._write(unit, struct.pack(">BHH", 6, address, value))
+
+    def write_registers(self, address, values, unit=0):
+        count = len(values)
+        return self._write(
+            unit,
+            struct.pack(f">BHHB{count}H", 16, address, count, 2 * count, *values),
+        )
+
+    def write_coils(self, address, values, unit=0):
+        data = pack_coils(values)
+        return self._write(
+            unit, struct.pack(">BHHB", 15, address, len(values), len(data)) + data
+        )
@@ -1,17 +1,30 @@
 import logging
-import time
+
+from datetime import timedelta
 
 try:
     from pymodbus.client import ModbusSerialClient, ModbusTcpClient
 except:
     from pymodbus.client.sync import ModbusSerialClient, ModbusTcpClient
 from pymodbus.exceptions import ModbusIOException
+from pymodbus.pdu import ExceptionResponse
 from pymodbus import __version__ as PYMODBUS_VERSION
 
+from .bus_arbiter import BusArbiter
 from .interface import Interface
+from .modbus_async import AsyncTcpClient
+from .modbus_native import NativeError, NativeRtuClient, NativeTcpClient
+from .modbus_planner import plan_cycles, plan_reads
 
 logger = logging.getLogger("AutomationOne")
 
+if tuple(map(int, PYMODBUS_VERSION.split("."))) < (3, 3, 0):
+    PYMODBUS_UNIT_KWARG = "unit"
+else:
+    PYMODBUS_UNIT_KWARG = "slave"
+
+modbus_error_types = (ModbusIOException, ExceptionResponse, NativeError)
+
 
 class ModbusInterface(Interface):
     """A Class providing an AutomationOne Interface for Modbus"""
@@ -22,6 +35,16 @@ class ModbusInterface(Interface):
 
         self._timeout = float(config.get("timeout", 1))
 
+        self._engine = config.get("engine", "pymodbus").lower()
+        if self._engine in ["native", "async"]:
+            self._unit_kwarg = "unit"
+        elif self._engine == "pymodbus":
+            self._unit_kwarg = PYMODBUS_UNIT_KWARG
+        else:
+            raise NotImplementedError(
+                f"[{self.name}] Modbus engine '{self._engine}' is not implemented!"
+            )
+
         if self._method == "rtu":
             self._baudrate = config.get("baudrate")
             self._port = config.get("port", "/dev/ttymxc2")
@@ -32,24 +55,51 @@ class ModbusInterface(Interface):
             logger.debug(
                 f"[{self.name}] Creating Modbus Serial-rtu Client with baudrate {self._baudrate}, device {self._port}, parity {self._parity}, stopbits {self._stopbits}, bytesize {self._bytesize} and timeout {self._timeout}"
             )
-            self.client_modbus = ModbusSerialClient(
-                method="rtu",
-                baudrate=self._baudrate,
-                port=self._port,
-                parity=self._parity,
-                stopbits=self._stopbits,
-                bytesize=self._bytesize,
-                timeout=self._timeout,
-            )
+            if self._engine == "async":
+                raise NotImplementedError(
+                    f"[{self.name}] The async engine is only available for method tcp!"
+                )
+            elif self._engine == "native":
+                self.client_modbus = NativeRtuClient(
+                    baudrate=self._baudrate,
+                    port=self._port,
+                    parity=self._parity,
+                    stopbits=self._stopbits,
+                    bytesize=self._bytesize,
+                    timeout=self._timeout,
+                )
+            else:
+                self.client_modbus = ModbusSerialClient(
+                    method="rtu",
+                    baudrate=self._baudrate,
+                    port=self._port,
+                    parity=self._parity,
+                    stopbits=self._stopbits,
+                    bytesize=self._bytesize,
+                    timeout=self._timeout,
+                )
         elif self._method == "tcp":
             self._host = config.get("host")
             self._port = config.get("port", 502)
             logger.debug(
                 f"[{self.name}] Creating Modubs TCP Client with host {self._host}, port {self._port}, timeout {self._timeout}"
             )
-            self.client_modbus = ModbusTcpClient(
-                host=self._host, port=self._port, timeout=self._timeout
-            )
+            if self._engine == "async":
+                self._max_in_flight = config.get("max_in_flight", 8)
+                self.client_modbus = AsyncTcpClient(
+                    host=self._host,
+                    port=self._port,
+                    timeout=self._timeout,
+                    max_in_flight=self._max_in_flight,
+                )
+            elif self._engine == "native":
+                self.client_modbus = NativeTcpClient(
+                    host=self._host, port=self._port, timeout=self._timeout
+                )
+            else:
+                self.client_modbus = ModbusTcpClient(
+                    host=self._host, port=self._port, timeout=self._timeout
+                )
         else:
             raise (
                 f"[{self.name}] Modbus Interface for method '{self._method}' is not implemented!"
@@ -63,9 +113,23 @@ class ModbusInterface(Interface):
 
         self.force_delay = config.get("force_delay", None)
         self.force_delay_per_unit = config.get("force_delay_per_unit", None)
-        self.lock = 0
-        self.unit_lock = {}
-        self.sleep_time = config.get("sleep_time", 0.01)
+        self.delay_after_completion = config.get("delay_after_completion", False)
+        if self.pipelined:
+            self.arbiter = None
+        else:
+            if self._method == "rtu":
+                busKey = ("serial", self._port)
+            else:
+                busKey = ("tcp", self._host, self._port)
+            self.arbiter = BusArbiter.forBus(
+                busKey,
+                name=self.name,
+                force_delay=self.force_delay,
+                force_delay_per_unit=self.force_delay_per_unit,
+                priorities=config.get("lane_priorities"),
+                maxWait=config.get("lane_max_wait"),
+                delay_after_completion=self.delay_after_completion,
+            )
 
         self.ReadRequests = 0
         self.Failures = 0
@@ -74,20 +138,71 @@ class ModbusInterface(Interface):
         if self._debug_enabled:
             self.client_modbus.debug_enabled = True
 
-    def check_lock(self, unit):
-        while self.lock > time.time() or self.unit_lock.get(unit, 0) > time.time():
-            time.sleep(self.sleep_time)
-        if self.force_delay:
-            self.lock = time.time() + self.force_delay
-        if self.force_delay_per_unit:
-            self.unit_lock[unit] = time.time() + self.force_delay_per_unit
-
-    def write(self, functionCode, registers, address, unit=None):
-        self.check_lock(unit)
-        if tuple(map(int, PYMODBUS_VERSION.split("."))) < (3, 3, 0):
-            unit_args = {"unit": unit}
+        self.coalesce_reads = config.get("coalesce_reads", False)
+        self.max_registers_per_request = config.get("max_registers_per_request", 125)
+        self.max_gap = config.get("max_gap", 0)
+        self.pollNodes = []
+
+    def registerPollNode(self, node):
+        """Registers a polled node for coalesced reads. Returns True if the interface takes over the polling."""
+        if not self.coalesce_reads:
+            return False
+        self.pollNodes.append(node)
+        return True
+
+    def get_timeloop_callbacks(self):
+        callbacks = super().get_timeloop_callbacks()
+        if not self.pollNodes:
+            return callbacks
+        blocks = plan_reads(
+            self,
+            self.pollNodes,
+            max_registers=self.max_registers_per_request,
+            max_gap=self.max_gap,
+        )
+        logger.info(
+            f"[{self.name}] Coalesced {len(self.pollNodes)} polled nodes into {len(blocks)} read requests."
+        )
+        for block in blocks:
+            logger.debug(f"[{self.name}] Planned {block}")
+        if self.pipelined:
+            for cycle in plan_cycles(self, blocks):
+                callbacks.append((cycle.read, timedelta(seconds=cycle.pollRate)))
         else:
-            unit_args = {"slave": unit}
+            for block in blocks:
+                callbacks.append((block.read, timedelta(seconds=block.pollRate)))
+        return callbacks
+
+    @property
+    def pipelined(self):
+        """True if the engine can have several requests in flight at once"""
+        return hasattr(self.client_modbus, "read_many")
+
+    def stop(self):
+        super().stop()
+        if self.arbiter:
+            self.arbiter.release()
+        self.client_modbus.close()
+
+    def _onBus(self, func, args, unit, lane):
+        """Executes func on the bus, serialised by the bus arbiter unless the engine is pipelined"""
+        if self.arbiter is None:
+            return func(*args)
+        return self.arbiter.call(func, args, unit=unit, lane=lane)
+
+    def getQueueMetrics(self):
+        """Returns the queue wait time statistics per lane of the bus"""
+        if self.arbiter is None:
+            return {}
+        return self.arbiter.metrics()
+
+    def write(self, functionCode, registers, address, unit=None, lane="write"):
+        return self._onBus(
+            self._write, (functionCode, registers, address, unit), unit, lane
+        )
+
+    def _write(self, functionCode, registers, address, unit=None):
+        unit_args = {self._unit_kwarg: unit}
 
         if functionCode == 6:
             if len(registers) > 1:
@@ -98,12 +213,11 @@ class ModbusInterface(Interface):
         elif functionCode == 16:
             self.client_modbus.write_registers(address, registers, **unit_args)
 
-    def read(self, functionCode, address, count=None, unit=None):
-        self.check_lock(unit)
-        if tuple(map(int, PYMODBUS_VERSION.split("."))) < (3, 3, 0):
-            unit_args = {"unit": unit}
-        else:
-            unit_args = {"slave": unit}
+    def read(self, functionCode, address, count=None, unit=None, lane="poll"):
+        return self._onBus(self._read, (functionCode, address, count, unit), unit, lane)
+
+    def _read(self, functionCode, address, count=None, unit=None):
+        unit_args = {self._unit_kwarg: unit}
         if functionCode == 3:
             result = self.client_modbus.read_holding_registers(
                 address=address, count=count, **unit_args
@@ -113,6 +227,143 @@ class ModbusInterface(Interface):
                 address=address, count=count, **unit_args
             )
         self.ReadRequests += 1
-        if isinstance(result, ModbusIOException):
+        if isinstance(result, (ModbusIOException, NativeError)):
             self.Failures += 1
         return result
+
+    def readRegisters(
+        self,
+        functionCode,
+        address,
+        count,
+        unit=None,
+        retries=1,
+        name=None,
+        lane="poll",
+    ):
+        """Reads count registers and returns them as list. Returns None on failure."""
+        if name is None:
+            name = self.name
+        data = self._readRetrying(
+            functionCode, address, count, unit, retries, name, lane
+        )
+        return self._registers(data, name)
+
+    def _readRetrying(self, functionCode, address, count, unit, retries, name, lane):
+        """Reads count registers up to retries times and returns the last response"""
+        data = None
+        for i in range(retries):
+            data = self.read(
+                functionCode=functionCode,
+                address=address,
+                count=count,
+                unit=unit,
+                lane=lane,
+            )
+            try:
+                if len(data.registers) > 0:
+                    break
+            except:
+                pass
+            if i + 1 < retries:
+                logger.debug(f"[{name}] Retrying reading Value...")
+        return data
+
+    def _registers(self, data, name):
+        """Returns the registers of a response or None, if it is an error"""
+        if isinstance(data, modbus_error_types):
+            logger.error(f"[{name}] {data}")
+            return None
+        try:
+            return data.registers
+        except:
+            logger.error(f"[{name}] Unexpected response {data}")
+        return None
+
+    def readBlock(self, block, no_onchange_forward=False, retries=None):
+        if block.split:
+            return self._readNodes(block, no_onchange_forward)
+        data = self._readRetrying(
+            block.functionCode,
+            block.address,
+            block.count,
+            block.unit,
+            block.retries if retries is None else retries,
+            str(block),
+            "poll",
+        )
+        if self._splitOnException(block, data):
+            return self._readNodes(block, no_onchange_forward)
+        registers = self._registers(data, str(block))
+        if registers is None:
+            return False
+        self._applyBlock(block, registers, no_onchange_forward)
+        return True
+
+    def _splitOnException(self, block, data):
+        """Marks a block of several nodes, which the device answered with an
+        exception response (e.g. an unmapped register), to be read node by node"""
+        exception = isinstance(data, ExceptionResponse) or (
+            isinstance(data, NativeError) and data.exception_code is not None
+        )
+        if not exception or len(block.nodes) < 2:
+            return False
+        logger.warning(f"[{block}] {data}. Reading the nodes of the block one by one.")
+        block.split = True
+        return True
+
+    def _readNodes(self, block, no_onchange_forward=False):
+        with self.handler.changeWave():
+            for node in block.nodes:
+                node.pullValue(no_onchange_forward=no_onchange_forward)
+        return True
+
+    def readBlocks(self, blocks, no_onchange_forward=False):
+        """Reads several blocks, concurrently if the engine is pipelined"""
+        if not self.pipelined:
+            return all([self.readBlock(block, no_onchange_forward) for block in blocks])
+        success = all(
+            [
+                self._readNodes(block, no_onchange_forward)
+                for block in blocks
+                if block.split
+            ]
+        )
+        blocks = [block for block in blocks if not block.split]
+        results = self.client_modbus.read_many(
+            [
+                (block.functionCode, block.address, block.count, block.unit)
+                for block in blocks
+            ]
+        )
+        self.ReadRequests += len(blocks)
+        with self.handler.changeWave():
+            for block, result in zip(blocks, results):
+                if isinstance(result, NativeError):
+                    self.Failures += 1
+                    if self._splitOnException(block, result):
+                        self._readNodes(block, no_onchange_forward)
+                    elif block.retries > 1:
+                        # the pipelined request was the first of the retries
+                        logger.debug(f"[{block}] Retrying reading Value...")
+                        success = (
+                            self.readBlock(
+                                block, no_onchange_forward, retries=block.retries - 1
+                            )
+                            and success
+                        )
+                    else:
+                        logger.error(f"[{block}] {result}")
+                        success = False
+                    continue
+                self._applyBlock(block, result.registers, no_onchange_forward)
+        return success
+
+    def _applyBlock(self, block, registers, no_onchange_forward=False):
+        with self.handler.changeWave():
+            for node in block.nodes:
+                offset = node.address - block.address
+                node.updateFromRegisters(
+                    registers[offset : offset + node._count],
+                    no_onchange_forward=no_onchange_forward,
+                )
@@ -0,0 +1,391 @@
+"""Lean built-in Modbus RTU/TCP client, which is used by the ModbusInterface with engine: native"""
+
+import logging
+import socket
+import struct
+import threading
+import time
+
+from functools import wraps
+
+logger = logging.getLogger("AutomationOne")
+
+
+def _build_crc_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            if crc & 1:
+                crc = (crc >> 1) ^ 0xA001
+            else:
+                crc >>= 1
+        table.append(crc)
+    return tuple(table)
+
+
+CRC_TABLE = _build_crc_table()
+
+
+def crc16(data):
+    """Table driven Modbus CRC16 of a bytes-like object"""
+    crc = 0xFFFF
+    table = CRC_TABLE
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc
+
+
+_register_structs = {}
+
+
+def _registers(count):
+    """Returns a cached struct.Struct for count big endian registers"""
+    s = _register_structs.get(count)
+    if s is None:
+        s = _register_structs[count] = struct.Struct(f">{count}H")
+    return s
+
+
+def _locked(func):
+    """Serialises the use of the preallocated request and response frames"""
+
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return func(self, *args, **kwargs)
+
+    return wrapper
+
+
+class NativeResponse:
+    """Response of a successful request. Mirrors the attributes of the pymodbus responses."""
+
+    def __init__(self, function_code, registers=None, bits=None):
+        self.function_code = function_code
+        self.registers = registers if registers is not None else []
+        self.bits = bits if bits is not None else []
+
+    def isError(self):
+        return False
+
+    def __str__(self):
+        return "NativeResponse (functionCode {}, registers {}, bits {})".format(
+            self.function_code, self.registers, self.bits
+        )
+
+
+class NativeError:
+    """Response of a failed request, either an I/O problem or a Modbus exception response"""
+
+    def __init__(self, message, function_code=None, exception_code=None):
+        self.message = message
+        self.function_code = function_code
+        self.exception_code = exception_code
+
+    def isError(self):
+        return True
+
+    def __str__(self):
+        if self.exception_code is not None:
+            return "Modbus Exception (functionCode {}, exceptionCode {}): {}".format(
+                self.function_code, self.exception_code, self.message
+            )
+        return f"Modbus Error: {self.message}"
+
+
+def check_response(function_code, pdu):
+    """Returns the response PDU or a NativeError if it does not answer the request"""
+    if not pdu:
+        return NativeError("No valid response received", function_code)
+    if pdu[0] & 0x80:
+        return NativeError("Exception response", function_code, exception_code=pdu[1])
+    if pdu[0] != function_code:
+        return NativeError(
+            f"Unexpected functionCode {pdu[0]} in response", function_code
+        )
+    return pdu
+
+
+def decode_read_response(function_code, count, pdu):
+    """Decodes the response PDU of a read request (FC1-4)"""
+    if function_code in (1, 2):
+        data = pdu[2 : 2 + pdu[1]]
+        bits = [bool(data[i >> 3] >> (i & 7) & 1) for i in range(len(data) * 8)]
+        return NativeResponse(function_code, bits=bits)
+    if pdu[1] != 2 * count:
+        return NativeError(
+            f"Expected {count} registers, got {pdu[1]} bytes", function_code
+        )
+    return NativeResponse(
+        function_code, registers=list(_registers(count).unpack_from(pdu, 2))
+    )
+
+
+def pack_coils(values):
+    """Packs a list of booleans into the byte representation used by FC15"""
+    data = bytearray((len(values) + 7) // 8)
+    for i, value in enumerate(values):
+        if value:
+            data[i >> 3] |= 1 << (i & 7)
+    return data
+
+
+class NativeClient:
+    """Builds the PDUs into a preallocated frame and parses the responses.
+
+    The transport (rtu or tcp) is implemented by the subclasses via
+    _transaction(unit, pdu_length), which sends the PDU located at
+    self._pdu[:pdu_length] and returns a memoryview of the response PDU.
+    """
+
+    header_length = 0
+    trailer_length = 0
+
+    def __init__(self, timeout=1):
+        self.timeout = timeout
+        self._request = bytearray(self.header_length + 253 + self.trailer_length)
+        self._response = bytearray(self.header_length + 253 + self.trailer_length)
+        self._pdu = memoryview(self._request)[self.header_length :]
+        self._lock = threading.Lock()
+
+    def connect(self):
+        raise NotImplementedError()
+
+    def close(self):
+        raise NotImplementedError()
+
+    def _transaction(self, unit, pdu_length):
+        raise NotImplementedError()
+
+    def _execute(self, unit, pdu_length):
+        function_code = self._pdu[0]
+        if unit is None:
+            unit = 0
+        try:
+            pdu = self._transaction(unit, pdu_length)
+        except Exception as e:
+            self.close()
+            return NativeError(repr(e), function_code)
+        return check_response(function_code, pdu)
+
+    def _read(self, function_code, address, count, unit):
+        struct.pack_into(">BHH", self._pdu, 0, function_code, address, count)
+        pdu = self._execute(unit, 5)
+        if isinstance(pdu, NativeError):
+            return pdu
+        return decode_read_response(function_code, count, pdu)
+
+    @_locked
+    def read_coils(self, address, count=1, unit=0):
+        return self._read(1, address, count, unit)
+
+    @_locked
+    def read_discrete_inputs(self, address, count=1, unit=0):
+        return self._read(2, address, count, unit)
+
+    @_locked
+    def read_holding_registers(self, address, count=1, unit=0):
+        return self._read(3, address, count, unit)
+
+    @_locked
+    def read_input_registers(self, address, count=1, unit=0):
+        return self._read(4, address, count, unit)
+
+    def _write_single(self, function_code, address, value, unit):
+        struct.pack_into(">BHH", self._pdu, 0, function_code, address, value)
+        pdu = self._execute(unit, 5)
+        if isinstance(pdu, NativeError):
+            return pdu
+        return NativeResponse(function_code)
+
+    @_locked
+    def write_coil(self, address, value, unit=0):
+        return self._write_single(5, address, 0xFF00 if value else 0, unit)
+
+    @_locked
+    def write_register(self, address, value, unit=0):
+        return self._write_single(6, address, value, unit)
+
+    @_locked
+    def write_registers(self, address, values, unit=0):
+        count = len(values)
+        struct.pack_into(">BHHB", self._pdu, 0, 16, address, count, 2 * count)
+        _registers(count).pack_into(self._pdu, 6, *values)
+        pdu = self._execute(unit, 6 + 2 * count)
+        if isinstance(pdu, NativeError):
+            return pdu
+        return NativeResponse(16)
+
+    @_locked
+    def write_coils(self, address, values, unit=0):
+        count = len(values)
+        byte_count = (count + 7) // 8
+        struct.pack_into(">BHHB", self._pdu, 0, 15, address, count, byte_count)
+        self._pdu[6 : 6 + byte_count] = pack_coils(values)
+        pdu = self._execute(unit, 6 + byte_count)
+        if isinstance(pdu, NativeError):
+            return pdu
+        return NativeResponse(15)
+
+
+def _remaining_rtu_length(function_code, third_byte):
+    """Returns the number of bytes (including the CRC) following the first three bytes of an rtu response"""
+    if function_code & 0x80:
+        return 2
+    if function_code in (1, 2, 3, 4):
+        return third_byte + 2
+    if function_code in (5, 6, 15, 16):
+        return 5
+    raise ValueError(f"FunctionCode {function_code} not supported")
+
+
+class NativeRtuClient(NativeClient):
+    header_length = 1
+    trailer_length = 2
+
+    def __init__(self, port, baudrate, parity="E", stopbits=1, bytesize=8, timeout=1):
+        super().__init__(timeout)
+        self.port = port
+        self.baudrate = baudrate
+        self.parity = parity
+        self.stopbits = stopbits
+        self.bytesize = bytesize
+        self.serial = None
+
+        # 3.5 character times of silence between frames. Above 19200 baud the
+        # spec recommends a fixed value of 1.75ms.
+        bits = 1 + bytesize + (0 if parity == "N" else 1) + stopbits
+        if baudrate > 19200:
+            self.frame_gap = 0.00175
+        else:
+            self.frame_gap = 3.5 * bits / baudrate
+        self._last_frame = 0
+
+    def connect(self):
+        import serial
+
+        if self.serial is not None and self.serial.is_open:
+            return True
+        try:
+            self.serial = serial.Serial(
+                port=self.port,
+                baudrate=self.baudrate,
+                parity=self.parity,
+                stopbits=self.stopbits,
+                bytesize=self.bytesize,
+                timeout=self.timeout,
+            )
+        except Exception:
+            logger.exception(f"Could not open serial port {self.port}")
+            self.serial = None
+            return False
+        return True
+
+    def close(self):
+        if self.serial is not None:
+            self.serial.close()
+            self.serial = None
+
+    def _read_exactly(self, view):
+        n = self.serial.readinto(view)
+        if n != len(view):
+            raise TimeoutError(f"Received {n} of {len(view)} bytes")
+
+    def _transaction(self, unit, pdu_length):
+        if self.serial is None and not self.connect():
+            raise ConnectionError(f"Serial port {self.port} not open")
+
+        frame_length = 1 + pdu_length
+        self._request[0] = unit
+        crc = crc16(memoryview(self._request)[:frame_length])
+        self._request[frame_length] = crc & 0xFF
+        self._request[frame_length + 1] = crc >> 8
+
+        wait = self._last_frame + self.frame_gap - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self.serial.reset_input_buffer()
+        self.serial.write(memoryview(self._request)[: frame_length + 2])
+
+        response = memoryview(self._response)
+        try:
+            self._read_exactly(response[:3])
+            length = 3 + _remaining_rtu_length(response[1], response[2])
+            self._read_exactly(response[3:length])
+        finally:
+            self._last_frame = time.monotonic()
+
+        if response[0] != unit:
+            logger.debug(f"Response from unexpected unit {response[0]}")
+            return None
+        crc = crc16(response[: length - 2])
+        if response[length - 2] != crc & 0xFF or response[length - 1] != crc >> 8:
+            logger.debug("CRC mismatch in Modbus rtu response")
+            return None
+        return response[1 : length - 2]
+
+
+class NativeTcpClient(NativeClient):
+    header_length = 7
+
+    def __init__(self, host, port=502, timeout=1):
+        super().__init__(timeout)
+        self.host = host
+        self.port = port
+        self.socket = None
+        self._transaction_id = 0
+
+    def connect(self):
+        if self.socket is not None:
+            return True
+        try:
+            self.socket = socket.create_connection(
+                (self.host, self.port), timeout=self.timeout
+            )
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except OSError:
+            logger.exception(f"Could not connect to {self.host}:{self.port}")
+            self.socket = None
+            return False
+        return True
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+    def _recv_exactly(self, view):
+        while len(view):
+            n = self.socket.recv_into(view)
+            if not n:
+                raise ConnectionError("Connection closed by peer")
+            view = view[n:]
+
+    def _transaction(self, unit, pdu_length):
+        if self.socket is None and not self.connect():
+            raise ConnectionError(f"Not connected to {self.host}:{self.port}")
+
+        self._transaction_id = (self._transaction_id + 1) & 0xFFFF
+        struct.pack_into(
+            ">HHHB", self._request, 0, self._transaction_id, 0, pdu_length + 1, unit
+        )
+        self.socket.sendall(memoryview(self._request)[: 7 + pdu_length])
+
+        response = memoryview(self._response)
+        while True:
+            self._recv_exactly(response[:7])
+            transaction_id, protocol_id, length, _ = struct.unpack_from(
+                ">HHHB", response
+            )
+            # the length counts the unit id and a PDU of 1 to 253 bytes
+            if protocol_id != 0 or not 2 <= length <= 254:
+                raise ConnectionError(
+                    f"Invalid MBAP header {bytes(response[:7]).hex()} from {self.host}:{self.port}"
+                )
+            self._recv_exactly(response[7 : 6 + length])
+            if transaction_id == self._transaction_id:
+                return response[7 : 6 + length]
+            logger.debug(
+                f"Dropping response with stale transaction id {transaction_id}"
+            )
@@ -0,0 +1,99 @@
+"""Read planner, which merges the register ranges of polled ModbusNodes into as few requests as possible"""
+
+import logging
+
+logger = logging.getLogger("AutomationOne")
+
+
+class ReadBlock:
+    """A contiguous range of registers, which is read with a single request and sliced onto its nodes"""
+
+    def __init__(self, interface, unit, functionCode, address, pollRate):
+        self.interface = interface
+        self.unit = unit
+        self.functionCode = functionCode
+        self.address = address
+        self.pollRate = pollRate
+        self.count = 0
+        self.retries = 1
+        self.nodes = []
+        # set, when the device rejected the merged range, the nodes are read one by one then
+        self.split = False
+
+    @property
+    def end(self):
+        return self.address + self.count
+
+    def add(self, node):
+        self.count = max(self.end, node.address + node._count) - self.address
+        self.retries = max(self.retries, node.retries)
+        self.nodes.append(node)
+
+    def read(self, no_onchange_forward=False):
+        return self.interface.readBlock(self, no_onchange_forward=no_onchange_forward)
+
+    def __str__(self):
+        return "ReadBlock unit {}, functionCode {}, address {}, count {} ({})".format(
+            self.unit,
+            self.functionCode,
+            self.address,
+            self.count,
+            ", ".join(node.name for node in self.nodes),
+        )
+
+
+class ReadCycle:
+    """All blocks of an interface sharing a pollRate, which are read concurrently by pipelining engines"""
+
+    def __init__(self, interface, pollRate, blocks):
+        self.interface = interface
+        self.pollRate = pollRate
+        self.blocks = blocks
+
+    def read(self, no_onchange_forward=False):
+        return self.interface.readBlocks(
+            self.blocks, no_onchange_forward=no_onchange_forward
+        )
+
+    def __str__(self):
+        return "ReadCycle with pollRate {} and {} blocks".format(
+            self.pollRate, len(self.blocks)
+        )
+
+
+def plan_cycles(interface, blocks):
+    """Groups the planned blocks by their pollRate"""
+    cycles = {}
+    for block in blocks:
+        cycles.setdefault(block.pollRate, []).append(block)
+    return [
+        ReadCycle(interface, pollRate, members) for pollRate, members in cycles.items()
+    ]
+
+
+def plan_reads(interface, nodes, max_registers=125, max_gap=0):
+    """Groups the nodes by unit, functionCode and pollRate and merges their address ranges.
+
+    Two ranges are merged if they are at most max_gap registers apart and the
+    resulting request does not exceed max_registers registers.
+    """
+    groups = {}
+    for node in nodes:
+        key = (node.unit, node.functionCode, node.pollRate)
+        groups.setdefault(key, []).append(node)
+
+    blocks = []
+    for (unit, functionCode, pollRate), members in groups.items():
+        members.sort(key=lambda node: (node.address, node._count))
+        block = None
+        for node in members:
+            if block is not None:
+                gap = node.address - block.end
+                count = max(block.end, node.address + node._count) - block.address
+                if gap <= max_gap and count <= max_registers:
+                    block.add(node)
+                    continue
+            block = ReadBlock(interface, unit, functionCode, node.address, pollRate)
+            block.add(node)
+            blocks.append(block)
+    return blocks
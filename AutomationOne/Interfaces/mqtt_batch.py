@@ -0,0 +1,128 @@
+"""Batching of outgoing MQTT records into multi-value payloads"""
+
+import json
+import logging
+import threading
+
+from .mqtt_codec import PackedEncoder, binaryFormats, mapRecord, tupleRecord
+
+logger = logging.getLogger("AutomationOne")
+
+
+def lineRecord(interface, id, value, timestamp):
+    """InfluxDB line protocol record"""
+    return "{} value={} {}".format(id, value, int(timestamp * 1000000000))
+
+
+def jsonRecord(interface, id, value, timestamp):
+    return {"id": id, "value": value, "timestamp": timestamp}
+
+
+recordEncoders = {
+    "lines": lineRecord,
+    "json": jsonRecord,
+    "cbor": mapRecord,
+    "msgpack": mapRecord,
+    "packed": tupleRecord,
+}
+
+
+class PublishBatcher:
+    """Buffers encoded records per topic and publishes them as one payload.
+
+    A batch is flushed when it holds batchSize records or batchBytes bytes
+    and by the periodic flush every batchInterval milliseconds. The lines
+    format joins the records with newlines, the json, cbor and msgpack
+    formats publish them as an array and the packed format as packed struct
+    frames (see mqtt_codec).
+    """
+
+    def __init__(
+        self,
+        interface,
+        batchSize=500,
+        batchBytes=65536,
+        batchInterval=1000,
+        batchFormat="lines",
+    ):
+        self.interface = interface
+        self.batchSize = batchSize
+        self.batchBytes = batchBytes
+        self.batchInterval = batchInterval
+        if batchFormat not in recordEncoders:
+            logger.warning(
+                f"[{interface.name}] Unknown batch_format '{batchFormat}'. Using lines."
+            )
+            batchFormat = "lines"
+        self.batchFormat = batchFormat
+        self._packed = {}
+
+        self.records = 0
+        self.payloads = 0
+
+        self._batches = {}
+        self._lock = threading.Lock()
+
+    def _size(self, record):
+        if self.batchFormat == "json":
+            return len(json.dumps(record)) + 1
+        if self.batchFormat in binaryFormats:
+            return len(binaryFormats[self.batchFormat](record))
+        if self.batchFormat == "packed":
+            return 9
+        if isinstance(record, bytes):
+            return len(record) + 1
+        return len(record.encode("UTF-8")) + 1
+
+    def add(self, record, topicPub=None):
+        size = self._size(record)
+        with self._lock:
+            batch = self._batches.get(topicPub)
+            if batch is None:
+                batch = self._batches[topicPub] = [[], 0]
+            batch[0].append(record)
+            batch[1] += size
+            self.records += 1
+            if len(batch[0]) < self.batchSize and batch[1] < self.batchBytes:
+                return True
+            del self._batches[topicPub]
+        return self._publish(batch[0], topicPub)
+
+    def flush(self):
+        """Publishes all buffered records"""
+        with self._lock:
+            batches, self._batches = self._batches, {}
+        success = True
+        for topicPub, (records, _) in batches.items():
+            success = self._publish(records, topicPub) and success
+        return success
+
+    def encode(self, records, topicPub=None):
+        if self.batchFormat == "json":
+            return json.dumps(records)
+        if self.batchFormat in binaryFormats:
+            return binaryFormats[self.batchFormat](records)
+        if self.batchFormat == "packed":
+            encoder = self._packed.get(topicPub)
+            if encoder is None:
+                encoder = self._packed[topicPub] = PackedEncoder()
+            return encoder.encode(records)
+        if records and isinstance(records[0], bytes):
+            return b"\n".join(records)
+        return "\n".join(records)
+
+    def _publish(self, records, topicPub):
+        self.payloads += 1
+        logger.debug(
+            f"[{self.interface.name}] Publishing a batch of {len(records)} records"
+        )
+        return self.interface.publish(self.encode(records, topicPub), topicPub)
+
+    def metrics(self):
+        with self._lock:
+            buffered = sum(len(records) for records, _ in self._batches.values())
+        return {
+            "records": self.records,
+            "payloads": self.payloads,
+            "buffered": buffered,
+        }
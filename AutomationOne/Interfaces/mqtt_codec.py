@@ -0,0 +1,463 @@
+"""Compact binary payload formats for MQTT: CBOR, MessagePack and packed struct frames.
+
+The encoders support None, bool, int (64 bit), float, str, bytes, lists,
+tuples and dicts. Floats are sent as float32 if that is lossless, so every
+decoder returns exactly the encoded values.
+"""
+
+import struct
+import threading
+import time
+
+_float32 = struct.Struct(">f")
+_float64 = struct.Struct(">d")
+
+
+def _isFloat32(value):
+    try:
+        return _float32.unpack(_float32.pack(value))[0] == value
+    except OverflowError:
+        return False
+
+
+# ******** CBOR (RFC 8949) ********
+
+
+def _cborHead(out, major, n):
+    major <<= 5
+    if n < 24:
+        out.append(major | n)
+    elif n < 0x100:
+        out += bytes((major | 24, n))
+    elif n < 0x10000:
+        out.append(major | 25)
+        out += n.to_bytes(2, "big")
+    elif n < 0x100000000:
+        out.append(major | 26)
+        out += n.to_bytes(4, "big")
+    elif n < 0x10000000000000000:
+        out.append(major | 27)
+        out += n.to_bytes(8, "big")
+    else:
+        raise ValueError(f"Integer {n} does not fit into 64 bits")
+
+
+def _cborEncode(out, value):
+    if value is None:
+        out.append(0xF6)
+    elif value is True:
+        out.append(0xF5)
+    elif value is False:
+        out.append(0xF4)
+    elif isinstance(value, int):
+        if value >= 0:
+            _cborHead(out, 0, value)
+        else:
+            _cborHead(out, 1, -1 - value)
+    elif isinstance(value, float):
+        if _isFloat32(value):
+            out.append(0xFA)
+            out += _float32.pack(value)
+        else:
+            out.append(0xFB)
+            out += _float64.pack(value)
+    elif isinstance(value, str):
+        data = value.encode("UTF-8")
+        _cborHead(out, 3, len(data))
+        out += data
+    elif isinstance(value, (bytes, bytearray)):
+        _cborHead(out, 2, len(value))
+        out += value
+    elif isinstance(value, (list, tuple)):
+        _cborHead(out, 4, len(value))
+        for item in value:
+            _cborEncode(out, item)
+    elif isinstance(value, dict):
+        _cborHead(out, 5, len(value))
+        for key, item in value.items():
+            _cborEncode(out, key)
+            _cborEncode(out, item)
+    else:
+        raise TypeError(f"Cannot encode {type(value).__name__} as CBOR")
+
+
+def cborDumps(value):
+    out = bytearray()
+    _cborEncode(out, value)
+    return bytes(out)
+
+
+def _cborDecode(data, i):
+    initial = data[i]
+    major = initial >> 5
+    info = initial & 0x1F
+    i += 1
+    if major == 7:
+        if info == 20:
+            return False, i
+        if info == 21:
+            return True, i
+        if info == 22:
+            return None, i
+        if info == 25:
+            return struct.unpack_from(">e", data, i)[0], i + 2
+        if info == 26:
+            return _float32.unpack_from(data, i)[0], i + 4
+        if info == 27:
+            return _float64.unpack_from(data, i)[0], i + 8
+        raise ValueError(f"Unsupported CBOR simple value {info}")
+    if info < 24:
+        n = info
+    elif info <= 27:
+        size = 1 << (info - 24)
+        n = int.from_bytes(data[i : i + size], "big")
+        i += size
+    else:
+        raise ValueError(f"Unsupported CBOR additional information {info}")
+    if major == 0:
+        return n, i
+    if major == 1:
+        return -1 - n, i
+    if major == 2:
+        return bytes(data[i : i + n]), i + n
+    if major == 3:
+        return bytes(data[i : i + n]).decode("UTF-8"), i + n
+    if major == 4:
+        result = []
+        for _ in range(n):
+            item, i = _cborDecode(data, i)
+            result.append(item)
+        return result, i
+    if major == 5:
+        result = {}
+        for _ in range(n):
+            key, i = _cborDecode(data, i)
+            result[key], i = _cborDecode(data, i)
+        return result, i
+    raise ValueError(f"Unsupported CBOR major type {major}")
+
+
+def cborLoads(data):
+    value, _ = _cborDecode(data, 0)
+    return value
+
+
+# ******** MessagePack ********
+
+
+def _msgpackLength(out, n, fix, fixLimit, codes):
+    if n < fixLimit:
+        out.append(fix | n)
+    elif n < 0x100 and codes[0] is not None:
+        out += bytes((codes[0], n))
+    elif n < 0x10000:
+        out.append(codes[1])
+        out += n.to_bytes(2, "big")
+    else:
+        out.append(codes[2])
+        out += n.to_bytes(4, "big")
+
+
+def _msgpackEncode(out, value):
+    if value is None:
+        out.append(0xC0)
+    elif value is True:
+        out.append(0xC3)
+    elif value is False:
+        out.append(0xC2)
+    elif isinstance(value, int):
+        if 0 <= value < 0x80:
+            out.append(value)
+        elif -32 <= value < 0:
+            out.append(value & 0xFF)
+        elif value >= 0:
+            for code, size in ((0xCC, 1), (0xCD, 2), (0xCE, 4), (0xCF, 8)):
+                if value < 1 << (8 * size):
+                    out.append(code)
+                    out += value.to_bytes(size, "big")
+                    return
+            raise ValueError(f"Integer {value} does not fit into 64 bits")
+        else:
+            for code, size in ((0xD0, 1), (0xD1, 2), (0xD2, 4), (0xD3, 8)):
+                if value >= -(1 << (8 * size - 1)):
+                    out.append(code)
+                    out += value.to_bytes(size, "big", signed=True)
+                    return
+            raise ValueError(f"Integer {value} does not fit into 64 bits")
+    elif isinstance(value, float):
+        if _isFloat32(value):
+            out.append(0xCA)
+            out += _float32.pack(value)
+        else:
+            out.append(0xCB)
+            out += _float64.pack(value)
+    elif isinstance(value, str):
+        data = value.encode("UTF-8")
+        _msgpackLength(out, len(data), 0xA0, 32, (0xD9, 0xDA, 0xDB))
+        out += data
+    elif isinstance(value, (bytes, bytearray)):
+        _msgpackLength(out, len(value), 0, 0, (0xC4, 0xC5, 0xC6))
+        out += value
+    elif isinstance(value, (list, tuple)):
+        _msgpackLength(out, len(value), 0x90, 16, (None, 0xDC, 0xDD))
+        for item in value:
+            _msgpackEncode(out, item)
+    elif isinstance(value, dict):
+        _msgpackLength(out, len(value), 0x80, 16, (None, 0xDE, 0xDF))
+        for key, item in value.items():
+            _msgpackEncode(out, key)
+            _msgpackEncode(out, item)
+    else:
+        raise TypeError(f"Cannot encode {type(value).__name__} as MessagePack")
+
+
+def msgpackDumps(value):
+    out = bytearray()
+    _msgpackEncode(out, value)
+    return bytes(out)
+
+
+_msgpackInts = {
+    0xCC: (1, False),
+    0xCD: (2, False),
+    0xCE: (4, False),
+    0xCF: (8, False),
+    0xD0: (1, True),
+    0xD1: (2, True),
+    0xD2: (4, True),
+    0xD3: (8, True),
+}
+_msgpackLengths = {
+    0xD9: ("str", 1),
+    0xDA: ("str", 2),
+    0xDB: ("str", 4),
+    0xC4: ("bin", 1),
+    0xC5: ("bin", 2),
+    0xC6: ("bin", 4),
+    0xDC: ("array", 2),
+    0xDD: ("array", 4),
+    0xDE: ("map", 2),
+    0xDF: ("map", 4),
+}
+
+
+def _msgpackDecode(data, i):
+    code = data[i]
+    i += 1
+    if code < 0x80:
+        return code, i
+    if code >= 0xE0:
+        return code - 0x100, i
+    if code == 0xC0:
+        return None, i
+    if code == 0xC2:
+        return False, i
+    if code == 0xC3:
+        return True, i
+    if code == 0xCA:
+        return _float32.unpack_from(data, i)[0], i + 4
+    if code == 0xCB:
+        return _float64.unpack_from(data, i)[0], i + 8
+    if code in _msgpackInts:
+        size, signed = _msgpackInts[code]
+        return int.from_bytes(data[i : i + size], "big", signed=signed), i + size
+    if 0xA0 <= code < 0xC0:
+        kind, n = "str", code & 0x1F
+    elif 0x90 <= code < 0xA0:
+        kind, n = "array", code & 0x0F
+    elif 0x80 <= code < 0x90:
+        kind, n = "map", code & 0x0F
+    elif code in _msgpackLengths:
+        kind, size = _msgpackLengths[code]
+        n = int.from_bytes(data[i : i + size], "big")
+        i += size
+    else:
+        raise ValueError(f"Unsupported MessagePack type 0x{code:02x}")
+    if kind == "str":
+        return bytes(data[i : i + n]).decode("UTF-8"), i + n
+    if kind == "bin":
+        return bytes(data[i : i + n]), i + n
+    if kind == "array":
+        result = []
+        for _ in range(n):
+            item, i = _msgpackDecode(data, i)
+            result.append(item)
+        return result, i
+    result = {}
+    for _ in range(n):
+        key, i = _msgpackDecode(data, i)
+        result[key], i = _msgpackDecode(data, i)
+    return result, i
+
+
+def msgpackLoads(data):
+    value, _ = _msgpackDecode(data, 0)
+    return value
+
+
+# ******** Packed struct frames ********
+
+TABLE_FRAME = 0x01
+DATA_FRAME = 0x02
+
+_tableHeader = struct.Struct(">BH")  # frame type, entries
+_dataHeader = struct.Struct(">BdH")  # frame type, base timestamp, entries
+_entryHeader = struct.Struct(">HHB")  # node index, timestamp offset in ms, value type
+
+_NONE, _FALSE, _TRUE, _INT32, _INT64, _FLOAT32, _FLOAT64, _STR = range(8)
+_int32 = struct.Struct(">i")
+_int64 = struct.Struct(">q")
+
+
+class PackedEncoder:
+    """Encodes (id, value, timestamp) records into packed struct frames.
+
+    A table frame assigns a 16 bit index to every node ID. It is sent
+    before the first data frame, whenever new IDs show up and every
+    tableInterval frames, so a receiver, which connects later, can pick
+    it up. Data frames only carry the index, the timestamp offset to the
+    frame base in milliseconds and the typed value of each record. Records
+    spanning more than 65.5 seconds are split into several data frames.
+    """
+
+    def __init__(self, tableInterval=100):
+        self.tableInterval = tableInterval
+        self.ids = {}
+        self._frames = 0
+        self._lock = threading.Lock()
+
+    def _table(self):
+        out = bytearray(_tableHeader.pack(TABLE_FRAME, len(self.ids)))
+        for id, index in self.ids.items():
+            data = str(id).encode("UTF-8")
+            out += struct.pack(">HB", index, len(data))
+            out += data
+        return out
+
+    def encode(self, records):
+        with self._lock:
+            newIds = False
+            for id, _, _ in records:
+                if id not in self.ids:
+                    self.ids[id] = len(self.ids)
+                    newIds = True
+            out = bytearray()
+            if newIds or self._frames % self.tableInterval == 0:
+                out += self._table()
+            self._frames += 1
+            start = 0
+            for end in range(1, len(records) + 1):
+                if end == len(records) or not (
+                    0 <= records[end][2] - records[start][2] < 65.5
+                ):
+                    self._data(out, records[start:end])
+                    start = end
+            if not records:
+                self._data(out, records)
+            return bytes(out)
+
+    def _data(self, out, records):
+        base = records[0][2] if records else 0
+        out += _dataHeader.pack(DATA_FRAME, base, len(records))
+        for id, value, timestamp in records:
+            index = self.ids[id]
+            offset = int((timestamp - base) * 1000 + 0.5)
+            if value is None:
+                out += _entryHeader.pack(index, offset, _NONE)
+            elif value is True or value is False:
+                out += _entryHeader.pack(index, offset, _TRUE if value else _FALSE)
+            elif isinstance(value, int) and -(1 << 31) <= value < 1 << 31:
+                out += _entryHeader.pack(index, offset, _INT32)
+                out += _int32.pack(value)
+            elif isinstance(value, int):
+                out += _entryHeader.pack(index, offset, _INT64)
+                out += _int64.pack(value)
+            elif isinstance(value, float) and _isFloat32(value):
+                out += _entryHeader.pack(index, offset, _FLOAT32)
+                out += _float32.pack(value)
+            elif isinstance(value, float):
+                out += _entryHeader.pack(index, offset, _FLOAT64)
+                out += _float64.pack(value)
+            else:
+                data = str(value).encode("UTF-8")
+                out += _entryHeader.pack(index, offset, _STR)
+                out += struct.pack(">H", len(data))
+                out += data
+
+
+class PackedDecoder:
+    """Receiving side of the PackedEncoder. decode() returns the (id, value, timestamp) records of a payload."""
+
+    def __init__(self):
+        self.ids = {}
+
+    def decode(self, payload):
+        records = []
+        i = 0
+        while i < len(payload):
+            frameType = payload[i]
+            if frameType == TABLE_FRAME:
+                _, count = _tableHeader.unpack_from(payload, i)
+                i += _tableHeader.size
+                for _ in range(count):
+                    index, length = struct.unpack_from(">HB", payload, i)
+                    i += 3
+                    self.ids[index] = bytes(payload[i : i + length]).decode("UTF-8")
+                    i += length
+            elif frameType == DATA_FRAME:
+                _, base, count = _dataHeader.unpack_from(payload, i)
+                i += _dataHeader.size
+                for _ in range(count):
+                    index, offset, kind = _entryHeader.unpack_from(payload, i)
+                    i += _entryHeader.size
+                    if kind == _NONE:
+                        value = None
+                    elif kind in (_FALSE, _TRUE):
+                        value = kind == _TRUE
+                    elif kind == _INT32:
+                        value = _int32.unpack_from(payload, i)[0]
+                        i += 4
+                    elif kind == _INT64:
+                        value = _int64.unpack_from(payload, i)[0]
+                        i += 8
+                    elif kind == _FLOAT32:
+                        value = _float32.unpack_from(payload, i)[0]
+                        i += 4
+                    elif kind == _FLOAT64:
+                        value = _float64.unpack_from(payload, i)[0]
+                        i += 8
+                    else:
+                        (length,) = struct.unpack_from(">H", payload, i)
+                        value = bytes(payload[i + 2 : i + 2 + length]).decode("UTF-8")
+                        i += 2 + length
+                    if index not in self.ids:
+                        raise KeyError(
+                            f"Node index {index} is unknown. The table frame was not received yet."
+                        )
+                    records.append((self.ids[index], value, base + offset / 1000))
+            else:
+                raise ValueError(f"Unknown packed frame type {frameType}")
+        return records
+
+
+# ******** Record encoders ********
+
+
+def mapRecord(interface, id, value, timestamp):
+    return {"i": id, "v": value, "t": timestamp}
+
+
+def tupleRecord(interface, id, value, timestamp):
+    return (id, value, timestamp)
+
+
+binaryFormats = {"cbor": cborDumps, "msgpack": msgpackDumps}
+
+
+def binaryEncoder(dumps):
+    """Classic encoder publishing every value as a single {"i", "v", "t"} map"""
+
+    def encoder(interface, id, value, topicPub=None):
+        interface.publish(dumps(mapRecord(interface, id, value, time.time())), topicPub)
+
+    return encoder
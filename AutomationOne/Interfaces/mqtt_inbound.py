@@ -0,0 +1,140 @@
+"""Bounded worker queues, which process incoming MQTT messages off the network thread"""
+
+import logging
+import queue
+import threading
+import time
+import zlib
+
+logger = logging.getLogger("AutomationOne")
+
+inboundPolicies = ("drop_oldest", "drop_newest", "block")
+
+
+class InboundWorker:
+    """One worker thread with its own bounded queue"""
+
+    def __init__(self, dispatcher, index, size):
+        self.dispatcher = dispatcher
+        self.queue = queue.Queue(maxsize=size)
+        self.processed = 0
+        self.dropped = 0
+        self.maxDepth = 0
+        self.totalLatency = 0
+        self.maxLatency = 0
+        self.thread = threading.Thread(
+            target=self._run,
+            name=f"mqtt-inbound-{dispatcher.name}-{index}",
+            daemon=True,
+        )
+        self.thread.start()
+
+    def put(self, message, userdata, policy):
+        item = (time.monotonic(), message, userdata)
+        if policy == "block":
+            self.queue.put(item)
+        else:
+            while True:
+                try:
+                    self.queue.put_nowait(item)
+                    break
+                except queue.Full:
+                    if policy == "drop_newest":
+                        self._drop(message)
+                        return False
+                    try:
+                        _, oldest, _ = self.queue.get_nowait()
+                    except queue.Empty:
+                        continue
+                    self._drop(oldest)
+        depth = self.queue.qsize()
+        if depth > self.maxDepth:
+            self.maxDepth = depth
+        return True
+
+    def _drop(self, message):
+        self.dropped += 1
+        if self.dropped == 1 or self.dropped % 1000 == 0:
+            logger.warning(
+                f"[{self.dispatcher.name}] Inbound queue is full. Dropped message with topic {message.topic} ({self.dropped} dropped in total)."
+            )
+
+    def stop(self):
+        self.queue.put(None)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            enqueued, message, userdata = item
+            latency = time.monotonic() - enqueued
+            self.totalLatency += latency
+            if latency > self.maxLatency:
+                self.maxLatency = latency
+            try:
+                self.dispatcher.handle(message, userdata)
+            except Exception:
+                logger.exception(
+                    f"[{self.dispatcher.name}] Exception while processing message with topic {message.topic}"
+                )
+            self.processed += 1
+
+    def metrics(self):
+        return {
+            "depth": self.queue.qsize(),
+            "maxDepth": self.maxDepth,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "meanLatency": self.totalLatency / self.processed if self.processed else 0,
+            "maxLatency": self.maxLatency,
+        }
+
+
+class InboundDispatcher:
+    """Distributes the incoming messages over worker threads.
+
+    All messages of a topic go to the same worker, so they are processed in
+    the order of arrival. If the queue of a worker is full, the policy
+    decides: block (the default) makes the network thread wait
+    (backpressure), so no message is lost, drop_oldest discards the oldest
+    queued message and drop_newest the incoming one.
+    """
+
+    def __init__(self, name, handle, workers=1, queueSize=1000, policy="block"):
+        self.name = name
+        self.handle = handle
+        if policy not in inboundPolicies:
+            logger.warning(
+                f"[{name}] Unknown inbound_policy '{policy}'. Using block."
+            )
+            policy = "block"
+        self.policy = policy
+        self.received = 0
+        self.workers = [InboundWorker(self, i, queueSize) for i in range(workers)]
+
+    def put(self, message, userdata=None):
+        self.received += 1
+        if len(self.workers) == 1:
+            worker = self.workers[0]
+        else:
+            topic = message.topic.encode("UTF-8")
+            worker = self.workers[zlib.crc32(topic) % len(self.workers)]
+        return worker.put(message, userdata, self.policy)
+
+    def stop(self):
+        for worker in self.workers:
+            worker.stop()
+        for worker in self.workers:
+            worker.thread.join(5)
+
+    def metrics(self):
+        workers = [worker.metrics() for worker in self.workers]
+        return {
+            "received": self.received,
+            "processed": sum(worker["processed"] for worker in workers),
+            "dropped": sum(worker["dropped"] for worker in workers),
+            "depth": sum(worker["depth"] for worker in workers),
+            "policy": self.policy,
+            "workers": workers,
+        }
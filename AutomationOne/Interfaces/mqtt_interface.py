@@ -1,34 +1,34 @@
 import logging
 import time
 
+from datetime import timedelta
+
 import paho.mqtt.client as mqtt
 from paho.mqtt import __version__ as MQTT_VERSION
 
 from .interface import Interface
+from .mqtt_batch import PublishBatcher, lineRecord, recordEncoders
+from .mqtt_codec import PackedEncoder, binaryEncoder, binaryFormats
+from .mqtt_inbound import InboundDispatcher
+from .mqtt_parsers import parsers
+from .mqtt_router import TopicRouter
+from .mqtt_store import OutboundStore
 
 logger = logging.getLogger("AutomationOne")
 
 
-def ultralight2(interface, userdata, message):
-    payload = message.payload
-    array = payload.decode("UTF-8").split("|")
-    keys = array[::2]
-    values = array[1::2]
-    if len(values) != len(keys):
-        logger.warning(
-            "Syntax error in ultralight2 payload {} (odd number of sections)".format(
-                payload
-            )
-        )
-    for i in range(len(values)):
-        interface.setValue(keys[i], values[i])
-
-
 def simpleEncoder(interface, id, value, topicPub=None):
-    payload = "{} value={} {}".format(id, value, int(time.time() * 1000000000))
+    payload = lineRecord(interface, id, value, time.time())
     interface.publish(payload, topicPub)
 
 
+def packedEncoder(interface, id, value, topicPub=None):
+    encoder = interface.packedEncoders.get(topicPub)
+    if encoder is None:
+        encoder = interface.packedEncoders.setdefault(topicPub, PackedEncoder())
+    interface.publish(encoder.encode([(id, value, time.time())]), topicPub)
+
+
 class MqttInterface(Interface):
     def __init__(self, handler, config):
         super().__init__(handler, config)
@@ -53,23 +53,78 @@ class MqttInterface(Interface):
         self.topicPub = config.get("topicPub", "")
 
         self.parserName = config.get("parser", None)
-        if self.parserName == "ultralight2":
-            self.parser = ultralight2
+        callback = None
+        if self.parserName and handler.callbackModule is not None:
+            callback = getattr(handler.callbackModule, self.parserName, None)
+        if self.parserName in parsers and callback is not None:
+            logger.warning(
+                f"[{self.name}] The callback {self.parserName} replaces the built-in parser with the same name."
+            )
+            self.parser = callback
+        elif self.parserName in parsers:
+            self.parser = parsers[self.parserName](self, config)
         elif self.parserName:
             self.parser = getattr(handler.callbackModule, self.parserName)
         else:
             self.parser = None
             logger.info(
-                f"MQTT Interface {self.name} has no parser given. Ignoring incoming messages..."
+                f"MQTT Interface {self.name} has no parser given. Ignoring incoming messages, which are not routed to a node by its topicSub."
             )
 
+        self.router = TopicRouter(config.get("route_cache_size", 10000))
+        self.inbound_workers = config.get("inbound_workers", 1)
+        self.inbound = None
+
         self.encoderName = config.get("encoder", "simple")
+        self.packedEncoders = {}
         if self.encoderName == "simple":
             self._encoder = simpleEncoder
+        elif self.encoderName in binaryFormats:
+            self._encoder = binaryEncoder(binaryFormats[self.encoderName])
+        elif self.encoderName == "packed":
+            self._encoder = packedEncoder
         else:
             self._encoder = getattr(handler.callbackModule, self.encoderName)
 
-        self.encoder = lambda *args, **kwargs: self._encoder(self, *args, **kwargs)
+        if any(
+            key in config for key in ("batch_size", "batch_bytes", "batch_interval")
+        ):
+            self.batcher = PublishBatcher(
+                self,
+                batchSize=config.get("batch_size", 500),
+                batchBytes=config.get("batch_bytes", 65536),
+                batchInterval=config.get("batch_interval", 1000),
+                batchFormat=config.get("batch_format", "lines"),
+            )
+            self.recordEncoderName = config.get(
+                "recordEncoder", self.batcher.batchFormat
+            )
+            if self.recordEncoderName in recordEncoders:
+                self.recordEncoder = recordEncoders[self.recordEncoderName]
+            else:
+                self.recordEncoder = getattr(
+                    handler.callbackModule, self.recordEncoderName
+                )
+            if self.encoderName != "simple":
+                logger.warning(
+                    f"MQTT Interface {self.name} publishes batches. The encoder {self.encoderName} is ignored, use a recordEncoder instead."
+                )
+            self.encoder = self._batchEncoder
+        else:
+            self.batcher = None
+            self.encoder = lambda *args, **kwargs: self._encoder(self, *args, **kwargs)
+        self.storePath = config.get("store")
+        if self.storePath:
+            self.store = OutboundStore(
+                self.storePath,
+                maxBytes=config.get("store_max_bytes", 64 * 1024 * 1024),
+                segmentBytes=config.get("store_segment_bytes", 1024 * 1024),
+                syncRecords=config.get("store_sync_records", 100),
+                name=self.name,
+            )
+            self.store_drain_rate = config.get("store_drain_rate", 100)
+        else:
+            self.store = None
         self.dryrun = config.get("dryrun", False)
         self.transport = config.get("transport", "tcp")
         self.subs = {}
@@ -107,17 +162,82 @@ class MqttInterface(Interface):
         else:
             self.client.connect_async(self.host, self.port, self.keepalive)
 
+    def _batchEncoder(self, id, value, topicPub=None):
+        record = self.recordEncoder(self, id, value, time.time())
+        return self.batcher.add(record, topicPub)
+
+    def get_timeloop_callbacks(self):
+        callbacks = super().get_timeloop_callbacks()
+        if self.batcher:
+            callbacks.append(
+                (
+                    self.batcher.flush,
+                    timedelta(milliseconds=self.batcher.batchInterval),
+                )
+            )
+        if self.store:
+            callbacks.append((self.store.flush, timedelta(seconds=1)))
+            callbacks.append((self._drainStore, timedelta(seconds=0.1)))
+        return callbacks
+
+    def _drainStore(self):
+        """Forwards stored messages at store_drain_rate messages per second"""
+        if not self.store.backlog() or not self.client.is_connected():
+            return
+        count = 0
+        position = None
+        for topicPub, payload, next_position in self.store.read(
+            max(1, int(self.store_drain_rate * 0.1))
+        ):
+            if not self.dryrun:
+                info = self.client.publish(topicPub, payload)
+                if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                    break
+            count += 1
+            position = next_position
+        if position is not None:
+            self.store.ack(position, count)
+            logger.debug(
+                f"Forwarded {count} stored messages via Interface {self.name}."
+            )
+
     def appendSub(self, topicSub):
         self.topicSubList.append(topicSub)
 
     def on_message(self, client, userdata, message):
+        if self.inbound:
+            self.inbound.put(message, userdata)
+        else:
+            self._process(message, userdata)
+
+    def registerRoute(self, topicSub, handler):
+        """Dispatches the messages matching the topic filter topicSub to handler(message)
+        instead of the parser of the interface"""
+        self.router.add(topicSub, handler)
+
+    def _process(self, message, userdata=None):
         topic = message.topic
         payload = message.payload
         logger.debug(
             "Received MQTT message with topic {} and payload {}.".format(topic, payload)
         )
-        if self.parser:
-            self.parser(self, userdata, message)
+        handlers = self.router.match(topic) if self.router.routes else ()
+        if handlers:
+            with self.handler.changeWave():
+                for handler in handlers:
+                    handler(message)
+        elif self.parser:
+            with self.handler.changeWave():
+                self.parser(self, userdata, message)
+
+    def getQueueMetrics(self):
+        """Returns the inbound queue metrics and the counters of the batcher and the store"""
+        metrics = self.inbound.metrics() if self.inbound else {}
+        if self.batcher:
+            metrics["batch"] = self.batcher.metrics()
+        if self.store:
+            metrics["store"] = self.store.metrics()
+        return metrics
 
     def on_connect(self, client, userdata, flags, rc):
         if rc == 0:
@@ -162,6 +282,14 @@ class MqttInterface(Interface):
 
     def start(self):
         super().start()
+        if (self.parser or self.router.routes) and self.inbound_workers > 0:
+            self.inbound = InboundDispatcher(
+                self.name,
+                self._process,
+                workers=self.inbound_workers,
+                queueSize=self.config.get("inbound_queue_size", 1000),
+                policy=self.config.get("inbound_policy", "block"),
+            )
         self.client.loop()
         if not self.client.is_connected():
             logger.warning(
@@ -171,7 +299,14 @@ class MqttInterface(Interface):
 
     def stop(self):
         super().stop()
+        if self.batcher:
+            self.batcher.flush()
         self.client.loop_stop()
+        if self.store:
+            self.store.close()
+        if self.inbound:
+            self.inbound.stop()
+            self.inbound = None
 
     def registerSubscriber(self, id, node):
         if id in self.subs:
@@ -203,6 +338,12 @@ class MqttInterface(Interface):
         if not topicPub:
             topicPub = self.topicPub
         if not self.client.is_connected():
+            if self.store:
+                logger.debug(
+                    f"Storing payload {payload} for topic {topicPub} until Interface {self.name} is connected."
+                )
+                self.store.append(topicPub, payload)
+                return True
             logger.error(
                 f"Could not Publish via Interface {self.name} to topic {topicPub} with payload {payload} due to not being connected!"
             )
@@ -219,5 +360,7 @@ class MqttInterface(Interface):
                 self.name, topicPub, payload
             )
         )
-        self.client.publish(topicPub, payload)
+        info = self.client.publish(topicPub, payload)
+        if self.store and info.rc != mqtt.MQTT_ERR_SUCCESS:
+            self.store.append(topicPub, payload)
         return True
@@ -0,0 +1,210 @@
+"""Built-in parsers for incoming MQTT payloads, selected by parser: in the interface config.
+
+The parsers work on the raw payload bytes and look up the subscribed nodes
+before any value is decoded or converted, so keys without a subscriber cost
+almost nothing.
+"""
+
+import json
+import logging
+
+from abc import ABC, abstractmethod
+
+logger = logging.getLogger("AutomationOne")
+
+
+class Parser(ABC):
+    """Base class of the built-in parsers, which keeps the lookup from key bytes to node.
+    Subclasses, which do not implement __call__, can not be instantiated."""
+
+    def __init__(self, interface, config=None):
+        self.interface = interface
+        self.config = config or {}
+        self._lookup = {}
+        self._subscribers = -1
+
+    def lookup(self):
+        subs = self.interface.subs
+        if len(subs) != self._subscribers:
+            self._lookup = self.compile(subs)
+            self._subscribers = len(subs)
+        return self._lookup
+
+    def compile(self, subs):
+        return {str(id).encode("UTF-8"): node for id, node in subs.items()}
+
+    @abstractmethod
+    def __call__(self, interface, userdata, message):
+        """Sets the values of the payload of message on the subscribed nodes"""
+
+
+class Ultralight2Parser(Parser):
+    """key1|value1|key2|value2..."""
+
+    def __call__(self, interface, userdata, message):
+        lookup = self.lookup()
+        array = message.payload.split(b"|")
+        if len(array) % 2:
+            logger.warning(
+                "Syntax error in ultralight2 payload {} (odd number of sections)".format(
+                    message.payload
+                )
+            )
+        for key, value in zip(array[::2], array[1::2]):
+            node = lookup.get(key)
+            if node is not None:
+                node.setValue(value.decode("UTF-8"))
+
+
+def _loads(payload):
+    if isinstance(payload, (bytes, bytearray)):
+        # decoding first is faster than letting json detect the encoding
+        payload = payload.decode("UTF-8")
+    return json.loads(payload)
+
+
+class JsonParser(Parser):
+    """Flat JSON object {"key": value, ...}"""
+
+    def compile(self, subs):
+        return dict(subs)
+
+    def __call__(self, interface, userdata, message):
+        lookup = self.lookup()
+        parsed = _loads(message.payload)
+        if not isinstance(parsed, dict):
+            logger.warning(f"JSON payload {message.payload} is not an object.")
+            return
+        for key, value in parsed.items():
+            node = lookup.get(key)
+            if node is not None:
+                node.setValue(value)
+
+
+class JsonPathParser(Parser):
+    """Nested JSON, mapped by parser_paths: {mqttID: "path.to.0.value"}"""
+
+    def compile(self, subs):
+        paths = []
+        for id, path in self.config.get("parser_paths", {}).items():
+            node = subs.get(id)
+            if node is None:
+                continue
+            keys = tuple(int(key) if key.isdigit() else key for key in path.split("."))
+            paths.append((keys, node))
+        return paths
+
+    def __call__(self, interface, userdata, message):
+        paths = self.lookup()
+        if not paths:
+            return
+        parsed = _loads(message.payload)
+        for keys, node in paths:
+            value = parsed
+            try:
+                for key in keys:
+                    value = value[key]
+            except (KeyError, IndexError, TypeError):
+                continue
+            node.setValue(value)
+
+
+def _influxValue(raw):
+    if raw[-1:] in (b"i", b"u"):
+        return int(raw[:-1])
+    if raw[:1] == b'"':
+        return raw[1:-1].decode("UTF-8")
+    if raw in (b"t", b"T", b"true", b"True", b"TRUE"):
+        return True
+    if raw in (b"f", b"F", b"false", b"False", b"FALSE"):
+        return False
+    return float(raw)
+
+
+class InfluxParser(Parser):
+    """InfluxDB line protocol. The field value of a measurement is mapped to the
+    mqttID measurement, all other fields to measurement.field"""
+
+    def __call__(self, interface, userdata, message):
+        lookup = self.lookup()
+        for line in message.payload.split(b"\n"):
+            if not line or line[:1] == b"#":
+                continue
+            parts = line.split(b" ")
+            if len(parts) < 2:
+                logger.warning(f"Syntax error in line protocol {line}")
+                continue
+            measurement = parts[0].split(b",", 1)[0]
+            for field in parts[1].split(b","):
+                name, _, raw = field.partition(b"=")
+                if name == b"value":
+                    node = lookup.get(measurement)
+                else:
+                    node = lookup.get(measurement + b"." + name)
+                if node is None:
+                    continue
+                try:
+                    value = _influxValue(raw)
+                except ValueError:
+                    logger.warning(f"Invalid field value {raw} in line {line}")
+                    continue
+                node.setValue(value)
+
+
+parsers = {
+    "ultralight2": Ultralight2Parser,
+    "json": JsonParser,
+    "json_paths": JsonPathParser,
+    "influx": InfluxParser,
+}
+
+
+# Node level parsers, which extract the value of a single node from the payload
+# of a message routed to it by its topicSub. They return skip if the payload
+# does not contain a value for the node.
+
+skip = object()
+
+
+def rawNodeParser(node, payload):
+    return payload.decode("UTF-8")
+
+
+def jsonNodeParser(node, payload):
+    value = _loads(payload)
+    for key in node.jsonPath:
+        try:
+            value = value[key]
+        except (KeyError, IndexError, TypeError):
+            return skip
+    return value
+
+
+def ultralight2NodeParser(node, payload):
+    array = payload.split(b"|")
+    key = node.mqttID.encode("UTF-8")
+    for i in range(0, len(array) - 1, 2):
+        if array[i] == key:
+            return array[i + 1].decode("UTF-8")
+    return skip
+
+
+def influxNodeParser(node, payload):
+    key = node.mqttID.encode("UTF-8")
+    for line in payload.split(b"\n"):
+        parts = line.split(b" ")
+        if len(parts) < 2 or parts[0].split(b",", 1)[0] != key:
+            continue
+        for field in parts[1].split(b","):
+            name, _, raw = field.partition(b"=")
+            if name == b"value":
+                return _influxValue(raw)
+    return skip
+
+
+nodeParsers = {
+    "raw": rawNodeParser,
+    "json": jsonNodeParser,
+    "ultralight2": ultralight2NodeParser,
+    "influx": influxNodeParser,
+}
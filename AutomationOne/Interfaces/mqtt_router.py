@@ -0,0 +1,71 @@
+"""Topic router, which dispatches incoming MQTT messages directly to the nodes subscribed to their topic"""
+
+import logging
+import threading
+
+logger = logging.getLogger("AutomationOne")
+
+
+class TrieNode:
+    __slots__ = ("children", "handlers")
+
+    def __init__(self):
+        self.children = {}
+        self.handlers = []
+
+
+class TopicRouter:
+    """Trie of topic filters with support for the + and # wildcards.
+
+    match() returns the handlers of all filters matching a topic. The
+    results are cached per topic (up to cacheSize topics), so the trie is
+    only walked for the first message of a topic.
+    """
+
+    def __init__(self, cacheSize=10000):
+        self.cacheSize = cacheSize
+        self.routes = 0
+        self._root = TrieNode()
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def add(self, topicFilter, handler):
+        levels = topicFilter.split("/")
+        if "#" in levels[:-1]:
+            raise ValueError(f"# must be the last level of topic filter {topicFilter}")
+        with self._lock:
+            node = self._root
+            for level in levels:
+                node = node.children.setdefault(level, TrieNode())
+            node.handlers.append(handler)
+            self.routes += 1
+            self._cache = {}
+
+    def match(self, topic):
+        handlers = self._cache.get(topic)
+        if handlers is not None:
+            return handlers
+        levels = topic.split("/")
+        result = []
+        self._match(self._root, levels, 0, result)
+        handlers = tuple(result)
+        if len(self._cache) >= self.cacheSize:
+            self._cache = {}
+        self._cache[topic] = handlers
+        return handlers
+
+    def _match(self, node, levels, i, result):
+        # topics starting with $ are not matched by wildcards on the first level
+        wildcards = i > 0 or not levels[0].startswith("$")
+        if wildcards and "#" in node.children:
+            result.extend(node.children["#"].handlers)
+        if i == len(levels):
+            result.extend(node.handlers)
+            return
+        child = node.children.get(levels[i])
+        if child is not None:
+            self._match(child, levels, i + 1, result)
+        if wildcards:
+            child = node.children.get("+")
+            if child is not None:
+                self._match(child, levels, i + 1, result)
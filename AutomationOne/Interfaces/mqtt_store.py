@@ -0,0 +1,267 @@
+"""Persistent store-and-forward queue for MQTT publishes, which could not be sent"""
+
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+
+logger = logging.getLogger("AutomationOne")
+
+RECORD = struct.Struct(">IHI")  # crc32, topic length, payload length
+
+
+def _segmentName(segment):
+    return "{:010d}.seg".format(segment)
+
+
+def _validLength(path):
+    """Length of the complete, intact records at the start of a segment file"""
+    with open(path, "rb") as file:
+        data = file.read()
+    offset = 0
+    while offset + RECORD.size <= len(data):
+        crc, topicLength, payloadLength = RECORD.unpack_from(data, offset)
+        end = offset + RECORD.size + topicLength + payloadLength
+        if end > len(data) or zlib.crc32(data[offset + RECORD.size : end]) != crc:
+            break
+        offset = end
+    return offset
+
+
+class OutboundStore:
+    """Append-only segment files with an acknowledged read position.
+
+    Records are buffered in memory and written with one fsync per batch
+    (syncRecords records or an explicit flush). The store is limited to
+    maxBytes on disk; when it grows larger, the oldest segments are evicted.
+    The position up to which the records were forwarded is saved in the file
+    ack, so the replay resumes from there after a restart. Records are
+    forwarded at least once.
+    """
+
+    def __init__(
+        self,
+        directory,
+        maxBytes=64 * 1024 * 1024,
+        segmentBytes=1024 * 1024,
+        syncRecords=100,
+        name=None,
+    ):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.segmentBytes = segmentBytes
+        self.syncRecords = syncRecords
+        self.name = name if name else directory
+
+        self.stored = 0
+        self.forwarded = 0
+        self.evictedBytes = 0
+
+        self._lock = threading.Lock()
+        self._pending = []
+        self._reader = None
+        self._readerSegment = None
+        self._ackWritten = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self.segments = sorted(
+            int(file[:-4]) for file in os.listdir(directory) if file.endswith(".seg")
+        )
+        self.ackSegment, self.ackOffset = self._loadAck()
+        for segment in [s for s in self.segments if s < self.ackSegment]:
+            self._remove(segment)
+        if not self.segments:
+            self.segments.append(self.ackSegment)
+        if self.ackSegment < self.segments[0]:
+            self.ackSegment, self.ackOffset = self.segments[0], 0
+        self._size = sum(
+            os.path.getsize(self._path(segment)) for segment in self.segments[:-1]
+        )
+        self._repair(self.segments[-1])
+        self._writer = open(self._path(self.segments[-1]), "ab")
+        self._writeOffset = self._writer.tell()
+        self._size += self._writeOffset
+        if self.backlog():
+            logger.info(
+                f"[{self.name}] Resuming the replay of {self._size - self.ackOffset} stored bytes."
+            )
+
+    def _path(self, segment):
+        return os.path.join(self.directory, _segmentName(segment))
+
+    def _repair(self, segment):
+        """Truncates a torn record (e.g. after a crash) from the end of the segment,
+        so new records are appended directly after the last intact one"""
+        path = self._path(segment)
+        if not os.path.exists(path):
+            return
+        size = os.path.getsize(path)
+        length = _validLength(path)
+        if length < size:
+            logger.warning(
+                f"[{self.name}] Truncating {size - length} bytes of a torn record from segment {segment}."
+            )
+            with open(path, "r+b") as file:
+                file.truncate(length)
+                os.fsync(file.fileno())
+        if segment == self.ackSegment and self.ackOffset > length:
+            self.ackOffset = length
+
+    def _loadAck(self):
+        try:
+            with open(os.path.join(self.directory, "ack"), "r") as file:
+                segment, offset = file.read().split()
+                return int(segment), int(offset)
+        except (OSError, ValueError):
+            return (self.segments[0] if self.segments else 0), 0
+
+    def _saveAck(self):
+        path = os.path.join(self.directory, "ack")
+        with open(path + ".tmp", "w") as file:
+            file.write(f"{self.ackSegment} {self.ackOffset}")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(path + ".tmp", path)
+        self._ackWritten = time.monotonic()
+
+    def _remove(self, segment):
+        if self._readerSegment == segment:
+            self._reader.close()
+            self._reader = self._readerSegment = None
+        try:
+            os.remove(self._path(segment))
+        except OSError:
+            logger.exception(f"[{self.name}] Could not remove segment {segment}")
+        self.segments.remove(segment)
+
+    def append(self, topic, payload):
+        """Stores the message. It is written to disk with the next batch."""
+        if isinstance(payload, str):
+            payload = payload.encode("UTF-8")
+        elif not isinstance(payload, bytes):
+            payload = str(payload).encode("UTF-8")
+        topic = (topic or "").encode("UTF-8")
+        body = topic + payload
+        record = RECORD.pack(zlib.crc32(body), len(topic), len(payload)) + body
+        with self._lock:
+            self._pending.append(record)
+            self.stored += 1
+            if len(self._pending) >= self.syncRecords:
+                self._flush()
+
+    def flush(self):
+        """Writes the buffered records with a single fsync"""
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        data = b"".join(self._pending)
+        self._pending = []
+        self._writer.write(data)
+        self._writer.flush()
+        os.fsync(self._writer.fileno())
+        self._writeOffset += len(data)
+        self._size += len(data)
+        if self._writeOffset >= self.segmentBytes:
+            self._writer.close()
+            self.segments.append(self.segments[-1] + 1)
+            self._writer = open(self._path(self.segments[-1]), "ab")
+            self._writeOffset = 0
+        self._evict()
+
+    def _evict(self):
+        while self._size > self.maxBytes and len(self.segments) > 1:
+            segment = self.segments[0]
+            size = os.path.getsize(self._path(segment))
+            if segment == self.ackSegment:
+                size -= self.ackOffset
+                self.ackSegment, self.ackOffset = self.segments[1], 0
+            self._size -= os.path.getsize(self._path(segment))
+            self.evictedBytes += size
+            self._remove(segment)
+            logger.warning(
+                f"[{self.name}] Store is full. Evicted {size} bytes of the oldest messages."
+            )
+
+    def backlog(self):
+        """True if there are stored messages, which were not forwarded yet"""
+        return bool(self._pending) or (self.ackSegment, self.ackOffset) < (
+            self.segments[-1],
+            self._writeOffset,
+        )
+
+    def read(self, n):
+        """Returns up to n stored messages as (topic, payload, position) starting at the acknowledged position"""
+        with self._lock:
+            self._flush()
+            records = []
+            segment, offset = self.ackSegment, self.ackOffset
+            while len(records) < n:
+                if self._readerSegment != segment:
+                    if self._reader:
+                        self._reader.close()
+                    self._reader = open(self._path(segment), "rb")
+                    self._readerSegment = segment
+                self._reader.seek(offset)
+                header = self._reader.read(RECORD.size)
+                valid = len(header) == RECORD.size
+                if valid:
+                    crc, topicLength, payloadLength = RECORD.unpack(header)
+                    body = self._reader.read(topicLength + payloadLength)
+                    valid = (
+                        len(body) == topicLength + payloadLength
+                        and zlib.crc32(body) == crc
+                    )
+                if valid:
+                    offset += RECORD.size + len(body)
+                    records.append(
+                        (
+                            body[:topicLength].decode("UTF-8"),
+                            body[topicLength:],
+                            (segment, offset),
+                        )
+                    )
+                    continue
+                if segment == self.segments[-1]:
+                    break
+                if header:
+                    logger.warning(
+                        f"[{self.name}] Skipping the corrupt end of segment {segment}."
+                    )
+                segment, offset = self.segments[self.segments.index(segment) + 1], 0
+                if not records:
+                    self.ackSegment, self.ackOffset = segment, offset
+            return records
+
+    def ack(self, position, count=1):
+        """Marks the messages up to position as forwarded"""
+        with self._lock:
+            self.ackSegment, self.ackOffset = position
+            self.forwarded += count
+            for segment in [s for s in self.segments if s < self.ackSegment]:
+                self._size -= os.path.getsize(self._path(segment))
+                self._remove(segment)
+            if time.monotonic() - self._ackWritten >= 1 or not self.backlog():
+                self._saveAck()
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._writer.close()
+            if self._reader:
+                self._reader.close()
+                self._reader = self._readerSegment = None
+            self._saveAck()
+
+    def metrics(self):
+        return {
+            "stored": self.stored,
+            "forwarded": self.forwarded,
+            "bytes": self._size,
+            "evictedBytes": self.evictedBytes,
+            "segments": len(self.segments),
+        }
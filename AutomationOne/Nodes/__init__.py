@@ -1,4 +1,5 @@
 from .function_node import FunctionNode
+from .group_node import ChannelGroupNode
 from .mbus_node import MBusNode
 from .modbus_node import ModbusNode
 from .mqtt_node import MqttNode
@@ -0,0 +1,65 @@
+import logging
+import math
+
+from .. import vector
+from .node import Node
+
+logger = logging.getLogger("AutomationOne")
+
+
+class ChannelGroupNode(Node):
+    """Ordered set of numeric channels, whose values are stored in one vector.
+
+    setValue takes a list with a value per channel or a dict {channel: value}
+    for a partial update. The change detection compares all channels at once
+    against their deadband (a scalar, a list or a dict per channel) and
+    triggers one onChange for all changed channels. Their indices are kept in
+    changed until the next change.
+    """
+
+    def __init__(self, handler, config):
+        super().__init__(handler, config)
+        self.channels = list(config.get("channels", []))
+        if not self.channels:
+            raise ValueError(f"[{self.name}] A channel group needs channels.")
+        self.index = {channel: i for i, channel in enumerate(self.channels)}
+        n = len(self.channels)
+        self.value = vector.broadcast(
+            config.get("default"), n, self.channels, default=math.nan
+        )
+        self.lastValue = vector.asVector(self.value)
+        self.deadband = vector.broadcast(
+            config.get("deadband", self.sensitivity), n, self.channels
+        )
+        self.changed = []
+
+    def getChannel(self, channel):
+        value = self.value[self.index[channel]]
+        return None if math.isnan(value) else float(value)
+
+    def setValue(self, value, no_onchange_forward=None):
+        if no_onchange_forward is None:
+            no_onchange_forward = self.no_onchange_forward
+        try:
+            if isinstance(value, dict):
+                new = vector.asVector(self.value)
+                for channel, x in value.items():
+                    new[self.index[channel]] = math.nan if x is None else x
+            else:
+                new = vector.asVector(value)
+                if len(new) != len(self.channels):
+                    raise ValueError(
+                        f"Expected {len(self.channels)} values, got {len(new)}"
+                    )
+        except (KeyError, TypeError, ValueError) as e:
+            logger.error(f"[{self.name}] Invalid value for channel group: {e}")
+            return
+        mask = vector.changedMask(new, self.lastValue, self.deadband)
+        self.value = new
+        changed = vector.indices(mask)
+        logger.debug(f"[{self.name}] Set, {len(changed)} channels changed.")
+        if not changed:
+            return
+        vector.update(self.lastValue, new, mask)
+        self.changed = changed
+        self.onChange(no_onchange_forward=no_onchange_forward)
@@ -0,0 +1,96 @@
+"""Fixed-capacity history of the values of a node"""
+
+import logging
+import threading
+import time
+
+from array import array
+from bisect import bisect_left
+
+logger = logging.getLogger("AutomationOne")
+
+
+class History:
+    """Ring buffer of the last capacity (monotonic timestamp, value) samples.
+
+    Every sample is written twice, one buffer length apart, so the last n
+    samples are always one contiguous slice of the buffers. last() and
+    window() return memoryviews of that slice instead of copies and the
+    statistics run directly on them. One spare slot keeps the next append
+    out of a returned view. Values, which can not be converted to float, are
+    not recorded. The memory is fixed at 32 bytes per sample.
+    """
+
+    def __init__(self, capacity, name=None):
+        self.capacity = int(capacity)
+        if self.capacity < 1:
+            raise ValueError(f"History capacity must be positive, got {capacity}")
+        self.name = name
+        self._size = self.capacity + 1
+        self._times = array("d", bytes(16 * self._size))
+        self._values = array("d", bytes(16 * self._size))
+        self._timesView = memoryview(self._times)
+        self._valuesView = memoryview(self._values)
+        self._next = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def append(self, value, timestamp=None):
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            logger.debug(f"[{self.name}] Value '{value}' not recorded in history.")
+            return False
+        if timestamp is None:
+            timestamp = time.monotonic()
+        with self._lock:
+            i = self._next
+            self._times[i] = self._times[i + self._size] = timestamp
+            self._values[i] = self._values[i + self._size] = value
+            self._next = (i + 1) % self._size
+            if self._count < self.capacity:
+                self._count += 1
+        return True
+
+    def _span(self, n):
+        """Returns the start and end index of the last n samples"""
+        with self._lock:
+            end = self._next + self._size
+            return end - min(n, self._count), end
+
+    def last(self, n=1):
+        """Values of the last n samples, oldest first"""
+        start, end = self._span(n)
+        return self._valuesView[start:end]
+
+    def window(self, seconds=None):
+        """Timestamps and values of the samples of the last seconds (all samples if None), oldest first"""
+        start, end = self._span(self.capacity)
+        if seconds is not None:
+            times = self._timesView[start:end]
+            start += bisect_left(times, time.monotonic() - seconds)
+        return self._timesView[start:end], self._valuesView[start:end]
+
+    def mean(self, seconds=None):
+        values = self.window(seconds)[1]
+        if not len(values):
+            return None
+        return sum(values) / len(values)
+
+    def min(self, seconds=None):
+        values = self.window(seconds)[1]
+        return min(values) if len(values) else None
+
+    def max(self, seconds=None):
+        values = self.window(seconds)[1]
+        return max(values) if len(values) else None
+
+    def rate(self, seconds=None):
+        """Change of the value per second between the first and last sample of the window"""
+        times, values = self.window(seconds)
+        if len(values) < 2 or times[-1] == times[0]:
+            return None
+        return (values[-1] - values[0]) / (times[-1] - times[0])
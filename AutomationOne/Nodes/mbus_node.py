@@ -1,22 +1,19 @@
 import logging
-import xmltodict
 
 from datetime import timedelta
 
+from ..Interfaces.mbus_decoder import compilePath, getPath
 from .node import Node
 
 logger = logging.getLogger("AutomationOne")
 
 
-def getPathFromDir(dir, path, nodeName="<not given>"):
-    keys = str(path).split("/")
+def getPathFromDir(dir, path, nodeName="<not given>", accessors=None):
+    if accessors is None:
+        accessors = compilePath(path)
     try:
-        for key in keys:
-            if isinstance(dir, list):
-                key = int(key)
-            dir = dir[key]
-        return dir
-    except:
+        return getPath(dir, accessors)
+    except (KeyError, IndexError, TypeError):
         logger.error(f"Could not find path {path} in answer dict for node '{nodeName}'")
     return None
 
@@ -26,43 +23,59 @@ class MBusNode(Node):
         super().__init__(handler, config)
         self.interfaceName = config.get("interface")
         self.interface = self.handler.interfaces[self.interfaceName]
-        self.unit = config.get("unit")
+        self.unit = config.get("unit", config.get("address"))
 
         self.doOnStartup = config.get("doOnStartup", True)
 
         self.pollRate = config.get("pollRate", None)
 
         self.fields = config.get("fields", None)
+        # field paths are split once here instead of on every poll
+        if isinstance(self.fields, list):
+            self._accessors = [compilePath(path) for path in self.fields]
+        elif isinstance(self.fields, dict):
+            self._accessors = {
+                key: compilePath(path) for (key, path) in self.fields.items()
+            }
+        elif self.fields:
+            self._accessors = compilePath(self.fields)
+
+        self._polledByInterface = False
+        if self.pollRate and self.fields:
+            self._polledByInterface = self.interface.registerPollNode(self)
 
     def start(self):
         if self.doOnStartup:
             self.pullValue()
 
-    def pullValue(self, no_onchange_forward=False):
-        data = self.interface.read(self.unit)
-        if not self.fields and data is not None:
-            return data
-        try:
-            data_dict = xmltodict.parse(data)["MBusData"]
-        except:
+    def pullValue(self, no_onchange_forward=False, lane="poll"):
+        if not self.fields:
+            return self.interface.read(self.unit, lane=lane)
+        data_dict = self.interface.readData(self.unit, lane=lane)
+        if data_dict is None:
             logger.error(f"Could not parse data from MBus node {self.name}")
             return self.value
+        return self.updateFromData(data_dict, no_onchange_forward)
 
+    def updateFromData(self, data_dict, no_onchange_forward=False):
         if isinstance(self.fields, list):
-            value = [getPathFromDir(data_dict, path, self.name) for path in self.fields]
+            value = [
+                getPathFromDir(data_dict, path, self.name, accessors)
+                for path, accessors in zip(self.fields, self._accessors)
+            ]
         elif isinstance(self.fields, dict):
             value = {
-                key: getPathFromDir(data_dict, path, self.name)
+                key: getPathFromDir(data_dict, path, self.name, self._accessors[key])
                 for (key, path) in self.fields.items()
             }
         else:
-            value = getPathFromDir(data_dict, self.fields, self.name)
+            value = getPathFromDir(data_dict, self.fields, self.name, self._accessors)
         self.setValue(value, no_onchange_forward=no_onchange_forward)
         return value
 
     def get_timeloop_callbacks(self):
         callbacks = super().get_timeloop_callbacks()
-        if self.pollRate:
+        if self.pollRate and not self._polledByInterface:
             callbacks.append((self.pullValue, timedelta(seconds=self.pollRate)))
         return callbacks
 
@@ -70,8 +83,6 @@ class MBusNode(Node):
         logger.warning("Push not implemented for MBus.")
 
     def onDemandUpdate(self):
-        if self.read:
-            self.pullValue(no_onchange_forward=True)
-            logger.debug(f"[{self.name}] MBus value pulled due to demand.")
-            return True
-        return False  # Nothing done
+        self.pullValue(no_onchange_forward=True, lane="demand")
+        logger.debug(f"[{self.name}] MBus value pulled due to demand.")
+        return True
@@ -2,11 +2,7 @@ import logging
 
 from datetime import timedelta
 
-from pymodbus.exceptions import ModbusIOException
-from pymodbus.payload import BinaryPayloadDecoder
-from pymodbus.payload import BinaryPayloadBuilder
-from pymodbus.pdu import ExceptionResponse
-
+from ..modbus_codec import ModbusCodec
 from .node import Node
 
 logger = logging.getLogger("AutomationOne")
@@ -38,28 +34,8 @@ class ModbusNode(Node):
 
         self.retries = config.get("retries", 1)
 
-        if self.dataType == "int16":
-            self._count = 1
-        elif self.dataType == "int32":
-            self._count = 2
-        elif self.dataType == "int64":
-            self._count = 4
-        elif self.dataType == "uint16":
-            self._count = 1
-        elif self.dataType == "uint32":
-            self._count = 2
-        elif self.dataType == "uint64":
-            self._count = 4
-        elif self.dataType == "float16":
-            self._count = 1
-        elif self.dataType == "float32":
-            self._count = 2
-        elif self.dataType == "float64":
-            self._count = 4
-        else:
-            raise NotImplementedError(
-                f"DataType {self.dataType} not implemented for ModbusNode."
-            )
+        self.codec = ModbusCodec(self.dataType, self.byteorder, self.wordorder)
+        self._count = self.codec.count
 
         if "accessType" in config:
             logger.warning(
@@ -94,6 +70,9 @@ class ModbusNode(Node):
         )  # Per default perform read on startup but not write
 
         self.pollRate = config.get("pollRate", None)
+        self._polledByInterface = False
+        if self.functionCode in read_function_types and self.pollRate:
+            self._polledByInterface = self.interface.registerPollNode(self)
         logger.debug(config)
         # logger.debug("pollRate = {}".format(self.pollRate))
 
@@ -102,52 +81,27 @@ class ModbusNode(Node):
             self.pullValue()
             self.pushValue()
 
-    def pullValue(self, no_onchange_forward=False):
+    def pullValue(self, no_onchange_forward=False, lane="poll"):
         if self.functionCode in write_function_types:
             return self.value
 
-        for i in range(self.retries):
-            data = self.interface.read(
-                address=self.address,
-                functionCode=self.functionCode,
-                count=self._count,
-                unit=self.unit,
-            )
-            # logger.debug("[Node {}] received data: {}".format(self.name,data))
-            try:
-                if len(data.registers) > 0:
-                    break
-            except:
-                pass
-            if i + 1 < self.retries:
-                logger.debug(f"[{self.name}] Retrying reading Value...")
-        if isinstance(data, ModbusIOException) or isinstance(data, ExceptionResponse):
-            logger.error("[Node {}] {}".format(self.name, data))
+        registers = self.interface.readRegisters(
+            functionCode=self.functionCode,
+            address=self.address,
+            count=self._count,
+            unit=self.unit,
+            retries=self.retries,
+            name=self.name,
+            lane=lane,
+        )
+        if registers is None:
             return self.value
-        decoder = BinaryPayloadDecoder.fromRegisters(
-            data.registers, byteorder=self.byteorder, wordorder=self.wordorder
+        return self.updateFromRegisters(
+            registers, no_onchange_forward=no_onchange_forward
         )
 
-        if self.dataType == "int16":
-            value = decoder.decode_16bit_int()
-        elif self.dataType == "int32":
-            value = decoder.decode_32bit_int()
-        elif self.dataType == "int64":
-            value = decoder.decode_64bit_int()
-
-        elif self.dataType == "uint16":
-            value = decoder.decode_16bit_uint()
-        elif self.dataType == "uint32":
-            value = decoder.decode_32bit_uint()
-        elif self.dataType == "uint64":
-            value = decoder.decode_64bit_uint()
-
-        elif self.dataType == "float32":
-            value = decoder.decode_32bit_float()
-        elif self.dataType == "float16":
-            value = decoder.decode_16bit_float()
-        elif self.dataType == "float64":
-            value = decoder.decode_64bit_float()
+    def updateFromRegisters(self, registers, no_onchange_forward=False):
+        value = self.codec.decodeValue(registers)
 
         # logger.debug("[VALUE] {} => {}".format(self.name,value))
         self.setValue(value, no_onchange_forward=no_onchange_forward)
@@ -155,37 +109,18 @@ class ModbusNode(Node):
 
     def get_timeloop_callbacks(self):
         callbacks = super().get_timeloop_callbacks()
-        if self.functionCode in read_function_types and self.pollRate:
+        if (
+            self.functionCode in read_function_types
+            and self.pollRate
+            and not self._polledByInterface
+        ):
             callbacks.append((self.pullValue, timedelta(seconds=self.pollRate)))
         return callbacks
 
     def pushValue(self):
         if self.functionCode in read_function_types:
             return
-        builder = BinaryPayloadBuilder(
-            byteorder=self.byteorder, wordorder=self.wordorder
-        )
-        if self.dataType == "int16":
-            builder.add_16bit_int(int(self.value))
-        elif self.dataType == "int32":
-            builder.add_32bit_int(int(self.value))
-        elif self.dataType == "int64":
-            builder.add_64bit_int(int(self.value))
-
-        elif self.dataType == "uint16":
-            builder.add_16bit_uint(int(self.value))
-        elif self.dataType == "uint32":
-            builder.add_32bit_uint(int(self.value))
-        elif self.dataType == "uint64":
-            builder.add_64bit_uint(int(self.value))
-
-        elif self.dataType == "float16":
-            builder.add_16bit_float(float(self.value))
-        elif self.dataType == "float32":
-            builder.add_32bit_float(float(self.value))
-        elif self.dataType == "float64":
-            builder.add_64bit_float(float(self.value))
-        registers = builder.to_registers()
+        registers = self.codec.encodeValue(self.value)
         self.interface.write(
             functionCode=self.functionCode,
             registers=registers,
@@ -195,7 +130,7 @@ class ModbusNode(Node):
 
     def onDemandUpdate(self):
         if self.functionCode in read_function_types:
-            self.pullValue(no_onchange_forward=True)
+            self.pullValue(no_onchange_forward=True, lane="demand")
             logger.debug(f"[{self.name}] Modbus value pulled due to demand.")
             return True
         return False  # Nothing done
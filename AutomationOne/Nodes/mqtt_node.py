@@ -1,6 +1,8 @@
 import logging
 
+from ..Interfaces.mqtt_parsers import nodeParsers, skip
 from .node import Node
+from .publish_policy import PublishPolicy, policyKeys
 
 logger = logging.getLogger("AutomationOne")
 
@@ -34,6 +36,43 @@ class MqttNode(Node):
         if self.read:
             self.interface.registerSubscriber(self.mqttID, self)
 
+        if not self.read and any(key in config for key in policyKeys):
+            self.policy = PublishPolicy(self, self.publish, config)
+        else:
+            self.policy = None
+
+        self.parserName = config.get("parser")
+        if self.parserName and self.read:
+            if not self.topicSub:
+                logger.warning(
+                    f"MqttNode {self.name} has a parser but no topicSub. The parser is ignored."
+                )
+            else:
+                if self.parserName in nodeParsers:
+                    self.parser = nodeParsers[self.parserName]
+                else:
+                    self.parser = getattr(handler.callbackModule, self.parserName)
+                path = config.get("jsonPath", "")
+                self.jsonPath = tuple(
+                    int(key) if key.isdigit() else key for key in path.split(".") if key
+                )
+                self.interface.registerRoute(self.topicSub, self.onMessage)
+
+    def onMessage(self, message):
+        """Sets the value parsed from a message routed to this node by its topicSub"""
+        value = self.parser(self, message.payload)
+        if value is not skip:
+            self.setValue(value)
+
+    def publish(self, value):
+        self.interface.encoder(self.mqttID, value, self.topicPub)
+
+    def get_timeloop_callbacks(self):
+        callbacks = super().get_timeloop_callbacks()
+        if self.policy:
+            callbacks.extend(self.policy.get_timeloop_callbacks())
+        return callbacks
+
     def setValue(self, value):
         if self.read:
             if self.datatype == "auto":
@@ -53,6 +92,8 @@ class MqttNode(Node):
                     )
                 )
 
+        elif self.policy:
+            self.policy.offer(value)
         else:
-            self.interface.encoder(self.mqttID, value, self.topicPub)
+            self.publish(value)
         super().setValue(value)
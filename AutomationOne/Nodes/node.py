@@ -1,5 +1,7 @@
 import logging
 
+from .history import History
+
 logger = logging.getLogger("AutomationOne")
 
 eps = 1e-9
@@ -26,6 +28,10 @@ class Node:
 
         self.sensitivity = config.get("sensitivity", 0)
 
+        self.history = None
+        if config.get("history"):
+            self.history = History(config["history"], name=self.name)
+
         self.config = config
 
     def getValue(self):
@@ -39,6 +45,8 @@ class Node:
             no_onchange_forward = self.no_onchange_forward
         logger.debug(f"[{self.name}] Set to '{value}'.")
         self.value = value
+        if self.history is not None:
+            self.history.append(value)
 
         try:
             if not self.lastValue and not self.lastValue == 0:
@@ -58,8 +66,7 @@ class Node:
         if no_onchange_forward:
             logger.debug(f"[{self.name}] onchange forward blocked")
             return
-        for connection in self.onChangeConnections:
-            connection.execute()
+        self.handler.propagate(self)
 
     def onDemandUpdate(self):
         return False  # Return False if onDemandUpdate does nothing
@@ -79,7 +86,7 @@ class Node:
             )
             return
         self.result_of[0].demandUpdate(updated)
-        self.result_of[0].execute()
+        self.result_of[0].execute(immediate=True)
 
     def registerOnChange(self, connection):
         self.onChangeConnections.append(connection)
@@ -0,0 +1,42 @@
+import logging
+
+from .node import Node
+
+logger = logging.getLogger("AutomationOne")
+
+
+class NodeView(Node):
+    """Read-only stand-in for an intermediate node of a fused chain of linear
+    connections. Its value is computed from the source node of the chain,
+    when it is read."""
+
+    def __init__(self, node, source, factor, offset):
+        self.source = source
+        self.factor = factor
+        self.offset = offset
+        super().__init__(node.handler, node.config)
+
+    @property
+    def value(self):
+        value = self.source.getValue()
+        try:
+            return value * self.factor + self.offset
+        except:
+            return value
+
+    @value.setter
+    def value(self, value):
+        pass
+
+    def setValue(self, value, no_onchange_forward=None):
+        logger.warning(
+            f"[{self.name}] The node is a view of '{self.source.name}' and can not be set."
+        )
+
+    def demandUpdate(self, updated):
+        self.source.demandUpdate(updated)
+
+    def __str__(self):
+        return "NodeView {} = {} * {} + {}".format(
+            self.name, self.source.name, self.factor, self.offset
+        )
@@ -0,0 +1,140 @@
+"""Report-by-exception publishing of node values"""
+
+import logging
+import threading
+import time
+
+from datetime import timedelta
+
+logger = logging.getLogger("AutomationOne")
+
+policyKeys = ("deadband", "deadbandPercent", "minInterval", "heartbeat", "aggregation")
+
+
+def _mean(values):
+    return sum(values) / len(values)
+
+
+aggregations = {
+    "last": lambda values: values[-1],
+    "mean": _mean,
+    "min": min,
+    "max": max,
+}
+
+
+class PublishPolicy:
+    """Decides which values of a node are published.
+
+    A value is only published if it differs from the last published value
+    by more than deadband (absolute) or deadbandPercent (relative to the
+    last published value). Two publishes are at least minInterval seconds
+    apart; the values offered in between are collected and published at
+    the end of the interval, reduced by the aggregation (last, mean, min or
+    max). If nothing was published for heartbeat seconds, the latest value
+    is sent again regardless of the deadband.
+    """
+
+    def __init__(self, node, publish, config):
+        self.node = node
+        self.publish = publish
+        self.deadband = config.get("deadband", 0)
+        self.deadbandPercent = config.get("deadbandPercent", 0)
+        self.minInterval = config.get("minInterval", 0)
+        self.heartbeat = config.get("heartbeat", 0)
+        self.aggregationName = config.get("aggregation", "last")
+        if self.aggregationName not in aggregations:
+            logger.warning(
+                f"[{node.name}] Unknown aggregation '{self.aggregationName}'. Using last."
+            )
+            self.aggregationName = "last"
+        self.aggregation = aggregations[self.aggregationName]
+
+        self.published = 0
+        self.suppressed = 0
+
+        self._window = []
+        self._latest = None
+        self._hasValue = False
+        self._lastValue = None
+        self._lastPublish = None
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def get_timeloop_callbacks(self):
+        if self.heartbeat:
+            # checked ten times per heartbeat, so the silence is at most 1.1 heartbeats
+            return [(self._checkHeartbeat, timedelta(seconds=self.heartbeat / 10))]
+        return []
+
+    def offer(self, value):
+        with self._lock:
+            self._latest = value
+            self._hasValue = True
+            self._window.append(value)
+            if self.minInterval and self._lastPublish is not None:
+                wait = self._lastPublish + self.minInterval - time.monotonic()
+                if wait > 0:
+                    if self._timer is None:
+                        self._timer = self.node.handler.callLater(
+                            wait, self._flush, owner=self.node.name
+                        )
+                    return
+            value = self._reduce()
+            if not self._exceedsDeadband(value):
+                self.suppressed += 1
+                return
+            self._markPublished(value)
+        self.publish(value)
+
+    def _reduce(self):
+        window, self._window = self._window, []
+        try:
+            return self.aggregation(window)
+        except TypeError:
+            return window[-1]
+
+    def _exceedsDeadband(self, value):
+        if self._lastPublish is None:
+            return True
+        try:
+            difference = abs(value - self._lastValue)
+        except TypeError:
+            return value != self._lastValue
+        if self.deadbandPercent:
+            return difference > abs(self._lastValue) * self.deadbandPercent / 100
+        if self.deadband:
+            return difference > self.deadband
+        return difference > 0
+
+    def _markPublished(self, value):
+        self._lastValue = value
+        self._lastPublish = time.monotonic()
+        self.published += 1
+
+    def _flush(self):
+        with self._lock:
+            self._timer = None
+            if not self._window:
+                return
+            value = self._reduce()
+            if not self._exceedsDeadband(value):
+                self.suppressed += 1
+                return
+            self._markPublished(value)
+        self.publish(value)
+
+    def _checkHeartbeat(self):
+        with self._lock:
+            if not self._hasValue:
+                return
+            if self._timer is not None:
+                # the pending flush of the minInterval window publishes soon
+                return
+            if self._lastPublish is not None:
+                if time.monotonic() - self._lastPublish < self.heartbeat:
+                    return
+            value = self._latest
+            self._markPublished(value)
+        logger.debug(f"[{self.node.name}] Publishing heartbeat.")
+        self.publish(value)
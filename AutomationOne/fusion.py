@@ -0,0 +1,105 @@
+"""Fusion of chains of linear SimpleConnections into one transform at load time"""
+
+import logging
+
+from .Connections.simple_connection import SimpleConnection
+from .Nodes.node import Node
+from .Nodes.node_view import NodeView
+
+logger = logging.getLogger("AutomationOne")
+
+
+def _number(x):
+    return isinstance(x, (int, float)) and not isinstance(x, bool)
+
+
+def linear(connection):
+    """True for a SimpleConnection from one node to one node, which is executed
+    immediately on every change of its inNode and does nothing else"""
+    return (
+        type(connection) is SimpleConnection
+        and isinstance(connection.inNode, Node)
+        and isinstance(connection.outNode, Node)
+        and connection.on_change is True
+        and not connection.frequency
+        and not connection.delay
+        and not connection.demand
+        and _number(connection.factor)
+        and _number(connection.offset)
+    )
+
+
+def references(connections):
+    """Maps the id of every node to the ids of the connections, which refer to it
+    in any role (inNode, outNode, conditionNode, ...)"""
+    referrers = {}
+    for connection in connections:
+        for attribute in vars(connection).values():
+            nodes = attribute if isinstance(attribute, (list, tuple)) else [attribute]
+            for node in nodes:
+                if isinstance(node, Node):
+                    referrers.setdefault(id(node), set()).add(id(connection))
+    return referrers
+
+
+def fusible(node, referrers):
+    """True for a plain node between two linear connections, whose changes have
+    no other effect and which no other connection refers to"""
+    return (
+        type(node) is Node
+        and "onChange" not in node.config
+        and "default" not in node.config
+        and not node.sensitivity
+        and node.history is None
+        and len(node.result_of) == 1
+        and len(node.onChangeConnections) == 1
+        and linear(node.result_of[0])
+        and linear(node.onChangeConnections[0])
+        and not node.onChangeConnections[0].doOnStartup
+        and referrers.get(id(node))
+        == {id(node.result_of[0]), id(node.onChangeConnections[0])}
+    )
+
+
+def linear_chains(connections):
+    """Returns the maximal chains [c1, c2, ...] of linear connections joined by fusible nodes"""
+    chains = []
+    referrers = references(connections)
+    for connection in connections:
+        if not linear(connection) or fusible(connection.inNode, referrers):
+            continue
+        chain = [connection]
+        seen = {connection}
+        node = connection.outNode
+        while fusible(node, referrers):
+            following = node.onChangeConnections[0]
+            if following in seen:
+                break
+            chain.append(following)
+            seen.add(following)
+            node = following.outNode
+        if len(chain) > 1:
+            chains.append(chain)
+    return chains
+
+
+def fuse_chain(chain):
+    """Lets the first connection of the chain transform its source directly into
+    the sink of the chain. Returns the (node, view) pairs of the intermediate nodes."""
+    head = chain[0]
+    source = head.inNode
+    factor, offset = head.factor, head.offset
+    views = []
+    for connection in chain[1:]:
+        node = connection.inNode
+        views.append((node, NodeView(node, source, factor, offset)))
+        node.onChangeConnections = []
+        factor = factor * connection.factor
+        offset = offset * connection.factor + connection.offset
+    sink = chain[-1].outNode
+    sink.result_of = [head if c is chain[-1] else c for c in sink.result_of]
+    head.factor = factor
+    head.offset = offset
+    head.outNode = sink
+    head.outName = sink.name
+    return views
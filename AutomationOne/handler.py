@@ -1,23 +1,33 @@
 import importlib
 import importlib.util
 import logging
+import logging.config
+import logging.handlers
 import os
+import threading
 import time
 import yaml
 
+from contextlib import contextmanager
+from functools import wraps
+
 from .Connections import *
 from .Interfaces import *
+from .Interfaces.interface import Interface
 from .Nodes import *
+from .fusion import fuse_chain, linear_chains
+from .propagation import Wave, rank_connections
+from .scheduler import Scheduler
 
 
 from pathlib import Path
-from timeloop import Timeloop
 
 
 logger = logging.getLogger("AutomationOne")
 
 
 def return_None_on_fail(func):
+    @wraps(func)
     def wrapper(*args,**kwargs):
         try:
             return func(*args,**kwargs)
@@ -51,9 +61,13 @@ class Handler:
         self.interfaces = {}
         self.nodes = {}
         self.connections = {}
+        self.config = {}
 
         self.timeloop = None
 
+        self._ranks = None
+        self._propagation = threading.local()
+
     def start(self):
         return self._start()
 
@@ -95,33 +109,136 @@ class Handler:
                 logger.exception("Exception during initCallback2!")
         self._start()
 
-    def _register_timeloop_job(self, callback, interval):
+    def _register_timeloop_job(self, callback, interval, lane=None, owner=None, kind=None):
         if not self.timeloop:
             logger.warning("Timeloop is not running. Cannot register job.")
             return False
-        logger.debug(f"Registering job {callback.__name__} with interval {interval}")
-        self.timeloop._add_job(callback, interval)
+        logger.debug(
+            f"Registering job {getattr(callback, '__qualname__', callback)} with interval {interval}"
+        )
+        self.timeloop._add_job(callback, interval, lane, owner, kind)
         return True
 
-    def _register_timeloop_jobs(self, callbacks):
+    def _register_timeloop_jobs(self, callbacks, lane=None, owner=None, kind=None):
         if not self.timeloop:
             logger.warning("Timeloop is not running. Cannot register jobs.")
             return False
         for callback, frequency in callbacks:
-            self._register_timeloop_job(return_None_on_fail(callback), frequency)
+            self._register_timeloop_job(
+                return_None_on_fail(callback), frequency, lane, owner, kind
+            )
 
+    def _get_lane(self, item):
+        """Jobs of an interface and of its nodes share one lane named after the interface"""
+        if isinstance(item, Interface):
+            return item.name
+        interface = getattr(item, "interface", None)
+        if isinstance(interface, Interface):
+            return interface.name
+        return None
 
     def _create_timeloop(self):
         if not self.timeloop:
-            self.timeloop = Timeloop()
-            logging.getLogger("timeloop").setLevel(logging.CRITICAL)
-            for collection in [self.interfaces, self.nodes, self.connections]:
+            self.timeloop = Scheduler(**self.config.get("scheduler", {}))
+            for kind, collection in [
+                ("interface", self.interfaces),
+                ("node", self.nodes),
+                ("connection", self.connections),
+            ]:
                 for item in collection.values():
                     callbacks = item.get_timeloop_callbacks()
-                    self._register_timeloop_jobs(callbacks)
+                    self._register_timeloop_jobs(
+                        callbacks, self._get_lane(item), item.name, kind
+                    )
             return True
         return False
 
+    def getJobStats(self):
+        """Returns the timing statistics of all periodic jobs and their overruns and
+        missed ticks summed up per node, connection and interface (lane)"""
+        if not self.timeloop:
+            return {}
+        jobs = self.timeloop.stats()
+        summary = {"jobs": jobs, "node": {}, "connection": {}, "interface": {}}
+        for job in jobs:
+            keys = [(job["kind"], job["owner"])]
+            if job["lane"] is not None and job["kind"] != "interface":
+                keys.append(("interface", job["lane"]))
+            for kind, name in keys:
+                if kind not in summary:
+                    continue
+                counters = summary[kind].setdefault(name, {"overruns": 0, "missed": 0})
+                counters["overruns"] += job["overruns"]
+                counters["missed"] += job["missed"]
+        return summary
+
+    def callLater(self, delay, callback, owner=None):
+        """Runs callback once after delay seconds without blocking the caller.
+        Returns an object with a cancel() method."""
+        callback = return_None_on_fail(callback)
+        if self.timeloop:
+            return self.timeloop.call_later(delay, callback, owner=owner)
+        timer = threading.Timer(delay, callback)
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    def buildPropagationOrder(self):
+        """Ranks the connections topologically and reports the cycles of the graph"""
+        self._ranks, cycles = rank_connections(list(self.connections.values()))
+        for cycle in cycles:
+            logger.warning(
+                "The connections {} form a cycle. Changes are propagated around it in consecutive waves.".format(
+                    " -> ".join(connection.name for connection in cycle + cycle[:1])
+                )
+            )
+        return cycles
+
+    def fuseConnections(self):
+        """Replaces chains of linear SimpleConnections through plain nodes by one
+        connection from the source to the sink of the chain. Only nodes, which no
+        other connection refers to, are fused. They are replaced by views, which
+        compute their value on access."""
+        for chain in linear_chains(list(self.connections.values())):
+            for node, view in fuse_chain(chain):
+                self.nodes[view.name] = view
+            for connection in chain[1:]:
+                del self.connections[connection.name]
+            logger.info(
+                "Fused the connections {} into '{}'.".format(
+                    " -> ".join(connection.name for connection in chain), chain[0].name
+                )
+            )
+        self._ranks = None
+
+    @contextmanager
+    def changeWave(self):
+        """Collects all node changes within the block into one wave, which is propagated at its end"""
+        wave = getattr(self._propagation, "wave", None)
+        if wave is not None:
+            yield wave
+            return
+        if self._ranks is None:
+            self.buildPropagationOrder()
+        wave = Wave(self._ranks, self.config.get("propagation", {}).get("maxWaves", 100))
+        self._propagation.wave = wave
+        try:
+            yield wave
+            wave.run()
+        finally:
+            self._propagation.wave = None
+
+    def propagate(self, node):
+        """Executes the connections triggered by a change of node, each at most once and in topological order"""
+        if not node.onChangeConnections:
+            return
+        wave = getattr(self._propagation, "wave", None)
+        if wave is not None:
+            wave.schedule(node.onChangeConnections)
+            return
+        with self.changeWave() as wave:
+            wave.schedule(node.onChangeConnections)
+
     def _start(self):
         if not self._create_timeloop():
             logger.warning("Timeloop is already running and cannot be started again.")
@@ -234,6 +351,9 @@ class Handler:
             logger.info("Parsing Connections....")
             for connectionConfig in config["connections"]:
                 self.parseConnection(connectionConfig)
+            if config.get("fuseConnections", False):
+                self.fuseConnections()
+            self.buildPropagationOrder()
 
         self.config = config
         self.custom = config.get("custom", {})
@@ -287,6 +407,8 @@ class Handler:
                 node = MqttNode(self, nodeConfig)
             elif nodeType == "MBus":
                 node = MBusNode(self, nodeConfig)
+            elif nodeType == "ChannelGroup":
+                node = ChannelGroupNode(self, nodeConfig)
             elif nodeType == "default":
                 node = Node(self, nodeConfig)
             else:
@@ -323,6 +445,12 @@ class Handler:
                 connection = ConditionalConnection(self, connectionConfig)
             elif connectionType.lower() == "custom":
                 connection = CustomConnection(self, connectionConfig)
+            elif connectionType.lower() == "aggregate":
+                connection = AggregateConnection(self, connectionConfig)
+            elif connectionType.lower() == "group":
+                connection = GroupConnection(self, connectionConfig)
+            elif connectionType.lower() == "expression":
+                connection = ExpressionConnection(self, connectionConfig)
             else:
                 logger.error(
                     "The connection type was not recognized! (config = {})".format(
@@ -348,7 +476,8 @@ class Handler:
             )
             return False
         else:
-            self.nodes[connection.name] = connection
+            self.connections[connection.name] = connection
             connection.register()
+            self._ranks = None
             logger.debug("Added connection: {}".format(connection))
             return True
@@ -0,0 +1,70 @@
+"""Precompiled codec for converting between Modbus registers and values"""
+
+import struct
+
+dataTypes = {
+    "int16": ("h", 1),
+    "int32": ("i", 2),
+    "int64": ("q", 4),
+    "uint16": ("H", 1),
+    "uint32": ("I", 2),
+    "uint64": ("Q", 4),
+    "float16": ("e", 1),
+    "float32": ("f", 2),
+    "float64": ("d", 4),
+}
+
+
+class ModbusCodec:
+    """Decodes and encodes an array of `length` values of the given dataType.
+
+    The byteorder, wordorder and dataType are compiled into two struct.Struct
+    objects and a word permutation once, so that decoding and encoding a whole
+    register array is a single call without any further lookups.
+    """
+
+    def __init__(self, dataType, byteorder=">", wordorder="<", length=1):
+        if dataType not in dataTypes:
+            raise NotImplementedError(
+                f"DataType {dataType} not implemented for Modbus."
+            )
+        fmt, self.count = dataTypes[dataType]
+        self.dataType = dataType
+        self.length = length
+        self.registerCount = self.count * length
+
+        self._words = struct.Struct(f"{byteorder}{self.registerCount}H")
+        self._values = struct.Struct(f">{length}{fmt}")
+        self._convert = float if fmt in "efd" else int
+
+        if wordorder == "<" and self.count > 1:
+            self._order = tuple(
+                i * self.count + j
+                for i in range(length)
+                for j in reversed(range(self.count))
+            )
+        else:
+            self._order = None
+
+    def decode(self, registers):
+        """Returns a tuple of all values contained in the registers"""
+        if self._order:
+            registers = [registers[i] for i in self._order]
+        return self._values.unpack(self._words.pack(*registers))
+
+    def decodeValue(self, registers):
+        return self.decode(registers)[0]
+
+    def encode(self, values):
+        """Returns the list of registers representing the given values"""
+        convert = self._convert
+        registers = self._words.unpack(self._values.pack(*[convert(x) for x in values]))
+        if self._order:
+            return [registers[i] for i in self._order]
+        return list(registers)
+
+    def encodeValue(self, value):
+        return self.encode((value,))
+
+    def __str__(self):
+        return "ModbusCodec for {} x {}".format(self.length, self.dataType)
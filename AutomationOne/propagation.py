@@ -0,0 +1,121 @@
+"""Topologically ordered propagation of node changes through the connection graph"""
+
+import heapq
+import itertools
+import logging
+
+logger = logging.getLogger("AutomationOne")
+
+
+def _outNodes(connection):
+    outNode = getattr(connection, "outNode", None)
+    if outNode is None:
+        return []
+    if isinstance(outNode, list):
+        return outNode
+    return [outNode]
+
+
+def successors(connection):
+    """Returns the connections, which are triggered by a change of the output nodes of connection"""
+    result = []
+    for node in _outNodes(connection):
+        for successor in getattr(node, "onChangeConnections", []):
+            if successor not in result:
+                result.append(successor)
+    return result
+
+
+def rank_connections(connections):
+    """Returns the rank of every connection in a topological order and the cycles of the graph.
+
+    The ranks are positions in the reverse DFS postorder. Edges closing a
+    cycle are ignored for the ranking, so connections within a cycle get a
+    rank as well. Every cycle is returned as the list of its connections.
+    """
+    order = []
+    cycles = []
+    state = {}  # 1: on the current path, 2: done
+    for root in connections:
+        if root in state:
+            continue
+        state[root] = 1
+        path = [root]
+        stack = [iter(successors(root))]
+        while stack:
+            for successor in stack[-1]:
+                visited = state.get(successor)
+                if visited is None:
+                    state[successor] = 1
+                    path.append(successor)
+                    stack.append(iter(successors(successor)))
+                    break
+                if visited == 1:
+                    cycles.append(path[path.index(successor) :])
+            else:
+                stack.pop()
+                connection = path.pop()
+                state[connection] = 2
+                order.append(connection)
+    order.reverse()
+    return {connection: rank for rank, connection in enumerate(order)}, cycles
+
+
+class Wave:
+    """One change wave, which executes the triggered connections level by level.
+
+    Connections are executed in the order of their rank, so a connection
+    runs after all of its triggered predecessors and sees consistent inputs.
+    Every connection is executed at most once per wave. A connection, which
+    is triggered again after it ran (only possible within a cycle), is
+    deferred to a follow-up wave, up to maxWaves waves.
+    """
+
+    def __init__(self, ranks, maxWaves=100):
+        self.ranks = ranks
+        self.maxWaves = maxWaves
+        self.waves = 1
+        self.executions = 0
+
+        self._heap = []
+        self._counter = itertools.count()
+        self._queued = set()
+        self._executed = set()
+        self._deferred = []
+
+    def schedule(self, connections):
+        for connection in connections:
+            if connection in self._executed:
+                if connection not in self._deferred:
+                    self._deferred.append(connection)
+            elif connection not in self._queued:
+                self._queued.add(connection)
+                heapq.heappush(
+                    self._heap,
+                    (self.ranks.get(connection, 0), next(self._counter), connection),
+                )
+
+    def run(self):
+        while True:
+            while self._heap:
+                _, _, connection = heapq.heappop(self._heap)
+                self._queued.discard(connection)
+                self._executed.add(connection)
+                self.executions += 1
+                try:
+                    connection.execute()
+                except Exception:
+                    logger.exception(f"Exception during execution of {connection}")
+            if not self._deferred:
+                return
+            if self.waves >= self.maxWaves:
+                logger.error(
+                    "Propagation stopped after {} waves. The connections {} keep triggering each other.".format(
+                        self.waves, [connection.name for connection in self._deferred]
+                    )
+                )
+                return
+            self.waves += 1
+            deferred, self._deferred = self._deferred, []
+            self._executed = set()
+            self.schedule(deferred)
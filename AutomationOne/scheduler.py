@@ -0,0 +1,275 @@
+"""Single threaded scheduler, which dispatches periodic jobs to a bounded pool of worker lanes"""
+
+import heapq
+import itertools
+import logging
+import queue
+import threading
+import time
+
+from datetime import timedelta
+
+logger = logging.getLogger("AutomationOne")
+
+GOLDEN_RATIO = 0.6180339887498949
+
+
+def _seconds(interval):
+    if isinstance(interval, timedelta):
+        return interval.total_seconds()
+    return float(interval)
+
+
+class Job:
+    """A periodic job, which tracks its actual period, execution time and lateness"""
+
+    def __init__(
+        self, callback, interval, lane, deadline, owner=None, kind=None, once=False
+    ):
+        self.callback = callback
+        self.interval = interval
+        self.lane = lane
+        self.deadline = deadline
+        self.owner = owner
+        self.kind = kind
+        self.name = getattr(callback, "__qualname__", repr(callback))
+        self.cancelled = False
+        self.pending = False
+        self.once = once
+
+        self.runs = 0
+        self.overruns = 0
+        self.missed = 0
+        self.lastStart = None
+        self.lastPeriod = 0
+        self.totalPeriod = 0
+        self.lastExecTime = 0
+        self.maxExecTime = 0
+        self.totalExecTime = 0
+        self.lastLateness = 0
+        self.maxLateness = 0
+        self._dueAt = deadline
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        start = time.monotonic()
+        self.lastLateness = start - self._dueAt
+        self.maxLateness = max(self.maxLateness, self.lastLateness)
+        if self.lastStart is not None:
+            self.lastPeriod = start - self.lastStart
+            self.totalPeriod += self.lastPeriod
+        self.lastStart = start
+        try:
+            self.callback()
+        finally:
+            self.pending = False
+            self.lastExecTime = time.monotonic() - start
+            self.maxExecTime = max(self.maxExecTime, self.lastExecTime)
+            self.totalExecTime += self.lastExecTime
+            self.runs += 1
+            if not self.once and self.lastExecTime > self.interval:
+                self.overruns += 1
+                if self.overruns == 1 or self.overruns % 100 == 0:
+                    logger.warning(
+                        f"{self} overran its interval: execution took {self.lastExecTime:.3f}s ({self.overruns} overruns, {self.missed} missed ticks). The interval is not realistic."
+                    )
+
+    def stats(self):
+        return {
+            "job": self.name,
+            "owner": self.owner,
+            "kind": self.kind,
+            "lane": self.lane,
+            "interval": self.interval,
+            "runs": self.runs,
+            "meanPeriod": self.totalPeriod / (self.runs - 1) if self.runs > 1 else 0,
+            "lastPeriod": self.lastPeriod,
+            "meanExecTime": self.totalExecTime / self.runs if self.runs else 0,
+            "lastExecTime": self.lastExecTime,
+            "maxExecTime": self.maxExecTime,
+            "lastLateness": self.lastLateness,
+            "maxLateness": self.maxLateness,
+            "overruns": self.overruns,
+            "missed": self.missed,
+        }
+
+    def __str__(self):
+        return "Job {} every {}s in lane {}".format(self.name, self.interval, self.lane)
+
+
+class Lane:
+    """Worker threads executing the jobs dispatched to one lane"""
+
+    def __init__(self, name, workers=1):
+        self.name = name
+        self.queue = queue.SimpleQueue()
+        self.threads = [
+            threading.Thread(target=self._run, name=f"lane-{name}-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def put(self, job):
+        self.queue.put(job)
+
+    def stop(self):
+        for _ in self.threads:
+            self.queue.put(None)
+
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            try:
+                job.run()
+            except Exception:
+                logger.exception(f"Exception during execution of {job}")
+
+
+class Scheduler:
+    """Replacement for Timeloop with a constant number of threads.
+
+    A single dispatcher thread keeps the deadlines of all jobs in a min-heap
+    on the monotonic clock and hands due jobs to their lane. Every interface
+    gets its own lane with one worker thread, all other jobs share the
+    default lane with `workers` threads. Jobs with the same interval are
+    spread over the interval by a golden ratio phase offset, so that their
+    wakeups do not collide.
+
+    A job is never queued twice: if it is still queued or running when its
+    next tick is due, the tick is skipped and counted as missed. After an
+    overrun the job continues on its original grid instead of catching up.
+    """
+
+    def __init__(self, workers=4, spread=True, laneWorkers=None):
+        self.workers = workers
+        self.spread = spread
+        self.laneWorkers = laneWorkers or {}
+
+        self._heap = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._lanes = {}
+        self._phaseIndex = {}
+        self._thread = None
+        self._stopped = False
+
+    def _add_job(self, callback, interval, lane=None, owner=None, kind=None):
+        """Timeloop compatible registration of a periodic job"""
+        return self.add_job(callback, interval, lane, owner, kind)
+
+    def add_job(self, callback, interval, lane=None, owner=None, kind=None):
+        interval = _seconds(interval)
+        if interval <= 0:
+            raise ValueError(f"Interval of job {callback} must be positive")
+        phase = 1
+        if self.spread:
+            index = self._phaseIndex.get(interval, 0) + 1
+            self._phaseIndex[interval] = index
+            phase = (index * GOLDEN_RATIO) % 1
+        job = Job(
+            callback,
+            interval,
+            lane,
+            time.monotonic() + phase * interval,
+            owner=owner,
+            kind=kind,
+        )
+        self._push(job)
+        logger.debug(f"Scheduled {job}")
+        return job
+
+    def call_later(self, delay, callback, lane=None, owner=None):
+        """Runs callback once after delay seconds. The returned job can be cancelled."""
+        delay = max(_seconds(delay), 0)
+        job = Job(
+            callback,
+            delay,
+            lane,
+            time.monotonic() + delay,
+            owner=owner,
+            kind="timer",
+            once=True,
+        )
+        self._push(job)
+        return job
+
+    def _push(self, job):
+        with self._condition:
+            heapq.heappush(self._heap, (job.deadline, next(self._counter), job))
+            self._condition.notify()
+
+    def _lane(self, name):
+        lane = self._lanes.get(name)
+        if lane is None:
+            if name is None:
+                workers = self.workers
+            else:
+                workers = self.laneWorkers.get(name, 1)
+            lane = self._lanes[name] = Lane(
+                "default" if name is None else name, workers
+            )
+        return lane
+
+    def start(self, block=False):
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="scheduler", daemon=True)
+        self._thread.start()
+        if block:
+            self._thread.join()
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+        for lane in self._lanes.values():
+            lane.stop()
+        self._lanes = {}
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    if self._stopped:
+                        return
+                    if self._heap:
+                        wait = self._heap[0][0] - time.monotonic()
+                        if wait <= 0:
+                            break
+                    else:
+                        wait = None
+                    self._condition.wait(wait)
+                _, _, job = heapq.heappop(self._heap)
+                if job.cancelled:
+                    continue
+                if job.once:
+                    job.pending = True
+                    self._lane(job.lane).put(job)
+                    continue
+                now = time.monotonic()
+                due = job.deadline
+                job.deadline += job.interval
+                if job.deadline <= now:
+                    skipped = int((now - job.deadline) // job.interval) + 1
+                    job.missed += skipped
+                    job.deadline += skipped * job.interval
+                heapq.heappush(self._heap, (job.deadline, next(self._counter), job))
+                if job.pending:
+                    job.missed += 1
+                    continue
+                job.pending = True
+                job._dueAt = due
+                lane = self._lane(job.lane)
+            lane.put(job)
+
+    def stats(self):
+        """Returns the timing statistics of all periodic jobs"""
+        with self._condition:
+            jobs = [job for _, _, job in self._heap if not job.once]
+        return [job.stats() for job in jobs]
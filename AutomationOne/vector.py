@@ -0,0 +1,101 @@
+"""Element-wise operations on vectors of doubles for channel groups.
+
+NumPy is used if it is installed. Otherwise the vectors are array('d') and
+the operations are chains of map() over builtins and operator functions, so
+the per-element loops still run in C.
+"""
+
+import itertools
+import math
+import operator
+
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def isVector(values):
+    if numpy is not None:
+        return isinstance(values, numpy.ndarray)
+    return isinstance(values, array)
+
+
+def asVector(values):
+    """Converts a sequence of numbers (None for unknown) into a new vector of doubles"""
+    if isVector(values):
+        return values.copy() if numpy is not None else array("d", values)
+    values = [math.nan if value is None else value for value in values]
+    if numpy is not None:
+        return numpy.array(values, dtype=numpy.float64)
+    return array("d", values)
+
+
+def full(n, value):
+    """Vector of n times value"""
+    if numpy is not None:
+        return numpy.full(n, value, dtype=numpy.float64)
+    return array("d", itertools.repeat(value, n))
+
+
+def broadcast(value, n, channels=None, default=0.0):
+    """Turns a scalar, a list or a {channel: value} dict into a vector of length n"""
+    if isinstance(value, dict):
+        vector = full(n, default)
+        for channel, x in value.items():
+            vector[channels.index(channel)] = x
+        return vector
+    if isinstance(value, (list, tuple)):
+        if len(value) != n:
+            raise ValueError(f"Expected {n} values, got {len(value)}")
+        return asVector(value)
+    return full(n, default if value is None else value)
+
+
+def affine(values, factors, offsets):
+    """values * factors + offsets"""
+    if numpy is not None:
+        return values * factors + offsets
+    return array("d", map(operator.add, map(operator.mul, values, factors), offsets))
+
+
+def clip(values, lows, highs):
+    if numpy is not None:
+        return numpy.clip(values, lows, highs)
+    return array("d", map(min, map(max, values, lows), highs))
+
+
+def changedMask(values, last, deadbands):
+    """Channels, whose value differs from last by more than the deadband. Unknown
+    (NaN) last values always count as changed, unknown new values never."""
+    if numpy is not None:
+        with numpy.errstate(invalid="ignore"):
+            return (numpy.abs(values - last) > deadbands) | (
+                numpy.isnan(last) & ~numpy.isnan(values)
+            )
+    changed = map(operator.gt, map(abs, map(operator.sub, values, last)), deadbands)
+    # NaN is the only value, which is not equal to itself
+    unknown = map(operator.ne, last, last)
+    known = map(operator.eq, values, values)
+    return list(map(operator.or_, changed, map(operator.and_, unknown, known)))
+
+
+def indices(mask):
+    """Indices of the true entries of a mask"""
+    if numpy is not None:
+        return numpy.flatnonzero(mask).tolist()
+    return list(itertools.compress(range(len(mask)), mask))
+
+
+def update(target, source, mask):
+    """Copies the entries of source selected by mask into target"""
+    if numpy is not None:
+        target[mask] = source[mask]
+        return
+    if all(mask):
+        target[:] = source
+        return
+    for i in indices(mask):
+        target[i] = source[i]
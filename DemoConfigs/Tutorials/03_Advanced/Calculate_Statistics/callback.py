@@ -35,4 +35,13 @@ calculate_statistics.values = {}
 
 
 def log_value(node):
-    logger.info("[{}] {}".format(node.name,node.getValue()))
\ No newline at end of file
+    logger.info("[{}] {}".format(node.name,node.getValue()))
+
+
+# Functions for config01.yaml
+
+def window_statistics(node):
+    """Callback function for calculating the statistics from the history of the source node"""
+    history = node.handler.nodes[node.config["source"]].history
+    seconds = node.config.get("seconds", 60)
+    node.setValue([history.min(seconds), history.max(seconds), history.mean(seconds)])
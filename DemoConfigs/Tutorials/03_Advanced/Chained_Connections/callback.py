@@ -0,0 +1,14 @@
+import logging
+
+
+logger = logging.getLogger("AutomationOne")
+
+
+def log_value(node):
+  logger.info("[{}] {}".format(node.name,node.getValue()))
+
+
+def count(node):
+  """Callback function for a counter, which starts at 1000"""
+  value = node.getValue()
+  node.setValue(1000 if value is None else value + 1)
@@ -0,0 +1,21 @@
+import logging
+import random
+
+
+logger = logging.getLogger("AutomationOne")
+
+
+# Functions for config00.yaml
+
+def read_inputs(node):
+    """Callback function simulating an analog input module, which delivers all channels at once"""
+    inputs = node.handler.nodes["Inputs"]
+    inputs.setValue([random.uniform(4, 20) for _ in inputs.channels])
+
+
+def log_channels(node):
+    logger.info("[{}] {}".format(node.name, dict(zip(node.channels, node.getValue()))))
+
+
+def log_value(node):
+    logger.info("[{}] {}".format(node.name, node.getValue()))
@@ -0,0 +1,471 @@
+#! /usr/bin/python3
+
+"""Micro benchmarks for performance critical parts of the AutomationOne suite"""
+
+import argparse
+import logging
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+streamHandler = logging.StreamHandler()
+logger.addHandler(streamHandler)
+
+
+def report(name, n, seconds, unit="request"):
+    logger.info(
+        "{:<40} {:>10.1f} µs/{}  {:>12.0f} {}s/s".format(
+            name, seconds / n * 1e6, unit, n / seconds, unit
+        )
+    )
+
+
+# ******** Modbus ********
+
+
+def modbus_response(registers, pdu):
+    """Answers a request PDU using the given register list"""
+    function_code = pdu[0]
+    if function_code in (3, 4):
+        address, count = struct.unpack_from(">HH", pdu, 1)
+        return bytes([function_code, 2 * count]) + struct.pack(
+            f">{count}H", *registers[address : address + count]
+        )
+    if function_code == 6:
+        address, value = struct.unpack_from(">HH", pdu, 1)
+        registers[address] = value
+        return bytes(pdu[:5])
+    if function_code == 16:
+        address, count = struct.unpack_from(">HH", pdu, 1)
+        registers[address : address + count] = struct.unpack_from(f">{count}H", pdu, 6)
+        return bytes(pdu[:5])
+    return bytes([function_code | 0x80, 1])
+
+
+class TcpStandInServer:
+    """Minimal Modbus TCP server answering from a register list"""
+
+    def __init__(self):
+        self.registers = list(range(65536))
+        self.socket = socket.socket()
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(("127.0.0.1", 0))
+        self.socket.listen(4)
+        self.port = self.socket.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            connection, _ = self.socket.accept()
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(
+                target=self._serve, args=(connection,), daemon=True
+            ).start()
+
+    def _serve(self, connection):
+        stream = connection.makefile("rb")
+        while True:
+            header = stream.read(7)
+            if len(header) < 7:
+                return
+            transaction_id, _, length, unit = struct.unpack(">HHHB", header)
+            body = modbus_response(self.registers, stream.read(length - 1))
+            connection.sendall(
+                struct.pack(">HHHB", transaction_id, 0, len(body) + 1, unit) + body
+            )
+
+
+class RtuStandInServer:
+    """Minimal Modbus RTU slave on a pseudo terminal"""
+
+    def __init__(self):
+        from AutomationOne.Interfaces.modbus_native import crc16
+
+        self.crc16 = crc16
+        self.registers = list(range(65536))
+        self.master, slave = os.openpty()
+        self.port = os.ttyname(slave)
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _read(self, n):
+        data = b""
+        while len(data) < n:
+            data += os.read(self.master, n - len(data))
+        return data
+
+    def _serve(self):
+        while True:
+            frame = self._read(2)
+            if frame[1] in (3, 4, 6):
+                frame += self._read(6)
+            else:
+                frame += self._read(5)
+                frame += self._read(frame[6] + 2)
+            body = bytes([frame[0]]) + modbus_response(self.registers, frame[1:-2])
+            crc = self.crc16(body)
+            os.write(self.master, body + bytes([crc & 0xFF, crc >> 8]))
+
+
+def benchmark_modbus(args):
+    from AutomationOne.Interfaces.modbus_native import NativeRtuClient, NativeTcpClient
+
+    clients = []
+    if args.method == "tcp":
+        server = TcpStandInServer()
+        clients.append(("native", NativeTcpClient("127.0.0.1", server.port), "unit"))
+    else:
+        server = RtuStandInServer()
+        clients.append(
+            ("native", NativeRtuClient(server.port, args.baudrate, parity="N"), "unit")
+        )
+
+    try:
+        from pymodbus import __version__ as PYMODBUS_VERSION
+
+        try:
+            from pymodbus.client import ModbusSerialClient, ModbusTcpClient
+        except ImportError:
+            from pymodbus.client.sync import ModbusSerialClient, ModbusTcpClient
+        if tuple(map(int, PYMODBUS_VERSION.split("."))) < (3, 3, 0):
+            unit_kwarg = "unit"
+        else:
+            unit_kwarg = "slave"
+        if args.method == "tcp":
+            client = ModbusTcpClient(host="127.0.0.1", port=server.port)
+        else:
+            client = ModbusSerialClient(
+                method="rtu", port=server.port, baudrate=args.baudrate, parity="N"
+            )
+        clients.append((f"pymodbus {PYMODBUS_VERSION}", client, unit_kwarg))
+    except ImportError:
+        logger.warning(
+            "pymodbus is not installed. Only benchmarking the native engine."
+        )
+
+    logger.info(
+        f"Modbus {args.method}: {args.requests} x FC3 reads of {args.count} registers"
+    )
+    for name, client, unit_kwarg in clients:
+        client.connect()
+        unit_args = {unit_kwarg: 1}
+        expected = list(range(args.count))
+        for _ in range(10):
+            client.read_holding_registers(0, count=args.count, **unit_args)
+        start = time.perf_counter()
+        for _ in range(args.requests):
+            result = client.read_holding_registers(0, count=args.count, **unit_args)
+        seconds = time.perf_counter() - start
+        if result.registers != expected:
+            logger.error(f"{name} returned unexpected registers {result.registers}")
+        report(f"read_holding_registers [{name}]", args.requests, seconds)
+        client.close()
+
+
+# ******** MQTT parsers ********
+
+
+class StandInNode:
+    def __init__(self):
+        self.value = None
+
+    def setValue(self, value):
+        self.value = value
+
+
+class StandInInterface:
+    def __init__(self, subs):
+        self.name = "benchmark"
+        self.subs = subs
+
+    def setValue(self, id, value, dryrun=False):
+        """Same behaviour as MqttInterface.setValue"""
+        if id not in self.subs:
+            logging.getLogger("AutomationOne").warning(
+                "ID {} not known to Interface {}.".format(id, self.name)
+            )
+            return False
+        self.subs.get(id).setValue(value)
+        return True
+
+
+class StandInMessage:
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+def legacyUltralight2(interface, userdata, message):
+    """The ultralight2 parser, which MqttInterface used before the built-in parsers"""
+    payload = message.payload
+    array = payload.decode("UTF-8").split("|")
+    keys = array[::2]
+    values = array[1::2]
+    if len(values) != len(keys):
+        logging.getLogger("AutomationOne").warning(
+            "Syntax error in ultralight2 payload {} (odd number of sections)".format(
+                payload
+            )
+        )
+    for i in range(len(values)):
+        interface.setValue(keys[i], values[i])
+
+
+def benchmark_parser(args):
+    import json
+
+    from AutomationOne.Interfaces.mqtt_parsers import parsers
+
+    keys = [f"sensor{i}" for i in range(args.keys)]
+    subscribed = keys[: max(1, args.keys * args.subscribed // 100)]
+    interface = StandInInterface({key: StandInNode() for key in subscribed})
+    values = {key: round(i * 1.5, 2) for i, key in enumerate(keys)}
+
+    payloads = {
+        "ultralight2": "|".join(f"{key}|{value}" for key, value in values.items()),
+        "json": json.dumps(values),
+        "json_paths": json.dumps({"data": {"sensors": values}}),
+        "influx": "\n".join(f"{key} value={value} 0" for key, value in values.items()),
+    }
+    config = {
+        "parser_paths": {key: f"data.sensors.{key}" for key in subscribed},
+    }
+
+    def legacyJson(interface, userdata, message):
+        for key, value in json.loads(message.payload.decode("UTF-8")).items():
+            interface.setValue(key, value)
+
+    # the legacy parsers log every unknown key, count the cost without any output
+    suiteLogger = logging.getLogger("AutomationOne")
+    suiteLogger.addHandler(logging.NullHandler())
+    suiteLogger.propagate = False
+    logger.info(
+        f"MQTT parsers: {args.messages} messages with {args.keys} keys, {len(subscribed)} subscribed"
+    )
+    candidates = [
+        ("ultralight2 [legacy function]", legacyUltralight2, payloads["ultralight2"]),
+        ("json [callback]", legacyJson, payloads["json"]),
+    ] + [
+        (f"{name} [built-in]", parsers[name](interface, config), payload)
+        for name, payload in payloads.items()
+    ]
+    for name, parser, payload in candidates:
+        message = StandInMessage("benchmark", payload.encode("UTF-8"))
+        parser(interface, None, message)
+        start = time.perf_counter()
+        for _ in range(args.messages):
+            parser(interface, None, message)
+        report(name, args.messages, time.perf_counter() - start, "message")
+
+
+# ******** MQTT encoders ********
+
+
+def benchmark_encoder(args):
+    import json
+
+    from AutomationOne.Interfaces.mqtt_batch import jsonRecord, lineRecord
+    from AutomationOne.Interfaces.mqtt_codec import (
+        PackedDecoder,
+        PackedEncoder,
+        cborDumps,
+        cborLoads,
+        mapRecord,
+        msgpackDumps,
+        msgpackLoads,
+    )
+
+    now = time.time()
+    records = [
+        (
+            f"sensor{i % args.ids}",
+            i if i % 3 == 0 else round(20 + (i % 100) * 0.37, 2),
+            now + i * 0.01,
+        )
+        for i in range(args.values)
+    ]
+    batches = [records[i : i + args.batch] for i in range(0, len(records), args.batch)]
+
+    def lines(batch):
+        return "\n".join(lineRecord(None, *record) for record in batch).encode()
+
+    def jsonArray(batch):
+        return json.dumps([jsonRecord(None, *record) for record in batch]).encode()
+
+    def maps(dumps):
+        return lambda batch: dumps([mapRecord(None, *record) for record in batch])
+
+    packed = PackedEncoder()
+    candidates = [
+        ("text (simpleEncoder)", lines, 1),
+        ("text lines", lines, args.batch),
+        ("json", jsonArray, args.batch),
+        ("cbor", maps(cborDumps), 1),
+        ("cbor", maps(cborDumps), args.batch),
+        ("msgpack", maps(msgpackDumps), 1),
+        ("msgpack", maps(msgpackDumps), args.batch),
+        ("packed", packed.encode, 1),
+        ("packed", packed.encode, args.batch),
+    ]
+
+    logger.info(
+        f"MQTT encoders: {args.values} values of {args.ids} nodes, batches of {args.batch}"
+    )
+    logger.info("{:<40} {:>10} {:>14}".format("", "µs/value", "bytes/value"))
+    for name, encode, size in candidates:
+        chunks = batches if size > 1 else [[record] for record in records]
+        start = time.perf_counter()
+        payloads = [encode(chunk) for chunk in chunks]
+        seconds = time.perf_counter() - start
+        total = sum(len(payload) for payload in payloads)
+        logger.info(
+            "{:<40} {:>10.2f} {:>14.1f}".format(
+                f"{name} [{'batch' if size > 1 else 'single'}]",
+                seconds / len(records) * 1e6,
+                total / len(records),
+            )
+        )
+
+    # round trip checks of the binary decoders
+    batch = batches[0]
+    expected = [list(mapRecord(None, *record).values()) for record in batch]
+    for loads, dumps in ((cborLoads, cborDumps), (msgpackLoads, msgpackDumps)):
+        decoded = loads(maps(dumps)(batch))
+        if [list(record.values()) for record in decoded] != expected:
+            logger.error(f"{loads.__name__} does not return the encoded records")
+    decoded = PackedDecoder().decode(PackedEncoder().encode(batch))
+    if [(id, value) for id, value, _ in decoded] != [
+        (id, value) for id, value, _ in batch
+    ] or any(abs(a[2] - b[2]) > 0.001 for a, b in zip(decoded, batch)):
+        logger.error("PackedDecoder does not return the encoded records")
+
+
+# ******** Expression connections ********
+
+
+class StandInHandler:
+    def __init__(self, nodes):
+        self.nodes = nodes
+        self.callbackModule = None
+
+
+def benchmark_expression(args):
+    from AutomationOne.Connections.custom_connection import CustomConnection
+    from AutomationOne.Connections.expression_connection import ExpressionConnection
+    from AutomationOne.Nodes.node import Node
+
+    class Callbacks:
+        @staticmethod
+        def scale(value):
+            return value[0] * 0.1 + value[1]
+
+        @staticmethod
+        def lsb(value):
+            return value & 0xFF
+
+        @staticmethod
+        def clamp(value):
+            return value[0] if value[0] < value[1] else value[1]
+
+    cases = [
+        ("a * 0.1 + b", "scale", ["a", "b"]),
+        ("a & 0xFF", "lsb", ["a"]),
+        ("a if a < b else b", "clamp", ["a", "b"]),
+    ]
+    logger.info(f"Expression connections: {args.executions} executions")
+    for expression, callback, inputs in cases:
+        nodes = {"a": Node(None, {"name": "a", "default": 1234}), "out": None}
+        nodes["b"] = Node(None, {"name": "b", "default": 5.5})
+        nodes["out"] = StandInNode()
+        handler = StandInHandler(nodes)
+        handler.callbackModule = Callbacks
+        inNode = inputs if len(inputs) > 1 else inputs[0]
+        candidates = [
+            (
+                f"{expression} [custom]",
+                CustomConnection(
+                    handler,
+                    {
+                        "name": callback,
+                        "callback": callback,
+                        "in": inNode,
+                        "out": "out",
+                    },
+                ),
+            ),
+            (
+                f"{expression} [expression]",
+                ExpressionConnection(
+                    handler,
+                    {
+                        "name": callback,
+                        "expression": expression,
+                        "in": inNode,
+                        "out": "out",
+                    },
+                ),
+            ),
+        ]
+        results = []
+        for name, connection in candidates:
+            start = time.perf_counter()
+            for _ in range(args.executions):
+                connection._execute()
+            report(name, args.executions, time.perf_counter() - start, "execution")
+            results.append(nodes["out"].value)
+        if results[0] != results[1]:
+            logger.error(f"{expression} returns {results[1]} instead of {results[0]}")
+
+
+def main():
+    parser = argparse.ArgumentParser("Benchmarks for the AutomationOne suite.")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    modbus = subparsers.add_parser(
+        "modbus", help="Native Modbus engine against pymodbus using a stand-in server"
+    )
+    modbus.add_argument("--method", "-M", default="tcp", help="tcp or rtu (pty)")
+    modbus.add_argument("--requests", "-n", type=int, default=2000)
+    modbus.add_argument("--count", "-c", type=int, default=16)
+    modbus.add_argument("--baudrate", "-b", type=int, default=115200)
+    modbus.set_defaults(func=benchmark_modbus)
+
+    mqttParser = subparsers.add_parser(
+        "parser", help="Built-in MQTT payload parsers against the legacy parsers"
+    )
+    mqttParser.add_argument("--messages", "-n", type=int, default=20000)
+    mqttParser.add_argument("--keys", "-k", type=int, default=10)
+    mqttParser.add_argument(
+        "--subscribed", "-s", type=int, default=50, help="Subscribed keys in percent"
+    )
+    mqttParser.set_defaults(func=benchmark_parser)
+
+    encoder = subparsers.add_parser(
+        "encoder", help="Binary MQTT payload encoders against the text encoder"
+    )
+    encoder.add_argument("--values", "-n", type=int, default=10000)
+    encoder.add_argument("--ids", "-i", type=int, default=20)
+    encoder.add_argument("--batch", "-b", type=int, default=100)
+    encoder.set_defaults(func=benchmark_encoder)
+
+    expression = subparsers.add_parser(
+        "expression", help="Expression connections against custom connections"
+    )
+    expression.add_argument("--executions", "-n", type=int, default=200000)
+    expression.set_defaults(func=benchmark_expression)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
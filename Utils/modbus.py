@@ -3,6 +3,9 @@
 
 import argparse
 import logging
+import sys
+
+from pathlib import Path
 
 import yaml
 
@@ -12,10 +15,19 @@ except:
     from pymodbus.client.sync import ModbusSerialClient, ModbusTcpClient
 
 from pymodbus.exceptions import ModbusIOException
-from pymodbus.payload import BinaryPayloadBuilder, BinaryPayloadDecoder
 from pymodbus.pdu import ExceptionResponse
 from pymodbus import __version__ as PYMODBUS_VERSION
 
+# the codec of the AutomationOne package is used, if this file is run from the
+# repository. Installed standalone as /usr/bin/modbus, pymodbus decodes the payloads.
+if (Path(__file__).resolve().parent.parent / "AutomationOne").is_dir():
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+try:
+    from AutomationOne.modbus_codec import ModbusCodec
+except ImportError:
+    ModbusCodec = None
+    from pymodbus.payload import BinaryPayloadBuilder, BinaryPayloadDecoder
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
@@ -25,6 +37,51 @@ logger.addHandler(streamHandler)
 
 modbus_exception_list = (ModbusIOException, ExceptionResponse)
 
+payload_types = {
+    "int16": "16bit_int",
+    "int32": "32bit_int",
+    "int64": "64bit_int",
+    "uint16": "16bit_uint",
+    "uint32": "32bit_uint",
+    "uint64": "64bit_uint",
+    "float16": "16bit_float",
+    "float32": "32bit_float",
+    "float64": "64bit_float",
+}
+
+
+def encode(args):
+    """Returns the registers of the values to write"""
+    if ModbusCodec is not None:
+        codec = ModbusCodec(
+            args.dataType, args.byteorder, args.wordorder, length=len(args.values)
+        )
+        return codec.encode(args.values)
+    if args.dataType not in payload_types:
+        raise NotImplementedError(f"Datatype {args.dataType} is not supported.")
+    builder = BinaryPayloadBuilder(byteorder=args.byteorder, wordorder=args.wordorder)
+    add = getattr(builder, "add_" + payload_types[args.dataType])
+    convert = float if args.dataType.startswith("float") else int
+    for value in args.values:
+        add(convert(value))
+    return builder.to_registers()
+
+
+def decode(args, registers):
+    """Returns the values of the read registers"""
+    if ModbusCodec is not None:
+        codec = ModbusCodec(
+            args.dataType, args.byteorder, args.wordorder, length=args.word_count
+        )
+        return list(codec.decode(registers))
+    if args.dataType not in payload_types:
+        raise NotImplementedError(f"Datatype {args.dataType} is not supported.")
+    decoder = BinaryPayloadDecoder.fromRegisters(
+        registers, byteorder=args.byteorder, wordorder=args.wordorder
+    )
+    method = getattr(decoder, "decode_" + payload_types[args.dataType])
+    return [method() for _ in range(args.word_count)]
+
 
 def main():
     parser = argparse.ArgumentParser("Send Modbus Requests.")
@@ -288,33 +345,11 @@ def run(args):
         return False
 
     if args.functionCode in [6, 15, 16]:
-        builder = BinaryPayloadBuilder(
-            byteorder=args.byteorder, wordorder=args.wordorder
-        )
-        for value in args.values:
-            if args.dataType == "int16":
-                builder.add_16bit_int(int(value))
-            elif args.dataType == "int32":
-                builder.add_32bit_int(int(value))
-            elif args.dataType == "int64":
-                builder.add_64bit_int(int(value))
-
-            elif args.dataType == "uint16":
-                builder.add_16bit_uint(int(value))
-            elif args.dataType == "uint32":
-                builder.add_32bit_uint(int(value))
-            elif args.dataType == "uint64":
-                builder.add_64bit_uint(int(value))
-
-            elif args.dataType == "float32":
-                builder.add_32bit_float(float(value))
-            elif args.dataType == "float16":
-                builder.add_16bit_float(float(value))
-            elif args.dataType == "float64":
-                builder.add_64bit_float(float(value))
-            else:
-                logger.error("Datatype is not supported.")
-                return False
+        try:
+            registers = encode(args)
+        except NotImplementedError:
+            logger.error("Datatype is not supported.")
+            return False
 
     if tuple(map(int, PYMODBUS_VERSION.split("."))) < (3, 3, 0):
         unit_args = {"unit": args.unit}
@@ -354,17 +389,14 @@ def run(args):
                 "FunctionCode 6 only supports writing to one (16 bit) register!"
             )
             return False
-        if not client.write_register(
-            args.address, builder.to_registers()[0], **unit_args
-        ):
+        if not client.write_register(args.address, registers[0], **unit_args):
             logger.error("Write Registers failed!")
     elif args.functionCode == 16:
-        if not client.write_registers(
-            args.address, builder.to_registers(), **unit_args
-        ):
+        if not client.write_registers(args.address, registers, **unit_args):
             logger.error("Write Registers failed!")
     elif args.functionCode == 15:
-        if not client.write_coils(args.address, builder.to_coils(), **unit_args):
+        coils = [bool(int(bit)) for reg in registers for bit in format(reg, "016b")]
+        if not client.write_coils(args.address, coils, **unit_args):
             logger.error("Write Coils failed!")
 
     else:
@@ -372,35 +404,11 @@ def run(args):
         return False
 
     if args.functionCode in [3, 4]:
-        decoder = BinaryPayloadDecoder.fromRegisters(
-            result.registers, byteorder=args.byteorder, wordorder=args.wordorder
-        )
-        values = []
-        for _ in range(args.word_count):
-            if args.dataType == "int16":
-                value = decoder.decode_16bit_int()
-            elif args.dataType == "int32":
-                value = decoder.decode_32bit_int()
-            elif args.dataType == "int64":
-                value = decoder.decode_64bit_int()
-
-            elif args.dataType == "uint16":
-                value = decoder.decode_16bit_uint()
-            elif args.dataType == "uint32":
-                value = decoder.decode_32bit_uint()
-            elif args.dataType == "uint64":
-                value = decoder.decode_64bit_uint()
-
-            elif args.dataType == "float32":
-                value = decoder.decode_32bit_float()
-            elif args.dataType == "float16":
-                value = decoder.decode_16bit_float()
-            elif args.dataType == "float64":
-                value = decoder.decode_64bit_float()
-            else:
-                logger.warning("Datatype is not supported.")
-                return False
-            values.append(value)
+        try:
+            values = decode(args, result.registers)
+        except NotImplementedError:
+            logger.warning("Datatype is not supported.")
+            return False
         if args.word_count == 1:
             logger.info("Parsed Value: {}".format(values[0]))
         else:
@@ -0,0 +1,77 @@
+import yaml
+
+from AutomationOne.handler import Handler
+from AutomationOne.Nodes.node_view import NodeView
+
+
+def load(path, connections, nodes, fuse=True):
+    config = {"nodes": [{"name": name} for name in nodes], "connections": connections}
+    if fuse is not None:
+        config["fuseConnections"] = fuse
+    with open(path, "w") as file:
+        yaml.safe_dump(config, file)
+    handler = Handler()
+    handler.parseConfig(str(path))
+    return handler
+
+
+def simple(name, inNode, outNode, factor):
+    return {
+        "name": name,
+        "type": "simple",
+        "inNode": inNode,
+        "outNode": outNode,
+        "factor": factor,
+    }
+
+
+def test_linear_chain_is_fused(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    handler = load(
+        tmp_path / "config.yaml",
+        [simple("ab", "a", "b", 10), simple("bc", "b", "c", 10)],
+        ["a", "b", "c"],
+    )
+    assert list(handler.connections) == ["ab"]
+    assert isinstance(handler.nodes["b"], NodeView)
+    handler.nodes["a"].setValue(1)
+    assert handler.nodes["b"].getValue() == 10
+    assert handler.nodes["c"].getValue() == 100
+
+
+def test_fusion_is_off_by_default(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    handler = load(
+        tmp_path / "config.yaml",
+        [simple("ab", "a", "b", 10), simple("bc", "b", "c", 10)],
+        ["a", "b", "c"],
+        fuse=None,
+    )
+    assert set(handler.connections) == {"ab", "bc"}
+    assert not isinstance(handler.nodes["b"], NodeView)
+
+
+def test_node_with_polled_expression_consumer_is_not_fused(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    handler = load(
+        tmp_path / "config.yaml",
+        [
+            simple("ab", "a", "b", 10),
+            simple("bc", "b", "c", 10),
+            {
+                "name": "bd",
+                "type": "expression",
+                "inNode": "b",
+                "outNode": "d",
+                "expression": "b * 10",
+                "frequency": 1,
+            },
+        ],
+        ["a", "b", "c", "d"],
+    )
+    assert set(handler.connections) == {"ab", "bc", "bd"}
+    assert not isinstance(handler.nodes["b"], NodeView)
+    handler.nodes["a"].setValue(1)
+    handler.connections["bd"].execute()
+    assert handler.nodes["c"].getValue() == 100
+    assert handler.nodes["d"].getValue() == 100
@@ -0,0 +1,58 @@
+import pytest
+
+from AutomationOne.Interfaces.mbus_decoder import MBusDecodeError, decodeFrame
+
+# long header: id 12345678, manufacturer, version, medium water, access number, status, signature
+HEADER = bytes.fromhex("78563412" "2d2c" "01" "07" "05" "00" "0000")
+VOLUME = bytes.fromhex("04" "13" "39300000")  # 12345 l
+UNSUPPORTED = bytes.fromhex("02" "fb" "1a" "3412")  # VIF extension table 0xfb
+UNKNOWN_FD = bytes.fromhex("01" "fd" "7f" "05")  # reserved VIFE of VIF 0xfd
+PLAIN_TEXT = bytes.fromhex("01" "7c" "03" "6d6c70" "2a")  # unit "plm"
+FLOW = bytes.fromhex("02" "3b" "e803")  # 1000 l/h
+
+
+def test_strict_decoding_rejects_unsupported_records():
+    with pytest.raises(MBusDecodeError):
+        decodeFrame(0x72, HEADER + VOLUME + UNSUPPORTED + FLOW)
+
+
+def test_unsupported_records_are_marked():
+    data = decodeFrame(
+        0x72,
+        HEADER + VOLUME + UNSUPPORTED + UNKNOWN_FD + PLAIN_TEXT + FLOW,
+        strict=False,
+    )
+    records = data["DataRecord"]
+    assert [record["Value"] for record in records] == [
+        "12345",
+        "3412",
+        "05",
+        "42",
+        "1000",
+    ]
+    assert records[1]["Unit"] == "Unsupported VIF 0xfb"
+    assert records[2]["Unit"] == "Unsupported VIF 0xfd 0x7f"
+    assert records[3]["Unit"] == "plm"
+
+
+def test_records_before_a_malformed_record_are_kept():
+    data = decodeFrame(0x72, HEADER + VOLUME + FLOW[:-1], strict=False)
+    assert data["DataRecord"]["Value"] == "12345"
+
+
+def test_manufacturer_specific_data_is_a_record():
+    frame = HEADER + VOLUME + bytes.fromhex("0f" "0102ab")
+    with pytest.raises(MBusDecodeError):
+        decodeFrame(0x72, frame)
+    records = decodeFrame(0x72, frame, strict=False)["DataRecord"]
+    assert len(records) == 2
+    assert records[1]["Function"] == "Manufacturer specific"
+    assert records[1]["Value"] == "01 02 AB"
+
+
+def test_tariff_and_device_are_reported_with_a_dife():
+    # storage number 2, tariff 0, device 0 in the DIFE
+    record = decodeFrame(0x72, HEADER + bytes.fromhex("84" "01" "13" "39300000"))
+    assert record["DataRecord"]["Tariff"] == "0"
+    assert record["DataRecord"]["Device"] == "0"
+    assert record["DataRecord"]["StorageNumber"] == "2"
@@ -0,0 +1,34 @@
+from AutomationOne.Interfaces.mqtt_store import OutboundStore
+
+
+def drain(store):
+    messages = []
+    while store.backlog():
+        records = store.read(10)
+        if not records:
+            break
+        messages += [(topic, payload) for topic, payload, _ in records]
+        store.ack(records[-1][2], len(records))
+    return messages
+
+
+def test_torn_record_is_truncated_on_open(tmp_path):
+    store = OutboundStore(str(tmp_path), syncRecords=1)
+    store.append("t", "a")
+    store.append("t", "b")
+    store.close()
+
+    # a crash during the write leaves a partial record at the end of the segment
+    segment = store._path(store.segments[-1])
+    with open(segment, "ab") as file:
+        file.write(b"\x00\x01\x02\x03\x00")
+
+    store = OutboundStore(str(tmp_path), syncRecords=1)
+    store.append("t", "c")
+    assert drain(store) == [("t", b"a"), ("t", b"b"), ("t", b"c")]
+    assert not store.backlog()
+    store.close()
+
+    store = OutboundStore(str(tmp_path), syncRecords=1)
+    assert not store.backlog()
+    store.close()